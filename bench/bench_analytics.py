@@ -0,0 +1,63 @@
+"""
+kb - bench/bench_analytics.py
+author: narlock
+
+Measures how long the flow analytics take over a large, synthetic
+status transition log.
+
+Usage: python3 bench/bench_analytics.py [event count]
+"""
+
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "kb"))
+
+import analytics
+import flow
+
+def generate_events(count: int, now: float):
+    """
+    Generates `count` events for tasks that move backlog -> todo ->
+    doing -> done over the last 90 days.
+    """
+    np = analytics.np
+    rng = np.random.default_rng(0)
+    path = ["", "backlog", "todo", "doing", "done"]
+    steps = len(path) - 1
+    tasks = count // steps
+
+    task_ids = np.repeat(np.arange(tasks, dtype=np.int32), steps)
+    from_codes = np.tile(np.array([flow.status_code(s) for s in path[:-1]], dtype=np.int8), tasks)
+    to_codes = np.tile(np.array([flow.status_code(s) for s in path[1:]], dtype=np.int8), tasks)
+
+    created = now - rng.uniform(0, 90 * analytics.SECONDS_PER_DAY, tasks)
+    gaps = rng.exponential(2 * analytics.SECONDS_PER_DAY, (tasks, steps))
+    gaps[:, 0] = 0
+    times = (created[:, None] + np.cumsum(gaps, axis=1)).ravel()
+
+    # The log on disk is appended in time order
+    order = np.argsort(times, kind="stable")
+    return {"task": task_ids[order], "from": from_codes[order], "to": to_codes[order], "time": times[order]}
+
+def main():
+    if analytics.np is None:
+        print(analytics.NUMPY_REQUIRED)
+        sys.exit(1)
+
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    now = time.time()
+    events = generate_events(count, now)
+
+    runs = []
+    for _ in range(5):
+        start = time.perf_counter()
+        analytics.compute_flow(events, days=90, now=now)
+        runs.append(time.perf_counter() - start)
+
+    print(f"compute_flow over {len(events['time']):,} events: "
+          f"best {min(runs) * 1000:.1f} ms, worst {max(runs) * 1000:.1f} ms")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,99 @@
+"""
+kb - bench/bench_codecs.py
+author: narlock
+
+Measures the size, save time, and load time of settings.json for
+every codec over a large, synthetic board, and checks that each
+codec round-trips the settings exactly. Like most real boards, most
+tasks leave most fields at their defaults.
+
+Usage: python3 bench/bench_codecs.py [task count]
+"""
+
+import os
+import random
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "kb"))
+
+import codec
+import schema
+import settings
+import sparse
+
+def generate_settings(task_count: int, projects: int = 10):
+    """
+    Generates settings with `task_count` tasks spread over `projects` boards.
+    """
+    rng = random.Random(0)
+    user_settings = {"recentProjectTitle": "board 0", "nextProjectId": projects, "undoDepth": 100, "projects": []}
+    per_project = task_count // projects
+    for project_id in range(projects):
+        tasks = []
+        for task_id in range(per_project):
+            tasks.append({
+                **settings.DEFAULT_TASK,
+                "id": task_id,
+                "title": f"Task {task_id} of board {project_id}",
+                "type": rng.choice(settings.TASK_TYPE_OPTIONS),
+                "description": "Lorem ipsum dolor sit amet, " * rng.randint(1, 6) if rng.random() < 0.3 else "",
+                "priority": rng.choice(settings.TASK_PRIORITY_TYPE_OPTIONS),
+                "status": rng.choice(settings.TASK_STATUS_TYPE_OPTIONS),
+                "effort": rng.randint(1, 13) if rng.random() < 0.5 else 0,
+                "tags": [f"tag{rng.randint(0, 20)}" for _ in range(rng.randint(0, 3))],
+                "fixVersion": f"v1.{rng.randint(0, 5)}.0" if rng.random() < 0.3 else "",
+                "checklistItems": [{"name": f"Item {i}", "completed": rng.random() < 0.5} for i in range(rng.randint(0, 4))],
+            })
+        user_settings["projects"].append({
+            "id": project_id, "title": f"board {project_id}", "nextTaskId": per_project,
+            "schemaVersion": schema.SCHEMA_VERSION, "tasks": tasks,
+        })
+    return user_settings
+
+def expanded(user_settings):
+    """
+    Returns the settings with every task's default fields filled in,
+    as they read after loading.
+    """
+    return {
+        **user_settings,
+        "projects": [{**project, "tasks": [sparse.expand(task) for task in project["tasks"]]} for project in user_settings["projects"]],
+    }
+
+def best_of(runs: int, function):
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        result = function()
+        timings.append(time.perf_counter() - start)
+    return min(timings), result
+
+def main():
+    task_count = int(sys.argv[1]) if len(sys.argv) > 1 else 50_000
+    user_settings = generate_settings(task_count)
+
+    print(f"settings with {task_count:,} tasks")
+    print(f"{'codec':<12} {'size':>10} {'save':>10} {'load':>10}")
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "settings.json")
+        for name in codec.CODEC_NAMES:
+            def save():
+                with open(path, 'wb') as f:
+                    f.write(codec.encode(user_settings, name))
+
+            def load():
+                with open(path, 'rb') as f:
+                    return codec.decode(f.read())
+
+            save_time, _ = best_of(3, save)
+            load_time, loaded = best_of(3, load)
+            if expanded(loaded) != user_settings:
+                print(f"{name}: settings did not round-trip")
+                sys.exit(1)
+            print(f"{name:<12} {os.path.getsize(path) / 1e6:>8.1f} MB {save_time * 1000:>7.0f} ms {load_time * 1000:>7.0f} ms")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,97 @@
+"""
+kb - bench/bench_server.py
+author: narlock
+
+Measures request throughput of the kb daemon with several concurrent
+clients. The daemon runs in its own process against a generated board
+in a temporary home directory.
+
+Usage: python3 bench/bench_server.py [clients] [requests per client] [tasks]
+"""
+
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+KB_DIR = Path(__file__).resolve().parent.parent / "kb"
+sys.path.insert(0, str(KB_DIR))
+
+import client
+
+def write_board(home: Path, task_count: int):
+    """
+    Writes a settings.json with one project holding `task_count` tasks.
+    """
+    statuses = ["backlog", "todo", "doing", "done"]
+    tasks = [
+        {"id": i, "title": f"Task {i}", "type": "story", "description": "", "acceptanceCriteria": "",
+         "priority": "medium", "status": statuses[i % 4], "effort": 1, "startDate": "",
+         "completeDate": None, "tags": [], "fixVersion": "", "linkedTasks": [], "checklistItems": []}
+        for i in range(task_count)
+    ]
+    settings_dir = home / "Documents" / "narlock" / "kb"
+    settings_dir.mkdir(parents=True)
+    with open(settings_dir / "settings.json", 'w', encoding='utf-8') as f:
+        json.dump({"recentProjectTitle": "bench", "nextProjectId": 1, "projects": [
+            {"id": 0, "title": "bench", "nextTaskId": task_count, "tasks": tasks}
+        ]}, f)
+    return settings_dir / "kb.sock"
+
+def run_client(socket_path, requests: int, write_every: int, task_count: int, latencies):
+    c = client.Client(socket_path)
+    for i in range(requests):
+        start = time.perf_counter()
+        if write_every and i % write_every == 0:
+            c.call("move", {"project": "bench", "id": i % task_count, "column": "doing"})
+        elif i % 2:
+            c.call("get", {"project": "bench", "id": i % task_count})
+        else:
+            c.call("list", {"project": "bench", "status": "doing"})
+        latencies.append(time.perf_counter() - start)
+    c.close()
+
+def main():
+    clients = int(sys.argv[1]) if len(sys.argv) > 1 else 8
+    requests = int(sys.argv[2]) if len(sys.argv) > 2 else 500
+    task_count = int(sys.argv[3]) if len(sys.argv) > 3 else 1000
+
+    with tempfile.TemporaryDirectory() as home:
+        socket_path = write_board(Path(home), task_count)
+        daemon = subprocess.Popen(
+            [sys.executable, str(KB_DIR / "main.py"), "serve"],
+            env={**os.environ, "HOME": home}, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+        )
+        try:
+            while not socket_path.exists():
+                time.sleep(0.05)
+
+            # Reads only, then a mix with one write every 20 requests
+            for label, write_every in (("reads", 0), ("mixed", 20)):
+                latencies = []
+                threads = [
+                    threading.Thread(target=run_client, args=(socket_path, requests, write_every, task_count, latencies))
+                    for _ in range(clients)
+                ]
+                start = time.perf_counter()
+                for thread in threads:
+                    thread.start()
+                for thread in threads:
+                    thread.join()
+                elapsed = time.perf_counter() - start
+
+                latencies.sort()
+                total = len(latencies)
+                print(f"{label}: {clients} clients x {requests} requests over {task_count} tasks: "
+                      f"{total / elapsed:,.0f} req/s, "
+                      f"p50 {latencies[total // 2] * 1000:.2f} ms, p99 {latencies[int(total * 0.99)] * 1000:.2f} ms")
+        finally:
+            daemon.terminate()
+            daemon.wait()
+
+if __name__ == '__main__':
+    main()
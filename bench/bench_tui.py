@@ -0,0 +1,232 @@
+"""
+kb - bench/bench_tui.py
+author: narlock
+
+Measures the whole interactive path by running kb under a
+pseudo-terminal against a generated board and replaying a
+keystroke script.
+
+For every keystroke it reports the time until the screen is quiet
+again (no output for --quiet-ms), the bytes kb wrote, and the number
+of processes spawned meanwhile (such as `clear`). Processes are
+counted from the last allocated pid in /proc/loadavg, so run it on
+an otherwise idle machine, such as a CI box. Linux only.
+
+Usage:
+    python3 bench/bench_tui.py [--tasks N] [--script steps.json] [--verbose]
+    python3 bench/bench_tui.py --record steps.json
+
+A script is a JSON list of [label, keys] steps. --record runs kb in
+this terminal and saves every keystroke you type as a step, so a
+session can be replayed later with --script.
+"""
+
+import argparse
+import fcntl
+import json
+import os
+import pty
+import select
+import signal
+import statistics
+import struct
+import sys
+import tempfile
+import termios
+import time
+from pathlib import Path
+
+KB_DIR = Path(__file__).resolve().parent.parent / "kb"
+sys.path.insert(0, str(KB_DIR))
+
+import codec
+import settings
+
+BOARD_TITLE = "bench"
+TERMINAL_SIZE = (40, 120)  # rows, columns
+KEY_ENTER = "\r"
+KEY_UP = "\x1b[A"
+KEY_DOWN = "\x1b[B"
+KEY_CTRL_C = "\x03"
+
+def type_text(label: str, text: str):
+    return [(label, char) for char in text]
+
+# Navigates the main menu, opens the recent board, moves a task,
+# browses the backlog, and quits
+DEFAULT_SCRIPT = [
+    ("menu", KEY_DOWN), ("menu", KEY_UP), ("open board", KEY_ENTER),
+    *type_text("type", "move 1"), ("move", KEY_ENTER),
+    *type_text("type", "backlog"), ("open backlog", KEY_ENTER),
+    ("backlog", KEY_DOWN), ("backlog", KEY_DOWN), ("backlog", KEY_UP),
+    ("close backlog", KEY_CTRL_C),
+    *type_text("type", "quit"), ("quit", KEY_ENTER),
+]
+
+def generate_board(home: Path, task_count: int):
+    """
+    Writes settings.json with one board of `task_count` tasks, a
+    quarter of them in each status, under the given home directory.
+    """
+    statuses = settings.TASK_STATUS_TYPE_OPTIONS
+    tasks = [
+        {**settings.DEFAULT_TASK, "id": task_id, "title": f"Task {task_id}",
+         "status": statuses[task_id % len(statuses)]}
+        for task_id in range(task_count)
+    ]
+    user_settings = {
+        "recentProjectTitle": BOARD_TITLE,
+        "nextProjectId": 1,
+        "undoDepth": 100,
+        "projects": [{"id": 0, "title": BOARD_TITLE, "nextTaskId": task_count, "tasks": tasks}],
+    }
+    settings_path = home / "Documents" / "narlock" / "kb" / "settings.json"
+    settings_path.parent.mkdir(parents=True, exist_ok=True)
+    settings_path.write_bytes(codec.encode(user_settings))
+
+def last_pid():
+    with open("/proc/loadavg") as f:
+        return int(f.read().split()[-1])
+
+def spawn_kb(home: Path):
+    """
+    Starts kb on a new pseudo-terminal, returning (pid, master fd).
+    """
+    pid, fd = pty.fork()
+    if pid == 0:
+        env = {**os.environ, "HOME": str(home), "TERM": os.environ.get("TERM", "xterm-256color")}
+        os.execve(sys.executable, [sys.executable, str(KB_DIR / "main.py")], env)
+
+    rows, cols = TERMINAL_SIZE
+    fcntl.ioctl(fd, termios.TIOCSWINSZ, struct.pack("HHHH", rows, cols, 0, 0))
+    os.kill(pid, signal.SIGWINCH)
+    return pid, fd
+
+def read_until_quiet(fd: int, quiet: float, timeout: float):
+    """
+    Waits up to `timeout` seconds for output, then reads until none
+    arrives for `quiet` seconds. Returns the number of bytes read and
+    the time the last byte arrived, if any.
+    """
+    received = 0
+    last_output = None
+    deadline = time.perf_counter() + timeout
+    while time.perf_counter() < deadline:
+        wait = quiet if last_output else deadline - time.perf_counter()
+        ready, _, _ = select.select([fd], [], [], max(wait, 0))
+        if not ready:
+            break
+        try:
+            chunk = os.read(fd, 65536)
+        except OSError:  # kb exited and the pty closed
+            break
+        if not chunk:
+            break
+        received += len(chunk)
+        last_output = time.perf_counter()
+    return received, last_output
+
+def replay(script, task_count: int, quiet: float, timeout: float):
+    """
+    Runs kb and replays the script, returning the startup measurement
+    and one (label, latency, bytes, processes) tuple per step.
+    """
+    with tempfile.TemporaryDirectory() as home:
+        generate_board(Path(home), task_count)
+        started = time.perf_counter()
+        pid, fd = spawn_kb(Path(home))
+        startup_bytes, last_output = read_until_quiet(fd, quiet, timeout)
+        startup = (last_output or started) - started
+
+        steps = []
+        try:
+            for label, keys in script:
+                pids_before = last_pid()
+                sent = time.perf_counter()
+                os.write(fd, keys.encode("utf-8"))
+                received, last_output = read_until_quiet(fd, quiet, timeout)
+                latency = (last_output - sent) if last_output else 0.0
+                steps.append((label, latency, received, last_pid() - pids_before))
+        finally:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+            os.waitpid(pid, 0)
+            os.close(fd)
+    return (startup, startup_bytes), steps
+
+def record(path: str):
+    """
+    Runs kb in this terminal against a generated board and saves
+    every keystroke typed as a script step.
+    """
+    keystrokes = []
+
+    def read_stdin(fd):
+        data = os.read(fd, 1024)
+        keystrokes.append(["recorded", data.decode("utf-8", errors="replace")])
+        return data
+
+    with tempfile.TemporaryDirectory() as home:
+        generate_board(Path(home), 200)
+        os.environ["HOME"] = home
+        pty.spawn([sys.executable, str(KB_DIR / "main.py")], stdin_read=read_stdin)
+
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(keystrokes, f, indent=4)
+    print(f"Recorded {len(keystrokes)} keystrokes to {path}")
+
+def percentile(values, fraction: float):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+def print_report(startup, steps, verbose: bool):
+    startup_time, startup_bytes = startup
+    print(f"startup: {startup_time * 1000:.1f} ms, {startup_bytes:,} bytes")
+
+    if verbose:
+        for index, (label, latency, received, processes) in enumerate(steps):
+            print(f"  {index:>3} {label:<14} {latency * 1000:>8.1f} ms {received:>8,} B {processes:>3} proc")
+
+    print(f"{'step':<14} {'keys':>5} {'median':>9} {'p95':>9} {'max':>9} {'bytes/key':>10} {'procs/key':>10}")
+    labels = list(dict.fromkeys(label for label, *_ in steps))
+    for label in labels + ["all"]:
+        rows = [step for step in steps if label in ("all", step[0])]
+        latencies = [latency for _, latency, _, _ in rows]
+        print(f"{label:<14} {len(rows):>5} "
+              f"{statistics.median(latencies) * 1000:>6.1f} ms "
+              f"{percentile(latencies, 0.95) * 1000:>6.1f} ms "
+              f"{max(latencies) * 1000:>6.1f} ms "
+              f"{statistics.mean(r[2] for r in rows):>10,.0f} "
+              f"{statistics.mean(r[3] for r in rows):>10.1f}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay keystrokes against kb under a pseudo-terminal.")
+    parser.add_argument("--tasks", type=int, default=1000, help="tasks on the generated board")
+    parser.add_argument("--script", help="JSON list of [label, keys] steps to replay")
+    parser.add_argument("--record", metavar="PATH", help="record a script interactively instead")
+    parser.add_argument("--quiet-ms", type=float, default=50, help="silence that marks the screen as settled")
+    parser.add_argument("--timeout", type=float, default=5, help="seconds to wait for a keystroke's first output")
+    parser.add_argument("--verbose", action="store_true", help="print every step")
+    args = parser.parse_args()
+
+    if not sys.platform.startswith("linux"):
+        print("bench_tui.py requires Linux (/proc and pseudo-terminals).")
+        sys.exit(1)
+
+    if args.record:
+        record(args.record)
+        return
+
+    script = DEFAULT_SCRIPT
+    if args.script:
+        with open(args.script, encoding="utf-8") as f:
+            script = [tuple(step) for step in json.load(f)]
+
+    startup, steps = replay(script, args.tasks, args.quiet_ms / 1000, args.timeout)
+    print(f"replayed {len(steps)} keystrokes against a board of {args.tasks:,} tasks")
+    print_report(startup, steps, args.verbose)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,212 @@
+"""
+kb - analytics.py
+author: narlock
+
+This file computes flow metrics from the status transition log
+written by flow.py: cycle time, lead time, throughput, WIP over
+time, and cumulative flow.
+
+All of the work is done with vectorized NumPy operations over the
+event columns, so it scales to millions of events. NumPy is an
+optional dependency, only needed for `kb stats`.
+"""
+
+import time
+import ansi
+import flow
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover - depends on the environment
+    np = None
+
+NUMPY_REQUIRED = "Flow analytics require NumPy. Install it with `pip3 install numpy`."
+SECONDS_PER_DAY = 86400
+DOING = flow.status_code("doing")
+DONE = flow.status_code("done")
+CFD_STATUSES = ["backlog", "todo", "doing", "done", "archived"]
+
+def load_events(project_id: int):
+    """
+    Loads the event columns of a project as NumPy arrays.
+
+    Columns are truncated to the shortest one, which drops a
+    partially written trailing event.
+    """
+    directory = flow.events_dir(project_id)
+    columns = {}
+    for column, (file_name, typecode) in flow.COLUMNS.items():
+        path = directory / file_name
+        dtype = np.dtype(typecode)
+        columns[column] = np.fromfile(path, dtype=dtype) if path.exists() else np.empty(0, dtype=dtype)
+
+    length = min(len(values) for values in columns.values())
+    return {column: values[:length] for column, values in columns.items()}
+
+def _first_and_last_per_task(task_ids, times, size: int):
+    """
+    Returns two arrays indexed by task id holding the earliest and
+    latest event time of each task (inf / -inf for tasks without events).
+    """
+    first = np.full(size, np.inf)
+    last = np.full(size, -np.inf)
+    np.minimum.at(first, task_ids, times)
+    np.maximum.at(last, task_ids, times)
+    return first, last
+
+def _durations(start_times, end_times):
+    """
+    Returns the non-negative durations in days between the start
+    and end time of each task that has both.
+    """
+    known = np.isfinite(start_times) & np.isfinite(end_times)
+    durations = (end_times[known] - start_times[known]) / SECONDS_PER_DAY
+    return durations[durations >= 0]
+
+def _summarize(durations):
+    if len(durations) == 0:
+        return {"count": 0, "mean": 0.0, "median": 0.0, "p85": 0.0}
+    return {
+        "count": int(len(durations)),
+        "mean": float(durations.mean()),
+        "median": float(np.median(durations)),
+        "p85": float(np.percentile(durations, 85)),
+    }
+
+def compute_flow(events, days: int = 30, now: float = None):
+    """
+    Computes flow metrics over the given event columns.
+
+    Returns a dict containing:
+        cycle_time  : summary of first "doing" to last "done", in days
+        lead_time   : summary of creation (or first event) to last "done", in days
+        throughput  : tasks reaching "done" on each of the last `days` days
+        wip         : tasks in "doing" at the end of each day
+        cfd         : tasks in each status at the end of each day
+        day_starts  : unix timestamp of the start of each day
+    """
+    if np is None:
+        raise RuntimeError(NUMPY_REQUIRED)
+
+    now = time.time() if now is None else now
+    task_ids = events["task"].astype(np.int64)
+    from_codes = events["from"]
+    to_codes = events["to"]
+    times = events["time"]
+
+    # Events are appended in time order, only sort when that is not the case
+    if len(times) > 1 and not np.all(times[1:] >= times[:-1]):
+        order = np.argsort(times, kind="stable")
+        task_ids, from_codes, to_codes, times = task_ids[order], from_codes[order], to_codes[order], times[order]
+
+    # Task ids are small sequential integers, so they can index arrays directly
+    valid = task_ids >= 0
+    size = int(task_ids[valid].max()) + 1 if valid.any() else 0
+
+    # Cycle time: first time a task started until the last time it finished
+    doing_mask = valid & (to_codes == DOING)
+    done_mask = valid & (to_codes == DONE)
+    start_times, _ = _first_and_last_per_task(task_ids[doing_mask], times[doing_mask], size)
+    _, done_times = _first_and_last_per_task(task_ids[done_mask], times[done_mask], size)
+    cycle_times = _durations(start_times, done_times)
+
+    # Lead time: creation until finished, falling back to the first known event
+    created_times, _ = _first_and_last_per_task(task_ids[valid], times[valid], size)
+    lead_times = _durations(created_times, done_times)
+
+    # Day buckets in local time, ending with today
+    utc_offset = time.localtime(now).tm_gmtoff
+    today = int((now + utc_offset) // SECONDS_PER_DAY)
+    first_day = today - days + 1
+    day_starts = (np.arange(first_day, today + 1) * SECONDS_PER_DAY - utc_offset).astype(np.float64)
+    day_ends = day_starts + SECONDS_PER_DAY
+
+    # Throughput: arrivals in "done" per day
+    done_days = ((times[done_mask] + utc_offset) // SECONDS_PER_DAY).astype(np.int64) - first_day
+    done_days = done_days[(done_days >= 0) & (done_days < days)]
+    throughput = np.bincount(done_days, minlength=days)
+
+    # Cumulative flow: running count of tasks in each status, sampled at day ends
+    sample = np.searchsorted(times, day_ends, side="right") - 1
+    cfd = {}
+    for status in CFD_STATUSES:
+        code = flow.status_code(status)
+        delta = (to_codes == code).astype(np.int64) - (from_codes == code).astype(np.int64)
+        running = np.cumsum(delta)
+        cfd[status] = np.where(sample >= 0, running[np.maximum(sample, 0)] if len(running) else 0, 0)
+
+    return {
+        "events": int(len(times)),
+        "cycle_time": _summarize(cycle_times),
+        "lead_time": _summarize(lead_times),
+        "throughput": throughput,
+        "wip": cfd["doing"],
+        "cfd": cfd,
+        "day_starts": day_starts,
+    }
+
+def project_flow(project_id: int, days: int = 30):
+    """
+    Loads a project's event log and computes its flow metrics.
+    """
+    if np is None:
+        raise RuntimeError(NUMPY_REQUIRED)
+    return compute_flow(load_events(project_id), days)
+
+SPARK_BLOCKS = " ▁▂▃▄▅▆▇█"
+CFD_COLORS = {
+    "backlog": ansi.GREY,
+    "todo": ansi.BRIGHT_BLUE,
+    "doing": ansi.ORANGE,
+    "done": ansi.GREEN,
+    "archived": ansi.BRIGHT_BLACK,
+}
+
+def sparkline(values):
+    """
+    Returns a one line bar chart of the values.
+    """
+    peak = max(values) if len(values) else 0
+    if peak <= 0:
+        return SPARK_BLOCKS[0] * len(values)
+    return "".join(SPARK_BLOCKS[int(round(v / peak * (len(SPARK_BLOCKS) - 1)))] for v in values)
+
+def format_report(project_title: str, metrics, width: int = 80):
+    """
+    Formats flow metrics as colored text: a summary followed by a
+    throughput sparkline and a cumulative flow chart, one row per day.
+    """
+    def duration(summary):
+        return (f"mean {summary['mean']:.1f}d, median {summary['median']:.1f}d, "
+                f"85th percentile {summary['p85']:.1f}d ({summary['count']} tasks)")
+
+    lines = [
+        f"{ansi.ORANGE}{ansi.BOLD}{project_title} Flow{ansi.RESET}",
+        f"{ansi.GREY}{metrics['events']} status transitions recorded{ansi.RESET}",
+        "",
+        f"{ansi.GREEN}Cycle time: {ansi.RESET}{duration(metrics['cycle_time'])}",
+        f"{ansi.GREEN}Lead time:  {ansi.RESET}{duration(metrics['lead_time'])}",
+        f"{ansi.GREEN}Current WIP: {ansi.RESET}{int(metrics['wip'][-1]) if len(metrics['wip']) else 0}",
+        f"{ansi.GREEN}Throughput: {ansi.RESET}{int(metrics['throughput'].sum())} done in {len(metrics['throughput'])} days "
+        f"{ansi.BRIGHT_GREEN}{sparkline(metrics['throughput'])}{ansi.RESET}",
+        "",
+        f"{ansi.ORANGE}Cumulative flow{ansi.RESET}  " + " ".join(
+            f"{CFD_COLORS[status]}█{ansi.RESET} {status}" for status in CFD_STATUSES
+        ),
+    ]
+
+    # Scale the stacked bars so the busiest day fills the available width
+    bar_width = max(10, width - 12)
+    totals = sum(metrics["cfd"][status] for status in CFD_STATUSES)
+    peak = max(1, int(totals.max()) if len(totals) else 1)
+    for day, day_start in enumerate(metrics["day_starts"]):
+        bar = ""
+        for status in CFD_STATUSES:
+            count = int(metrics["cfd"][status][day])
+            cells = int(round(count / peak * bar_width))
+            if cells:
+                bar += f"{CFD_COLORS[status]}{'█' * cells}{ansi.RESET}"
+        label = time.strftime("%m-%d", time.localtime(day_start))
+        lines.append(f"{ansi.GREY}{label}{ansi.RESET} {bar}")
+
+    return "\n".join(lines)
@@ -0,0 +1,258 @@
+"""
+kb - archive.py
+author: narlock
+
+This file controls the cold storage of archived tasks, kept at
+~/Documents/narlock/kb/archive/<project id>/
+
+Archived tasks are removed from settings.json and written to
+append-only, zlib compressed segments. Each segment holds one
+JSON record per line, either an archived task:
+
+    {"task": {...}}
+
+or a marker noting that a task was restored to the board:
+
+    {"restored": 4}
+
+Segments are never rewritten. They are only read when the archive
+view is opened, newest first, so the most recent page can be shown
+without decompressing the whole history.
+
+Segments are numbered in the order they are written, and a project
+lists the numbers of its segments in "archiveSegments", as ranges:
+
+    "archiveSegments": [[1, 4], [7, 7]]
+
+so a snapshot of settings.json (see snapshots.py) also says which
+segments go with its boards. Restoring one sets the other segments
+aside in replaced/, from where restoring a later snapshot brings them
+back (see rebase). Numbers are never reused, so they stay unambiguous.
+"""
+
+import blobs
+import json
+import mmap
+import os
+import zlib
+import settings
+
+SEGMENT_PREFIX = "segment-"
+SEGMENT_SUFFIX = ".z"
+REPLACED_DIR = "replaced"
+
+def archive_dir(project_id: int):
+    """
+    The archive directory for a project lives next to settings.json.
+    """
+    return settings.SETTINGS_PATH.parent / "archive" / str(project_id)
+
+def _segments_in(directory):
+    if not directory.exists():
+        return []
+    return sorted(
+        path for path in directory.iterdir()
+        if path.name.startswith(SEGMENT_PREFIX) and path.name.endswith(SEGMENT_SUFFIX)
+    )
+
+def list_segments(project_id: int):
+    """
+    Returns the segment paths for a project, oldest first.
+    """
+    return _segments_in(archive_dir(project_id))
+
+def replaced_segments(project_id: int):
+    """
+    Returns the paths of the segments a restore set aside, oldest first.
+    """
+    return _segments_in(archive_dir(project_id) / REPLACED_DIR)
+
+def segment_number(path):
+    return int(path.name[len(SEGMENT_PREFIX):-len(SEGMENT_SUFFIX)])
+
+def segment_numbers(project):
+    """
+    Returns the numbers of the segments that go with a project, or
+    None if it predates "archiveSegments" and any may.
+    """
+    if "archiveSegments" not in project:
+        return None
+    return {number for first, last in project["archiveSegments"] for number in range(first, last + 1)}
+
+def _note_segment(project, number: int):
+    ranges = project.get("archiveSegments")
+    if ranges is None:
+        # Older boards own every segment written before this one
+        ranges = project["archiveSegments"] = []
+        for path in list_segments(project["id"]):
+            if segment_number(path) != number:
+                _note_number(ranges, segment_number(path))
+    _note_number(ranges, number)
+
+def _note_number(ranges, number: int):
+    if ranges and ranges[-1][1] == number - 1:
+        ranges[-1][1] = number
+    else:
+        ranges.append([number, number])
+
+def has_archive(project_id: int):
+    """
+    Returns True if the project has any archive segments.
+    """
+    return len(list_segments(project_id)) > 0
+
+def _append_segment(project, records):
+    """
+    Writes `records` as a new compressed segment, noting it in the
+    project. The segment is written to a temporary file first so a
+    crash never leaves a partially written segment behind.
+    """
+    directory = archive_dir(project["id"])
+    directory.mkdir(parents=True, exist_ok=True)
+
+    # Set aside segments keep their numbers, see rebase
+    numbers = [segment_number(path) for path in list_segments(project["id"]) + replaced_segments(project["id"])]
+    number = max(numbers) + 1 if numbers else 1
+    path = directory / f"{SEGMENT_PREFIX}{number:06d}{SEGMENT_SUFFIX}"
+
+    payload = "\n".join(json.dumps(record, separators=(",", ":")) for record in records)
+    tmp_path = path.with_suffix(".tmp")
+    with open(tmp_path, 'wb') as f:
+        f.write(zlib.compress(payload.encode("utf-8")))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+    _note_segment(project, number)
+
+def append_tasks(project, tasks):
+    """
+    Appends archived tasks to the project's cold storage.
+    """
+    if tasks:
+        _append_segment(project, [{"task": task} for task in tasks])
+
+def append_restored(project, task_ids):
+    """
+    Appends markers for tasks that were restored to the board, which
+    hide the older archived copies of those tasks.
+    """
+    if task_ids:
+        _append_segment(project, [{"restored": task_id} for task_id in task_ids])
+
+def rebase(project_id: int, numbers):
+    """
+    Makes the segments numbered in `numbers` the project's archive,
+    setting the others aside in replaced/ and bringing back those set
+    aside before. Returns the number of segments moved.
+    """
+    directory = archive_dir(project_id)
+    moved = 0
+    for path in list_segments(project_id):
+        if segment_number(path) not in numbers:
+            (directory / REPLACED_DIR).mkdir(parents=True, exist_ok=True)
+            os.replace(path, directory / REPLACED_DIR / path.name)
+            moved += 1
+    for path in replaced_segments(project_id):
+        if segment_number(path) in numbers:
+            os.replace(path, directory / path.name)
+            moved += 1
+    return moved
+
+def read_segment(path):
+    """
+    Reads and decompresses a segment through mmap, returning its records.
+    """
+    with open(path, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return []
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            payload = zlib.decompress(mm)
+    return [json.loads(line) for line in payload.decode("utf-8").splitlines() if line]
+
+class ArchiveReader:
+    """
+    Lazily reads the archive of a single project, newest segment first.
+
+    The newest record seen for a task id wins, so a restore marker hides
+    older copies of a task and re-archiving a task shows the newest copy.
+    """
+
+    def __init__(self, project_id: int):
+        self.project_id = project_id
+        self.segments = list(reversed(list_segments(project_id)))
+        self.tasks = []
+        # Segments that failed their checksum, see `kb fsck`
+        self.damaged = []
+        self._seen = set()
+        self._next_segment = 0
+
+    def exhausted(self):
+        return self._next_segment >= len(self.segments)
+
+    def _load_next_segment(self):
+        path = self.segments[self._next_segment]
+        self._next_segment += 1
+        try:
+            # zlib verifies the segment's Adler-32 checksum while decompressing
+            records = read_segment(path)
+        except (zlib.error, ValueError):
+            self.damaged.append(path)
+            return
+        for record in reversed(records):
+            task_id = record["task"]["id"] if "task" in record else record.get("restored")
+            if task_id is None or task_id in self._seen:
+                continue
+            self._seen.add(task_id)
+            if "task" in record:
+                self.tasks.append(record["task"])
+
+    def load_until(self, count: int):
+        """
+        Loads segments until at least `count` tasks are known or
+        the archive is exhausted.
+        """
+        while len(self.tasks) < count and not self.exhausted():
+            self._load_next_segment()
+
+    def load_all(self):
+        while not self.exhausted():
+            self._load_next_segment()
+
+    def page(self, page_index: int, page_size: int):
+        """
+        Returns the tasks shown on the given page, newest first.
+        """
+        start = page_index * page_size
+        self.load_until(start + page_size)
+        return self.tasks[start:start + page_size]
+
+    def search(self, text: str):
+        """
+        Returns the archived tasks whose id, title, or description
+        contain `text` (case insensitive).
+        """
+        self.load_all()
+        needle = text.lower()
+        return [
+            task for task in self.tasks
+            if needle in str(task.get("id")) or
+               needle in task.get("title", "").lower() or
+               needle in blobs.text(task.get("description")).lower()
+        ]
+
+    def get(self, task_id: int):
+        """
+        Returns the archived task with the given id, or None.
+        """
+        task = next((t for t in self.tasks if t["id"] == task_id), None)
+        while task is None and not self.exhausted():
+            self._load_next_segment()
+            task = next((t for t in self.tasks if t["id"] == task_id), None)
+        return task
+
+    def forget(self, task_id: int):
+        """
+        Removes a task from the in-memory view after it is restored.
+        """
+        self.tasks = [t for t in self.tasks if t["id"] != task_id]
+        self._seen.add(task_id)
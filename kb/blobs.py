@@ -0,0 +1,232 @@
+"""
+kb - blobs.py
+author: narlock
+
+This file controls the content-addressed blob store that keeps long
+task text out of settings.json:
+
+~/Documents/narlock/kb/blobs/<first 2 hex digits>/<sha-256 of the text>.z
+
+When settings are saved, any description or acceptanceCriteria
+longer than BLOB_THRESHOLD characters is written to the store as
+zlib compressed UTF-8 and replaced in the task by a reference:
+
+    "description": {"blob": "9f86d0...", "length": 5120}
+
+Identical text is stored once, however many tasks (or archived
+copies) refer to it. The snapshot chunks (see snapshots.py) are kept
+in a store of the same layout, written and read by write_object and
+read_object. Loading the board therefore only parses titles,
+statuses, and the other short fields. The text is read back when a
+task is opened (see settings.get_kanban_task_by_id), into a copy of
+the task, so the task interface always sees plain strings while the
+board keeps its references. Edits come back through history.perform,
+which notes the task for the next save.
+
+Only the tasks changed since the last save (see history.apply), and
+those read from disk still holding long text inline, are looked at
+when saving.
+
+Blobs nothing refers to any more are collected on the snapshot
+garbage collection schedule (see snapshots.maintain). Marking is
+conservative: any digest found in settings.json, the undo log, an
+archive segment, or a snapshot keeps its blob, since each of them can
+bring the text back.
+"""
+
+import archive
+import hashlib
+import history
+import os
+import re
+import tempfile
+import time
+import zlib
+import settings
+import snapshots
+
+BLOB_FIELDS = ("description", "acceptanceCriteria")
+BLOB_THRESHOLD = 256
+# Blobs written this recently may belong to a save still in progress
+GC_GRACE = 600
+DIGEST = re.compile(rb"[0-9a-f]{64}")
+
+# Tasks to look at on the next save, see track and changes_applied
+_pending = []
+
+def blobs_dir():
+    """
+    The blob store lives next to settings.json.
+    """
+    return settings.SETTINGS_PATH.parent / "blobs"
+
+def object_path(directory, digest: str):
+    return directory / digest[:2] / f"{digest}.z"
+
+def blob_path(digest: str):
+    return object_path(blobs_dir(), digest)
+
+def write_object(directory, data):
+    """
+    Stores bytes in the content-addressed store at `directory`,
+    returning their digest. Data already in the store is only touched,
+    which protects it from a concurrent collection.
+    """
+    digest = hashlib.sha256(data).hexdigest()
+    path = object_path(directory, digest)
+    try:
+        os.utime(path)
+        return digest
+    except FileNotFoundError:
+        pass
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, temp_path = tempfile.mkstemp(dir=path.parent, prefix=".object-")
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(zlib.compress(data))
+        os.replace(temp_path, path)
+    except BaseException:
+        os.unlink(temp_path)
+        raise
+    return digest
+
+def read_object(directory, digest: str):
+    """
+    Returns the bytes stored under a digest. Raises OSError if they
+    are missing, and zlib.error or ValueError if they are damaged.
+    """
+    with open(object_path(directory, digest), 'rb') as f:
+        data = zlib.decompress(f.read())
+    if hashlib.sha256(data).hexdigest() != digest:
+        raise ValueError(f"Object {digest[:12]} is damaged")
+    return data
+
+def sweep(directory, live, now: float, grace: float):
+    """
+    Deletes the objects of a store whose digest is not in `live`,
+    sparing those written or touched in the last `grace` seconds.
+
+    Returns:
+        int: the number of objects deleted
+    """
+    deleted = 0
+    for path in directory.glob("*/*.z"):
+        try:
+            if path.name[:-len(".z")] not in live and now - path.stat().st_mtime > grace:
+                path.unlink()
+                deleted += 1
+        except OSError:
+            continue
+    return deleted
+
+def is_ref(value):
+    return isinstance(value, dict) and "blob" in value
+
+def put(text: str):
+    """
+    Stores text, returning its reference.
+    """
+    return {"blob": write_object(blobs_dir(), text.encode("utf-8")), "length": len(text)}
+
+def get(ref):
+    """
+    Returns the text of a reference, or a placeholder if its blob is
+    missing or no longer matches its digest.
+    """
+    try:
+        return read_object(blobs_dir(), ref["blob"]).decode("utf-8")
+    except (OSError, zlib.error):
+        return f"[missing text {ref['blob'][:12]}]"
+    except ValueError:
+        return f"[damaged text {ref['blob'][:12]}]"
+
+def text(value):
+    """
+    Returns a field's text, whether it is stored inline or as a reference.
+    """
+    return get(value) if is_ref(value) else (value or "")
+
+def materialize(task):
+    """
+    Replaces the task's references with their text, in place.
+    """
+    for field in BLOB_FIELDS:
+        if is_ref(task.get(field)):
+            task[field] = get(task[field])
+    return task
+
+def _is_long(value):
+    return isinstance(value, str) and len(value) > BLOB_THRESHOLD
+
+def track(projects):
+    """
+    Notes the tasks of projects read from disk that hold long text
+    inline (written by hand, or by an older version of kb), so the
+    next save moves it into the store.
+    """
+    for project in projects:
+        _pending.extend(
+            task for task in project.get("tasks", [])
+            if any(_is_long(task.get(field)) for field in BLOB_FIELDS)
+        )
+
+def changes_applied(project, changes):
+    """
+    Notes the tasks changed by an operation, for the next save.
+    Called by history.apply.
+    """
+    _pending.extend(after for _before, after in changes if after is not None)
+
+def externalize():
+    """
+    Moves the long text fields of the tasks noted since the last save
+    into the store, in place. Short text stays inline.
+    """
+    tasks = list(_pending)
+    _pending.clear()
+    for task in tasks:
+        for field in BLOB_FIELDS:
+            if _is_long(task.get(field)):
+                task[field] = put(task[field])
+
+# Garbage collection
+
+def _mark(data, live):
+    live.update(digest.decode("ascii") for digest in DIGEST.findall(data))
+
+def live_digests():
+    """
+    Returns every digest anything that can bring text back refers to,
+    or None if one of them cannot be read, so nothing is collected.
+    """
+    live = set()
+    try:
+        for path in (settings.SETTINGS_PATH, history.history_path()):
+            if path.exists():
+                with open(path, 'rb') as f:
+                    _mark(f.read(), live)
+        archives = settings.SETTINGS_PATH.parent / "archive"
+        for directory in archives.iterdir() if archives.exists() else []:
+            for path in archive.list_segments(directory.name) + archive.replaced_segments(directory.name):
+                with open(path, 'rb') as f:
+                    data = f.read()
+                if data:
+                    _mark(zlib.decompress(data), live)
+        for record in snapshots.list_snapshots():
+            _mark(snapshots.read(record["id"]), live)
+    except (OSError, ValueError, zlib.error):
+        return None
+    return live
+
+def collect_garbage(now: float = None):
+    """
+    Deletes the blobs nothing refers to (see live_digests).
+
+    Returns:
+        int: the number of blobs deleted
+    """
+    now = time.time() if now is None else now
+    live = live_digests()
+    if live is None:
+        return 0
+    return sweep(blobs_dir(), live, now, GC_GRACE)
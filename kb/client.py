@@ -0,0 +1,147 @@
+"""
+kb - client.py
+author: narlock
+
+This file contains the client side of the kb daemon (see server.py).
+
+Requests and responses are JSON-RPC 2.0 objects, one per line,
+sent over the Unix domain socket at
+~/Documents/narlock/kb/kb.sock
+
+When the TUI is attached to a daemon, every function decorated with
+`remote` is forwarded to the daemon instead of running locally, and
+the projects it changed are copied back into the local user settings.
+"""
+
+import functools
+import itertools
+import json
+import socket
+import threading
+
+# The client the TUI is attached to, if any
+ATTACHED = None
+
+class RemoteError(Exception):
+    """
+    Raised when the daemon answers a request with an error.
+    """
+
+    def __init__(self, code, message):
+        super().__init__(message)
+        self.code = code
+
+class Client:
+    """
+    A connection to a running kb daemon.
+    """
+
+    def __init__(self, socket_path):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.connect(str(socket_path))
+        self.reader = self.sock.makefile('r', encoding='utf-8')
+        self.lock = threading.Lock()
+        self.ids = itertools.count(1)
+
+    def close(self):
+        self.reader.close()
+        self.sock.close()
+
+    def send(self, message):
+        self.sock.sendall((json.dumps(message, separators=(",", ":")) + "\n").encode("utf-8"))
+
+    def receive(self):
+        """
+        Reads the next message from the daemon, None if it disconnected.
+        """
+        line = self.reader.readline()
+        return json.loads(line) if line else None
+
+    def call(self, method: str, params=None):
+        """
+        Sends a request and waits for its result.
+        """
+        with self.lock:
+            request_id = next(self.ids)
+            self.send({"jsonrpc": "2.0", "id": request_id, "method": method, "params": params or {}})
+            while True:
+                response = self.receive()
+                if response is None:
+                    raise ConnectionError("The kb daemon closed the connection.")
+                # Notifications may arrive between responses on subscribed connections
+                if response.get("id") == request_id:
+                    break
+
+        if "error" in response:
+            raise RemoteError(response["error"]["code"], response["error"]["message"])
+        return response["result"]
+
+    def subscribe(self):
+        """
+        Subscribes to change notifications and yields them as they arrive.
+        The connection should not be used for other requests afterwards.
+        """
+        self.call("subscribe")
+        while True:
+            message = self.receive()
+            if message is None:
+                return
+            if message.get("method") == "changed":
+                yield message["params"]
+
+    def _merge(self, user_settings, changes):
+        """
+        Copies the changed top level settings and projects into the
+        local user settings, keeping existing project dicts in place.
+        """
+        # Imported here, since sparse needs settings, which needs this module
+        import sparse
+        user_settings.update(changes["settings"])
+        local = {project["id"]: project for project in user_settings["projects"]}
+        for project in changes["projects"]:
+            sparse.load(project)
+            if project["id"] in local:
+                local[project["id"]].clear()
+                local[project["id"]].update(project)
+            else:
+                user_settings["projects"].append(project)
+        removed = set(changes["removed"])
+        if removed:
+            user_settings["projects"][:] = [p for p in user_settings["projects"] if p["id"] not in removed]
+
+    def _revisions(self, user_settings):
+        return {str(project["id"]): project.get("revision", 0) for project in user_settings["projects"]}
+
+    def forward(self, user_settings, function: str, args):
+        """
+        Runs a settings function in the daemon and applies its changes locally.
+        """
+        response = self.call("call", {"function": function, "args": args, "revisions": self._revisions(user_settings)})
+        self._merge(user_settings, response["changes"])
+        return response["result"]
+
+    def sync(self, user_settings):
+        """
+        Fetches the changes other clients made since the last request.
+        """
+        self._merge(user_settings, self.call("changes", {"revisions": self._revisions(user_settings)}))
+
+def remote(function):
+    """
+    Decorator for functions that change user settings. When the TUI is
+    attached to a daemon, the call is forwarded to the daemon, which
+    serializes all writes, instead of running locally.
+    """
+    @functools.wraps(function)
+    def wrapper(user_settings, *args):
+        if ATTACHED is None:
+            return function(user_settings, *args)
+        return ATTACHED.forward(user_settings, function.__name__, list(args))
+    return wrapper
+
+def sync(user_settings):
+    """
+    Refreshes the user settings from the daemon when attached.
+    """
+    if ATTACHED is not None:
+        ATTACHED.sync(user_settings)
@@ -0,0 +1,336 @@
+"""
+kb - codec.py
+author: narlock
+
+This file contains the codecs used to store settings on disk.
+
+    json-pretty  indented JSON, easy to read and edit by hand (default)
+    json         compact JSON without whitespace
+    binary       compact JSON in checksummed, length-prefixed frames
+
+The codec used to write settings.json is chosen with the "codec"
+setting. Loading detects the codec from the start of the file, so
+switching codecs converts the file on the next save without losing
+anything.
+
+The binary format starts with a header, followed by one frame for
+the top level settings and one frame per project:
+
+    header : b"KBB" + format version (1 byte, 2) + reserved (1 byte, 0)
+    frame  : payload length (4 bytes) + CRC-32 of payload (4 bytes) + payload
+
+Integers are unsigned and little endian, and each payload is a value
+as compact UTF-8 JSON. Every frame can be verified, and skipped
+without parsing it, on its own, which is what `kb watch` and loading
+a single board (see decode_project) rely on. Format version 1, written by earlier versions
+of kb, held marshal payloads instead; it is still read, only from
+frames whose checksum matches, and rewritten as version 2 on the next
+save.
+
+The JSON codecs store a CRC-32 for every project in a top level
+"checksums" list, computed over the project's compact JSON. The
+compact codec writes one project per line, so each line is exactly
+the text its checksum covers:
+
+    {"recentProjectTitle":"kb",...,"checksums":[3735928559],"projects":[
+    {"id":0,"title":"kb",...}
+    ]}
+
+Projects are verified as they are decoded, binary frames and compact
+JSON lines alike. A damaged project raises CodecError, unless the
+caller passes a `damaged` list, which collects (description, bytes)
+for every damaged project while the others are decoded as usual.
+Pretty JSON is meant to be edited by hand, so its checksums are only
+compared by `kb fsck`.
+
+Projects whose board was never opened are written back as the bytes
+they were stored as, when the codec is unchanged (see encode).
+
+Every codec writes tasks without the fields that hold their default,
+and loads them as dicts that fill those fields in on use (see sparse.py).
+"""
+
+import json
+import marshal
+import struct
+import zlib
+import sparse
+
+PRETTY_JSON = "json-pretty"
+COMPACT_JSON = "json"
+BINARY = "binary"
+CODEC_NAMES = [PRETTY_JSON, COMPACT_JSON, BINARY]
+DEFAULT_CODEC = PRETTY_JSON
+
+BINARY_MAGIC = b"KBB"
+BINARY_VERSION = 2
+LEGACY_MARSHAL_VERSION = 1
+BINARY_HEADER = BINARY_MAGIC + bytes([BINARY_VERSION, 0])
+FRAME_HEADER = struct.Struct("<II")
+COMPACT_SEPARATORS = (",", ":")
+PROJECTS_START = b'"projects":['
+PROJECTS_END = b"]}"
+PRETTY_ITEM_INDENT = " " * 8
+
+class CodecError(ValueError):
+    """
+    Raised when stored settings cannot be decoded.
+    """
+
+def _encode_frame(value):
+    payload = json.dumps(value, separators=COMPACT_SEPARATORS).encode("utf-8")
+    return FRAME_HEADER.pack(len(payload), zlib.crc32(payload)) + payload
+
+def decode_payload(version: int, payload):
+    """
+    Returns the value held by a verified frame of binary settings
+    written in the format version.
+    """
+    if version == LEGACY_MARSHAL_VERSION:
+        return marshal.loads(payload)
+    return json.loads(bytes(payload))
+
+def _damage(damaged, description: str, data):
+    if damaged is None:
+        raise CodecError(description)
+    damaged.append((description, bytes(data)))
+
+def iter_frames(data, offset: int = len(BINARY_HEADER), damaged=None):
+    """
+    Yields (offset, checksum, payload) for every frame of binary data,
+    verifying each frame's checksum. Frames failing it are skipped and
+    reported to `damaged`; a truncated frame ends the data.
+    """
+    view = memoryview(data)
+    while offset < len(view):
+        length, checksum = FRAME_HEADER.unpack_from(view, offset) if offset + FRAME_HEADER.size <= len(view) else (0, 0)
+        start = offset + FRAME_HEADER.size
+        payload = view[start:start + length]
+        if start > len(view) or len(payload) != length:
+            _damage(damaged, f"Truncated frame at byte {offset}", view[offset:])
+            return
+        if zlib.crc32(payload) != checksum:
+            _damage(damaged, f"Checksum mismatch in frame at byte {offset}", view[offset:start + length])
+        else:
+            yield offset, checksum, payload
+        offset = start + length
+
+def _encoded_projects(settings, encode_project, pieces):
+    """
+    Returns (bytes, checksum) for every project, where the bytes are
+    what encode_project returns for the project and its compact JSON,
+    and the checksum is the CRC-32 of that JSON. Projects that were
+    only summarized (see manifest.py) take their bytes and checksum
+    from `pieces`, keyed by project id.
+    """
+    encoded = []
+    for project in settings.get("projects", []):
+        if "tasks" not in project:
+            if pieces is None or project["id"] not in pieces:
+                raise CodecError(f"Project {project['id']} was not loaded")
+            encoded.append(pieces[project["id"]])
+            continue
+        disk = sparse.for_disk(project)
+        line = json.dumps(disk, separators=COMPACT_SEPARATORS).encode("utf-8")
+        encoded.append((encode_project(disk, line), zlib.crc32(line)))
+    return encoded
+
+def _join(data: bytearray, encoded, separator: bytes, layout):
+    # Appends the projects' bytes, noting [offset, length, checksum] of each in the layout
+    for position, (piece, checksum) in enumerate(encoded):
+        if position:
+            data += separator
+        if layout is not None:
+            layout.append([len(data), len(piece), checksum])
+        data += piece
+    return data
+
+def encode_binary(settings, pieces=None, layout=None):
+    top_level = {key: value for key, value in settings.items() if key != "projects"}
+    frame = lambda disk, line: FRAME_HEADER.pack(len(line), zlib.crc32(line)) + line
+    data = bytearray(BINARY_HEADER + _encode_frame(top_level))
+    return bytes(_join(data, _encoded_projects(settings, frame, pieces), b"", layout))
+
+def decode_binary(data, damaged=None):
+    version = data[3]
+    if version not in (BINARY_VERSION, LEGACY_MARSHAL_VERSION):
+        raise CodecError(f"Unsupported binary settings version {version}")
+
+    settings = None
+    projects = []
+    for offset, _checksum, payload in iter_frames(data, damaged=damaged):
+        value = decode_payload(version, payload)
+        if settings is None:
+            if offset != len(BINARY_HEADER):
+                raise CodecError("The top level frame of the binary settings is damaged")
+            settings = value
+        else:
+            projects.append(sparse.load(value))
+    if settings is None:
+        raise CodecError("Binary settings are missing their top level frame")
+
+    settings["projects"] = projects
+    return settings
+
+def project_checksum(project):
+    """
+    The CRC-32 stored for a project, as written to disk, by the JSON codecs.
+    """
+    return zlib.crc32(json.dumps(project, separators=COMPACT_SEPARATORS).encode("utf-8"))
+
+def _pretty_project(disk, line):
+    # Indented as json.dumps indents the items of the top level "projects" list
+    return (PRETTY_ITEM_INDENT + json.dumps(disk, indent=4).replace("\n", "\n" + PRETTY_ITEM_INDENT)).encode("utf-8")
+
+def encode_json(settings, pretty: bool, pieces=None, layout=None):
+    encoded = _encoded_projects(settings, _pretty_project if pretty else lambda disk, line: line, pieces)
+    top_level = {key: value for key, value in settings.items() if key not in ("projects", "checksums")}
+    top_level["checksums"] = [checksum for _piece, checksum in encoded]
+    if pretty:
+        # The same text as json.dumps of the whole object, built a project at a time
+        head = json.dumps({**top_level, "projects": []}, indent=4).encode("utf-8")
+        if not encoded:
+            return head
+        data = bytearray(head[:-len(b"]\n}")] + b"\n")
+        return bytes(_join(data, encoded, b",\n", layout) + b"\n    ]\n}")
+
+    # The top level object, left open for the projects, one per line
+    header = json.dumps(top_level, separators=COMPACT_SEPARATORS).encode("utf-8")[:-1]
+    data = bytearray(header + b"," + PROJECTS_START + b"\n")
+    return bytes(_join(data, encoded, b",\n", layout) + b"\n" + PROJECTS_END)
+
+def split_json_lines(data):
+    """
+    Returns the top level line, the project lines, and whether the
+    data ends where it should, for compact JSON written one project
+    per line. Returns None if the data is laid out differently (such
+    as by an older version of kb).
+    """
+    lines = data.split(b"\n")
+    if not lines[0].endswith(PROJECTS_START):
+        return None
+    complete = len(lines) > 1 and lines[-1] == PROJECTS_END
+    body = lines[1:-1] if complete else lines[1:]
+    return lines[0], [line[:-1] if line.endswith(b",") else line for line in body if line], complete
+
+def _load_project(value):
+    if not isinstance(value, dict) or not isinstance(value.get("id"), int):
+        raise ValueError("not a project with an id")
+    return sparse.load(value)
+
+def decode_json(data, damaged=None):
+    split = split_json_lines(data)
+    if split is None:
+        settings = json.loads(data)
+        settings.pop("checksums", None)
+        projects = []
+        for index, project in enumerate(settings.get("projects", [])):
+            try:
+                projects.append(_load_project(project))
+            except ValueError as e:
+                _damage(damaged, f"Invalid project {index}: {e}", json.dumps(project).encode("utf-8"))
+        settings["projects"] = projects
+        return settings
+
+    header, lines, complete = split
+    settings = json.loads(header + PROJECTS_END)
+    if not complete:
+        _damage(damaged, "Settings end early, the last project may be cut off", b"")
+    checksums = settings.pop("checksums", None)
+    if checksums is not None and len(checksums) != len(lines):
+        _damage(damaged, f"Expected {len(checksums)} projects, found {len(lines)}", b"")
+        checksums = None
+
+    projects = []
+    for index, line in enumerate(lines):
+        if checksums is not None and zlib.crc32(line) != checksums[index]:
+            _damage(damaged, f"Checksum mismatch in project {index}", line)
+            continue
+        try:
+            projects.append(_load_project(json.loads(line)))
+        except ValueError as e:
+            _damage(damaged, f"Invalid project {index}: {e}", line)
+    settings["projects"] = projects
+    return settings
+
+def _project_frame(data, index: int):
+    # Steps over the top level frame and earlier projects by their lengths alone
+    view = memoryview(data)
+    offset = len(BINARY_HEADER)
+    for _ in range(index + 2):
+        if offset + FRAME_HEADER.size > len(view):
+            return None
+        length, checksum = FRAME_HEADER.unpack_from(view, offset)
+        start = offset + FRAME_HEADER.size
+        offset = start + length
+    payload = view[start:offset]
+    if len(payload) != length or zlib.crc32(payload) != checksum:
+        return None
+    return decode_payload(data[3], payload)
+
+def decode_project(data, index: int):
+    """
+    Returns the project at `index` of settings data, decoding only that
+    project's binary frame or compact JSON line. Returns None when that
+    is not possible: the project is missing or damaged, or the data is
+    pretty JSON or laid out by an older version of kb. Callers then
+    decode the whole file, which also reports any damage.
+    """
+    try:
+        if detect(data) == BINARY:
+            if data[3] not in (BINARY_VERSION, LEGACY_MARSHAL_VERSION):
+                return None
+            project = _project_frame(data, index)
+        else:
+            split = split_json_lines(data) if detect(data) == COMPACT_JSON else None
+            if split is None or not split[2] or index >= len(split[1]):
+                return None
+            header, lines, _complete = split
+            checksums = json.loads(header + PROJECTS_END).get("checksums")
+            if checksums is None or len(checksums) != len(lines) or zlib.crc32(lines[index]) != checksums[index]:
+                return None
+            project = json.loads(lines[index])
+    except (EOFError, TypeError, IndexError, ValueError):
+        return None
+    return sparse.load(project) if isinstance(project, dict) else None
+
+def detect(data):
+    """
+    Returns the name of the codec the data was written with.
+    """
+    if data.startswith(BINARY_MAGIC):
+        return BINARY
+    if data.startswith(b"{\n"):
+        return PRETTY_JSON
+    return COMPACT_JSON
+
+def encode(settings, codec_name: str = DEFAULT_CODEC, pieces=None, layout=None):
+    """
+    Serializes settings with the named codec, returning bytes.
+
+    Projects without tasks, only summarized by the manifest, are
+    written as the (bytes, checksum) `pieces` holds for their id: the
+    bytes they were written as by the same codec, copied from the old
+    file. If the caller passes a `layout` list, [offset, length,
+    checksum] of every project's bytes is appended to it, which is
+    what the manifest records for the next save to copy.
+    """
+    if codec_name in (PRETTY_JSON, COMPACT_JSON):
+        return encode_json(settings, codec_name == PRETTY_JSON, pieces, layout)
+    elif codec_name == BINARY:
+        return encode_binary(settings, pieces, layout)
+    raise CodecError(f"Unknown codec '{codec_name}'. Valid options: {CODEC_NAMES}")
+
+def decode(data, damaged=None):
+    """
+    Deserializes settings written by any codec, verifying projects'
+    checksums where the codec allows (see above).
+    """
+    if detect(data) == BINARY:
+        try:
+            return decode_binary(data, damaged)
+        except CodecError:
+            raise
+        except (EOFError, TypeError, IndexError, ValueError) as e:
+            raise CodecError(f"Invalid binary settings: {e}")
+    return decode_json(data, damaged)
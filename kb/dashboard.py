@@ -0,0 +1,213 @@
+"""
+kb - dashboard.py
+author: narlock
+
+This file controls the cross-project dashboard, which shows the
+state of every project at once.
+
+Each project's summary is cached at
+~/Documents/narlock/kb/summaries.json
+together with the project's revision and the day it was computed.
+A project's revision changes whenever one of its tasks changes, so
+only summaries of projects that changed since the last visit (or
+whose recent activity window moved on) are recomputed. Those are spread
+across a process pool when there are many of them.
+"""
+
+import json
+import os
+import time
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+import ansi
+import flow
+import kbutils
+import layout
+import settings
+
+RECENT_DAYS = 7
+# Below this many stale projects, starting a process pool costs more than it saves
+PARALLEL_THRESHOLD = 16
+TIME_COLUMN_FILE, TIME_TYPECODE = flow.COLUMNS["time"]
+TIME_WIDTH = array(TIME_TYPECODE).itemsize
+
+def summaries_path():
+    """
+    The summary cache lives next to settings.json.
+    """
+    return settings.SETTINGS_PATH.parent / "summaries.json"
+
+def _recent_transitions(time_column: Path, since: float):
+    """
+    Counts the events newer than `since` by reading the time column
+    backwards from its end, so only recent events are read.
+    """
+    try:
+        size = time_column.stat().st_size
+    except OSError:
+        return 0
+
+    count = 0
+    chunk_events = 4096
+    end = size - size % TIME_WIDTH
+    with open(time_column, 'rb') as f:
+        while end > 0:
+            start = max(0, end - chunk_events * TIME_WIDTH)
+            f.seek(start)
+            times = array(TIME_TYPECODE)
+            times.frombytes(f.read(end - start))
+            for value in reversed(times):
+                if value < since:
+                    return count
+                count += 1
+            end = start
+    return count
+
+def summarize_project(project, events_dir: str, now: float):
+    """
+    Computes the dashboard summary of a single project. This runs in
+    a worker process, so it only uses its arguments.
+    """
+    tasks = project.get("tasks", [])
+    status_counts = {}
+    for task in tasks:
+        status = task.get("status", "backlog")
+        status_counts[status] = status_counts.get(status, 0) + 1
+
+    # A task is blocked while a task it is "blocked by" is still on the board and not done
+    open_ids = {task["id"] for task in tasks if task.get("status") != "done"}
+    blocked = sum(
+        1 for task in tasks
+        if task.get("status") != "done" and any(
+            link.get("reason") == "blocked by" and link.get("id") in open_ids and link.get("id") != task["id"]
+            for link in task.get("linkedTasks", [])
+        )
+    )
+
+    return {
+        "title": project["title"],
+        "statusCounts": status_counts,
+        "wip": status_counts.get("doing", 0),
+        "blocked": blocked,
+        "recentTransitions": _recent_transitions(Path(events_dir) / TIME_COLUMN_FILE, now - RECENT_DAYS * 86400),
+        "modified": project.get("modified"),
+    }
+
+def load_summaries():
+    try:
+        with open(summaries_path(), 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def save_summaries(cache):
+    try:
+        with open(summaries_path(), 'w', encoding='utf-8') as f:
+            json.dump(cache, f)
+    except OSError:
+        # The cache is only an optimization
+        pass
+
+def get_project_summaries(user_settings):
+    """
+    Returns the summary of every project in settings order, only
+    recomputing the summaries of projects that changed.
+    """
+    cache = load_summaries()
+    now = time.time()
+    today = time.strftime("%Y-%m-%d", time.localtime(now))
+
+    def is_stale(project):
+        cached = cache.get(str(project["id"]), {})
+        return cached.get("revision", -1) != project.get("revision", 0) or cached.get("day") != today
+
+    stale = [project for project in user_settings["projects"] if is_stale(project)]
+    if any("tasks" not in project for project in stale):
+        # Summarized by the manifest only, the tasks are needed to recompute
+        settings.load_projects(user_settings, [project["id"] for project in stale])
+        stale = [project for project in user_settings["projects"] if is_stale(project)]
+    jobs = [(project, str(flow.events_dir(project["id"])), now) for project in stale]
+
+    if len(jobs) >= PARALLEL_THRESHOLD:
+        with ProcessPoolExecutor(max_workers=os.cpu_count()) as pool:
+            fresh = list(pool.map(summarize_project, *zip(*jobs), chunksize=8))
+    else:
+        fresh = [summarize_project(*job) for job in jobs]
+
+    for project, summary in zip(stale, fresh):
+        cache[str(project["id"])] = {"revision": project.get("revision", 0), "day": today, "summary": summary}
+
+    # Forget summaries of deleted projects
+    project_ids = {str(project["id"]) for project in user_settings["projects"]}
+    forgotten = [project_id for project_id in cache if project_id not in project_ids]
+    for project_id in forgotten:
+        del cache[project_id]
+
+    if stale or forgotten:
+        save_summaries(cache)
+
+    return [cache[str(project["id"])]["summary"] for project in user_settings["projects"]]
+
+def format_summary(summary, selected: bool = False):
+    """
+    Formats one project summary as a single dashboard row.
+    """
+    counts = summary["statusCounts"]
+    modified = summary.get("modified")
+    last_change = time.strftime("%Y-%m-%d %H:%M", time.localtime(modified)) if modified else "never"
+    title_color = f"{ansi.BRIGHT_GREEN}{ansi.BOLD}→ " if selected else ansi.GREEN
+    blocked_color = ansi.RED if summary["blocked"] else ansi.GREY
+
+    return (
+        f"{title_color}{summary['title']}{ansi.RESET}  "
+        f"{ansi.GREY}backlog {counts.get('backlog', 0)} · todo {counts.get('todo', 0)} · "
+        f"doing {counts.get('doing', 0)} · done {counts.get('done', 0)}{ansi.RESET}  "
+        f"{ansi.ORANGE}WIP {summary['wip']}{ansi.RESET}  "
+        f"{blocked_color}blocked {summary['blocked']}{ansi.RESET}  "
+        f"{ansi.GREY}{summary['recentTransitions']} moves in {RECENT_DAYS}d, last change {last_change}{ansi.RESET}"
+    )
+
+def print_dashboard(user_settings):
+    """
+    Prints the dashboard once, used by `kb dashboard`.
+    """
+    print(f"{ansi.ORANGE}{ansi.BOLD}Dashboard{ansi.RESET}\n")
+    for summary in get_project_summaries(user_settings):
+        print(format_summary(summary))
+
+def display_dashboard(user_settings):
+    """
+    Displays the interactive dashboard. UP and DOWN select a project
+    and ENTER opens its board.
+
+    Returns:
+        str: the title of the project to open
+        None: if the user left the dashboard
+    """
+    summaries = get_project_summaries(user_settings)
+    if not summaries:
+        return None
+
+    selected_index = 0
+    while True:
+        _columns, rows = layout.LAYOUT.size()
+        page_size = max(1, rows - 4)
+        first = (selected_index // page_size) * page_size
+
+        os.system('clear')
+        print(f"{ansi.ORANGE}{ansi.BOLD}Dashboard{ansi.RESET}\n")
+        for index in range(first, min(first + page_size, len(summaries))):
+            print(format_summary(summaries[index], index == selected_index))
+
+        kbutils.print_bottom_input("")
+        key = kbutils.get_keypress()
+
+        if key == kbutils.EXIT_CMD:
+            return None
+        elif key == kbutils.KEY_UP:
+            selected_index = (selected_index - 1) % len(summaries)
+        elif key == kbutils.KEY_DOWN:
+            selected_index = (selected_index + 1) % len(summaries)
+        elif key in kbutils.KEY_ENTER:
+            return summaries[selected_index]["title"]
@@ -0,0 +1,102 @@
+"""
+kb - flow.py
+author: narlock
+
+This file controls the status transition log stored at
+~/Documents/narlock/kb/events/<project id>/
+
+Every time a task changes status an event is appended. The log is
+columnar: each field lives in its own file of fixed width values,
+so analytics can load a column straight into an array.
+
+    task.i32   id of the task           (32-bit signed int)
+    from.i8    status code moved from   (8-bit signed int)
+    to.i8      status code moved to     (8-bit signed int)
+    time.f64   unix timestamp           (64-bit float)
+
+Status codes index into STATUS_CODES. A task that is created
+moves from NONE, and a deleted task moves to NONE.
+Undoing or redoing a change appends nothing, so only work actually
+done on the board is measured.
+"""
+
+import time
+from array import array
+import settings
+
+NONE = ""
+STATUS_CODES = [NONE, "backlog", "todo", "doing", "done", "archived"]
+UNKNOWN_STATUS = -1
+
+# Column name -> (file name, array typecode)
+COLUMNS = {
+    "task": ("task.i32", "i"),
+    "from": ("from.i8", "b"),
+    "to": ("to.i8", "b"),
+    "time": ("time.f64", "d"),
+}
+
+def events_dir(project_id: int):
+    """
+    The event log for a project lives next to settings.json.
+    """
+    return settings.SETTINGS_PATH.parent / "events" / str(project_id)
+
+def status_code(status):
+    """
+    Returns the compact code for a status name.
+    """
+    if status is None:
+        return STATUS_CODES.index(NONE)
+    try:
+        return STATUS_CODES.index(status)
+    except ValueError:
+        return UNKNOWN_STATUS
+
+def append_events(project_id: int, events):
+    """
+    Appends (task id, from status, to status) transitions to the
+    project's event log, all stamped with the current time.
+    """
+    events = [(task_id, old, new) for task_id, old, new in events if old != new]
+    if not events:
+        return
+
+    directory = events_dir(project_id)
+    directory.mkdir(parents=True, exist_ok=True)
+    now = time.time()
+
+    values = {
+        "task": [task_id for task_id, _old, _new in events],
+        "from": [status_code(old) for _task_id, old, _new in events],
+        "to": [status_code(new) for _task_id, _old, new in events],
+        "time": [now] * len(events),
+    }
+    for column, (file_name, typecode) in COLUMNS.items():
+        with open(directory / file_name, 'ab') as f:
+            array(typecode, values[column]).tofile(f)
+
+def transitions(op):
+    """
+    Returns the status transitions caused by a history operation as
+    (task id, from status, to status) tuples.
+    """
+    kind = op["op"]
+    if kind == "update" and "status" in op["after"]:
+        return [(op["task"], op["before"].get("status"), op["after"]["status"])]
+    elif kind == "insert":
+        return [(op["task"]["id"], NONE, op["task"].get("status"))]
+    elif kind == "remove":
+        return [(op["task"]["id"], op["task"].get("status"), NONE)]
+    elif kind == "archive":
+        return [(task["id"], task.get("status"), "archived") for _index, task in op["tasks"]]
+    elif kind == "unarchive":
+        return [(task["id"], "archived", "done") for _index, task in op["tasks"]]
+    return []
+
+def record_op(op):
+    """
+    Appends the transitions caused by an applied history operation.
+    """
+    if "project" in op:
+        append_events(op["project"], transitions(op))
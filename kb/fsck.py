@@ -0,0 +1,530 @@
+"""
+kb - fsck.py
+author: narlock
+
+This file controls `kb fsck`, which verifies everything kb stores:
+
+    settings.json     the checksum of every project (see codec.py)
+    archive segments  the zlib checksum of every segment (see archive.py)
+    blob store        the SHA-256 digest every blob is named after (see blobs.py)
+
+and checks every project for
+
+    duplicate task ids
+    a nextTaskId not above every task id, archived tasks included
+    linkedTasks pointing at tasks that do not exist
+    unknown statuses
+    references to missing blobs
+
+The store is read one project, segment, or blob at a time, so memory
+use does not grow with its size. Binary and compact JSON settings are
+read a frame or a line at a time, and pretty JSON one value of its
+top level object, or one project, at a time.
+
+`kb fsck --repair` fixes what it can: ids are made unique and
+nextTaskId raised, dangling links dropped, and tasks with an unknown
+status moved to the backlog. Damaged projects, segments, and blobs
+cannot be fixed, so they are moved to the quarantine directory (see
+schema.py) and the rest of the store is kept.
+
+Repairs are logged as sync changes (see sync.py), a renumbered task as
+a new one, so other replicas see the same boards. The undo log is
+cleared, since its operations name tasks by the ids they had before.
+The exit status is 0 once nothing that was found is left unrepaired.
+"""
+
+import codecs
+import copy
+import hashlib
+import json
+import os
+import zlib
+import ansi
+import archive
+import blobs
+import codec
+import history
+import schema
+import settings
+import sync
+
+READ_SIZE = 1 << 16
+
+class Report:
+    """
+    Prints problems as they are found and counts them.
+    """
+
+    def __init__(self):
+        self.problems = 0
+        self.repaired = 0
+        self.quarantined = 0
+
+    def unresolved(self):
+        return max(0, self.problems - self.repaired - self.quarantined)
+
+    def problem(self, where: str, message: str):
+        self.problems += 1
+        print(f"{ansi.RED}{where}: {message}{ansi.RESET}")
+
+    def repair(self, where: str, message: str):
+        self.repaired += 1
+        print(f"{ansi.GREEN}{where}: {message}{ansi.RESET}")
+
+    def quarantine(self, where: str, path):
+        self.quarantined += 1
+        print(f"{ansi.YELLOW}{where}: moved to {path}{ansi.RESET}")
+
+# Reading the store
+
+def stream_settings(f):
+    """
+    Yields ("settings" or "project <index>", value, error) for the top
+    level settings and then every project of an open settings.json,
+    where value is None if error is not.
+    """
+    start = f.read(len(codec.BINARY_HEADER))
+    f.seek(0)
+    if start.startswith(codec.BINARY_MAGIC):
+        yield from _stream_binary(f)
+        return
+
+    header = f.readline()
+    if header.rstrip(b"\n").endswith(codec.PROJECTS_START):
+        yield from _stream_json_lines(f, header)
+        return
+
+    # Pretty JSON, or JSON from an older version of kb
+    f.seek(0)
+    yield from _stream_json(f)
+
+class JsonReader:
+    """
+    Reads a JSON document from a file one value at a time, keeping
+    only the value being read in memory.
+    """
+
+    def __init__(self, f):
+        self.f = f
+        self.utf8 = codecs.getincrementaldecoder("utf-8")()
+        self.decoder = json.JSONDecoder()
+        self.buffer = ""
+        self.position = 0
+
+    def _read_more(self):
+        # As much again as is buffered, so retrying a long value stays linear
+        chunk = self.f.read(max(READ_SIZE, len(self.buffer) - self.position))
+        self.buffer = self.buffer[self.position:] + self.utf8.decode(chunk, final=not chunk)
+        self.position = 0
+        return bool(chunk)
+
+    def peek(self):
+        """
+        Skips whitespace, returning the next character, or "" at the end.
+        """
+        while True:
+            while self.position < len(self.buffer) and self.buffer[self.position] in " \t\r\n":
+                self.position += 1
+            if self.position < len(self.buffer) or not self._read_more():
+                return self.buffer[self.position:self.position + 1]
+
+    def expect(self, character: str):
+        if self.peek() != character:
+            raise ValueError(f"expected '{character}' at {self.peek()!r}")
+        self.position += 1
+
+    def value(self):
+        """
+        Reads the next value, raising ValueError if it is not valid JSON.
+        """
+        self.peek()
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buffer, self.position)
+            except ValueError:
+                # The value may go on past what was read so far
+                if self._read_more():
+                    continue
+                raise
+            # As may a number ending where the buffer does
+            if end == len(self.buffer) and self._read_more():
+                continue
+            self.position = end
+            return value
+
+def _stream_json(f):
+    reader = JsonReader(f)
+    user_settings = {}
+    checksums = None
+    keys = 0
+    where = "settings"
+    try:
+        reader.expect("{")
+        while reader.peek() != "}":
+            if keys:
+                reader.expect(",")
+            keys += 1
+            key = reader.value()
+            if not isinstance(key, str):
+                raise ValueError(f"expected a key, found {key!r}")
+            reader.expect(":")
+            if key == "checksums":
+                checksums = reader.value()
+            elif key != "projects" or user_settings is None:
+                value = reader.value()
+                if user_settings is not None:
+                    user_settings[key] = value
+            else:
+                # kb writes the checksums and the other settings before the projects
+                yield "settings", user_settings, None
+                user_settings = None
+                reader.expect("[")
+                index = 0
+                while reader.peek() != "]":
+                    if index:
+                        reader.expect(",")
+                    where = f"project {index}"
+                    project = reader.value()
+                    if checksums and index < len(checksums) and codec.project_checksum(project) != checksums[index]:
+                        yield where, project, "changed outside kb (its checksum does not match)"
+                    else:
+                        yield where, project, None
+                    index += 1
+                reader.expect("]")
+                where = "settings"
+        reader.expect("}")
+    except ValueError as e:
+        yield where, None, f"cannot be parsed: {e}"
+        return
+    if user_settings is not None:
+        yield "settings", user_settings, None
+
+def _stream_binary(f):
+    start = f.read(len(codec.BINARY_HEADER))
+    if len(start) < len(codec.BINARY_HEADER) or start[3] not in (codec.BINARY_VERSION, codec.LEGACY_MARSHAL_VERSION):
+        yield "settings", None, "has an unsupported binary header"
+        return
+    version = start[3]
+    index = -1
+    while True:
+        header = f.read(codec.FRAME_HEADER.size)
+        if not header:
+            return
+        where = "settings" if index < 0 else f"project {index}"
+        index += 1
+        if len(header) < codec.FRAME_HEADER.size:
+            yield where, None, "truncated frame"
+            return
+        length, checksum = codec.FRAME_HEADER.unpack(header)
+        payload = f.read(length)
+        if len(payload) != length:
+            yield where, None, "truncated frame"
+            return
+        if zlib.crc32(payload) != checksum:
+            yield where, None, "checksum mismatch"
+            continue
+        try:
+            yield where, codec.decode_payload(version, payload), None
+        except (EOFError, ValueError, TypeError) as e:
+            yield where, None, f"cannot be decoded: {e}"
+
+def _stream_json_lines(f, header):
+    try:
+        user_settings = json.loads(header.rstrip(b"\n") + codec.PROJECTS_END)
+    except ValueError as e:
+        yield "settings", None, f"cannot be parsed: {e}"
+        return
+    checksums = user_settings.pop("checksums", None) or []
+    yield "settings", user_settings, None
+
+    index = 0
+    complete = False
+    for line in f:
+        line = line.rstrip(b"\n")
+        if line == codec.PROJECTS_END:
+            complete = True
+            break
+        if not line:
+            continue
+        line = line[:-1] if line.endswith(b",") else line
+        where = f"project {index}"
+        if index < len(checksums) and zlib.crc32(line) != checksums[index]:
+            yield where, None, "checksum mismatch"
+        else:
+            try:
+                yield where, json.loads(line), None
+            except ValueError as e:
+                yield where, None, f"cannot be parsed: {e}"
+        index += 1
+    if not complete:
+        yield "settings", None, "ends early, the last project may be cut off"
+    elif index != len(checksums):
+        yield "settings", None, f"expected {len(checksums)} projects, found {index}"
+
+def _stream_zlib(path):
+    """
+    Yields the decompressed data of a zlib file in chunks, raising
+    zlib.error if it is damaged or incomplete.
+    """
+    decompressor = zlib.decompressobj()
+    with open(path, 'rb') as f:
+        while True:
+            chunk = f.read(READ_SIZE)
+            if not chunk:
+                break
+            yield decompressor.decompress(chunk)
+    yield decompressor.flush()
+    if not decompressor.eof:
+        raise zlib.error("incomplete stream")
+
+def segment_task_ids(path):
+    """
+    Returns the ids of the tasks archived in a segment, raising
+    ValueError or zlib.error if the segment is damaged.
+    """
+    ids = set()
+    rest = b""
+    for chunk in _stream_zlib(path):
+        lines = (rest + chunk).split(b"\n")
+        rest = lines.pop()
+        for line in lines:
+            record = json.loads(line)
+            if "task" in record:
+                ids.add(record["task"]["id"])
+    if rest:
+        record = json.loads(rest)
+        if "task" in record:
+            ids.add(record["task"]["id"])
+    return ids
+
+def verify_archive(project_id: int, report: Report, repair: bool):
+    """
+    Verifies a project's archive segments, returning the archived task ids.
+    """
+    ids = set()
+    for path in archive.list_segments(project_id):
+        where = f"archive {project_id}/{path.name}"
+        try:
+            ids |= segment_task_ids(path)
+        except (zlib.error, ValueError, KeyError, TypeError) as e:
+            report.problem(where, f"damaged ({e})")
+            if repair:
+                report.quarantine(where, _move_to_quarantine(path, f"archive-{project_id}-{path.name}"))
+    return ids
+
+def verify_blobs(report: Report, repair: bool):
+    directory = blobs.blobs_dir()
+    if not directory.exists():
+        return
+    for path in sorted(directory.glob("*/*.z")):
+        digest = path.name[:-len(".z")]
+        sha = hashlib.sha256()
+        try:
+            for chunk in _stream_zlib(path):
+                sha.update(chunk)
+            intact = sha.hexdigest() == digest
+        except (OSError, zlib.error):
+            intact = False
+        if not intact:
+            where = f"blob {digest[:12]}"
+            report.problem(where, "does not match its digest")
+            if repair:
+                report.quarantine(where, _move_to_quarantine(path, f"blob-{path.name}"))
+
+def _move_to_quarantine(path, name: str):
+    directory = schema.quarantine_dir()
+    directory.mkdir(parents=True, exist_ok=True)
+    target = directory / name
+    os.replace(path, target)
+    return target
+
+# Checking projects
+
+def known_statuses(project):
+    statuses = list(settings.TASK_STATUS_TYPE_OPTIONS)
+    # Leftover archived tasks are moved to cold storage by a schema migration
+    if schema.version_of(project) < 2:
+        statuses.append("archived")
+    return statuses
+
+def project_problems(project, archived_ids):
+    """
+    Returns (message, repair) pairs for the problems of a project,
+    where repair fixes the problem in place and returns a description
+    of what it did, or is None if it cannot be fixed.
+    """
+    problems = []
+    tasks = project.get("tasks", [])
+
+    invalid = [task for task in tasks if not isinstance(task, dict) or not isinstance(task.get("id"), int)]
+    if invalid:
+        def quarantine_invalid():
+            path = schema.quarantine(f"project-{project['id']}-tasks.json", json.dumps(invalid, indent=2).encode("utf-8"))
+            project["tasks"] = [task for task in project["tasks"] if not any(task is bad for bad in invalid)]
+            return f"moved {len(invalid)} tasks without an id to {path}"
+        problems.append((f"{len(invalid)} tasks have no id", quarantine_invalid))
+        tasks = [task for task in tasks if not any(task is bad for bad in invalid)]
+
+    ids = [task["id"] for task in tasks]
+    highest = max(list(archived_ids) + ids, default=-1)
+    if project.get("nextTaskId", 0) <= highest:
+        def raise_next_id():
+            project["nextTaskId"] = highest + 1
+            return f"nextTaskId raised to {highest + 1}"
+        problems.append((f"nextTaskId {project.get('nextTaskId')} is not above task id {highest}", raise_next_id))
+
+    seen = set()
+    duplicates = []
+    for task in tasks:
+        if task["id"] in seen:
+            duplicates.append(task)
+        seen.add(task["id"])
+    if duplicates:
+        def renumber():
+            renumbered = []
+            for task in duplicates:
+                old_id = task["id"]
+                task["id"] = max(project.get("nextTaskId", 0), highest + 1)
+                project["nextTaskId"] = task["id"] + 1
+                renumbered.append(f"{old_id} -> {task['id']}")
+            return f"renumbered duplicate tasks {', '.join(renumbered)}"
+        problems.append((f"duplicate task ids {sorted({task['id'] for task in duplicates})}", renumber))
+
+    statuses = known_statuses(project)
+    unknown = [task for task in tasks if task.get("status") not in statuses]
+    if unknown:
+        def to_backlog():
+            for task in unknown:
+                task["status"] = "backlog"
+            return f"moved tasks {[task['id'] for task in unknown]} to the backlog"
+        problems.append((f"unknown statuses {sorted({str(task.get('status')) for task in unknown})}", to_backlog))
+
+    existing = set(ids) | archived_ids
+    dangling = [
+        (task, link) for task in tasks for link in task.get("linkedTasks") or []
+        if not isinstance(link, dict) or link.get("id") not in existing
+    ]
+    if dangling:
+        def drop_links():
+            for task, link in dangling:
+                task["linkedTasks"] = [other for other in task["linkedTasks"] if other is not link]
+            return f"dropped {len(dangling)} links to missing tasks"
+        problems.append((f"{len(dangling)} linkedTasks point at missing tasks", drop_links))
+
+    missing = [
+        task["id"] for task in tasks for field in blobs.BLOB_FIELDS
+        if blobs.is_ref(task.get(field)) and not blobs.blob_path(task[field]["blob"]).exists()
+    ]
+    if missing:
+        problems.append((f"tasks {missing} refer to missing text", None))
+    return problems
+
+# The command
+
+def _repair_changes(project, before):
+    """
+    Returns the (before, after) sync changes of the repairs made to a
+    project whose tasks were copied into `before`, keyed by id(task).
+    """
+    changes = []
+    for task in project["tasks"]:
+        previous = before.get(id(task))
+        if previous is None or previous == task:
+            continue
+        if previous["id"] != task["id"]:
+            # Its old id names the task it duplicated, so it syncs as a new task
+            task.pop("uid", None)
+            changes.append((None, task))
+        else:
+            changes.append((previous, task))
+    return changes
+
+def repair_projects(user_settings, to_repair, report: Report):
+    """
+    Repairs the projects with the given ids in place, returning
+    (project, changes) pairs to log as sync changes once they are saved.
+    """
+    repaired = []
+    for project in user_settings["projects"]:
+        if project["id"] not in to_repair:
+            continue
+        before = {id(task): copy.deepcopy(task) for task in project["tasks"] if isinstance(task, dict)}
+        for _message, fix in project_problems(project, verify_archive(project["id"], Report(), False)):
+            if fix is not None:
+                report.repair(project["title"], fix())
+        repaired.append((project, _repair_changes(project, before)))
+        # Cached indexes were built from the unrepaired project
+        project["revision"] = project.get("revision", 0) + 1
+    return repaired
+
+def fsck(repair: bool = False):
+    """
+    Verifies the store, repairing it if asked.
+
+    Returns:
+        int: the number of problems found and not repaired or quarantined
+    """
+    report = Report()
+    if not settings.SETTINGS_PATH.exists():
+        print("No settings.json to check.")
+        return 0
+
+    # Projects, keyed by id, to repair once the whole store was read
+    to_repair = set()
+    # Settings problems that rewriting settings.json resolves
+    damaged = 0
+    unchecked = 0
+    with open(settings.SETTINGS_PATH, 'rb') as f:
+        for where, value, error in stream_settings(f):
+            if error is not None:
+                report.problem(f"settings.json {where}", error)
+                if value is None:
+                    damaged += 1
+                    continue
+                # Still readable, rewriting it stores a checksum that matches
+                unchecked += 1
+            if where == "settings":
+                continue
+            if not isinstance(value, dict) or not isinstance(value.get("id"), int):
+                # Loading quarantines it like a damaged project
+                report.problem(f"settings.json {where}", "is not a project with an id")
+                damaged += 1
+                continue
+            title = value.get("title", where)
+            archived_ids = verify_archive(value["id"], report, repair)
+            for message, _fix in project_problems(value, archived_ids):
+                report.problem(f"{title}", message)
+                to_repair.add(value["id"])
+
+    verify_blobs(report, repair)
+
+    if repair and (to_repair or damaged or unchecked):
+        # Damaged projects are quarantined while loading (see settings.load_settings)
+        user_settings = settings.load_settings()
+        repairs = Report()
+        repaired = repair_projects(user_settings, to_repair, repairs)
+        try:
+            settings.save_settings(user_settings, drop_damaged=True)
+        except Exception as e:
+            report.problem("settings.json", f"could not be rewritten, nothing in it was repaired ({e})")
+        else:
+            if sync.sync_dir(user_settings) and any(changes for _project, changes in repaired):
+                try:
+                    for project, changes in repaired:
+                        sync.record_changes(user_settings, project, changes)
+                    # Saved again for the uids given to renumbered tasks
+                    settings.save_settings(user_settings)
+                except Exception as e:
+                    report.problem("sync", f"the repairs could not be logged for other replicas ({e})")
+            report.repaired += repairs.repaired + unchecked
+            report.quarantined += damaged
+            if to_repair:
+                # Undoing an operation recorded before the repairs would find the wrong tasks
+                log = history.load_history()
+                log["undo"].clear()
+                log["redo"].clear()
+                history.save_history()
+
+    color = ansi.GREEN if report.unresolved() == 0 else ansi.RED
+    print(f"{color}{report.problems} problems found, {report.repaired} repaired, {report.quarantined} quarantined.{ansi.RESET}")
+    return report.unresolved()
@@ -0,0 +1,76 @@
+"""
+kb - fuzzy.py
+author: narlock
+
+This file provides type-to-filter fuzzy matching for long lists,
+such as the project picker.
+
+A title matches when the typed characters appear in it in order
+(a subsequence match, case insensitive). Since adding a character
+can only remove matches, each keypress only re-checks the previous
+results, continuing from where each title's match left off. The
+results for every prefix of the query are kept on a stack, so a
+backspace simply pops back to the previous results.
+"""
+
+class FuzzyMatcher:
+    """
+    Incrementally narrows a list of titles as a query is typed.
+
+    Each result is a tuple (title index, first match position,
+    last match position), ordered so that tighter, earlier matches
+    come first.
+    """
+
+    def __init__(self, titles):
+        self.titles = [title.lower() for title in titles]
+        self.query = ""
+        # One result list per prefix of the query, the empty query matches everything
+        self._stack = [[(index, -1, -1) for index in range(len(self.titles))]]
+
+    @property
+    def results(self):
+        return self._stack[-1]
+
+    def indices(self):
+        """
+        Returns the indices of the matching titles, best match first.
+        """
+        return [index for index, _first, _last in self.results]
+
+    def push(self, char: str):
+        """
+        Narrows the results by one typed character.
+        """
+        char = char.lower()
+        titles = self.titles
+        narrowed = []
+        for index, first, last in self.results:
+            position = titles[index].find(char, last + 1)
+            if position != -1:
+                narrowed.append((index, position if first == -1 else first, position))
+
+        # Prefer compact matches that start early, then the original order
+        narrowed.sort(key=lambda result: (result[2] - result[1], result[1], result[0]))
+        self._stack.append(narrowed)
+        self.query += char
+
+    def pop(self):
+        """
+        Removes the last typed character, restoring the previous results.
+        """
+        if len(self._stack) > 1:
+            self._stack.pop()
+            self.query = self.query[:-1]
+
+    def set_query(self, query: str):
+        """
+        Changes the query, reusing the results of the longest common prefix.
+        """
+        common = 0
+        while common < min(len(query), len(self.query)) and query[common].lower() == self.query[common]:
+            common += 1
+        while len(self.query) > common:
+            self.pop()
+        for char in query[common:]:
+            self.push(char)
@@ -0,0 +1,260 @@
+"""
+kb - history.py
+author: narlock
+
+This file controls the undo/redo operation log stored at
+~/Documents/narlock/kb/history.json
+
+Instead of copying the whole settings tree, each mutation records
+a small operation that can be inverted:
+
+    {"op": "update", "project": 0, "task": 4,
+     "before": {"status": "todo"}, "after": {"status": "doing"}}
+    {"op": "insert", "project": 0, "index": 3, "task": {...}}
+    {"op": "remove", "project": 0, "index": 3, "task": {...}}
+    {"op": "archive", "project": 0, "tasks": [[3, {...}], ...]}
+    {"op": "unarchive", "project": 0, "tasks": [[3, {...}], ...]}
+    {"op": "batch", "ops": [...]}
+
+The log keeps at most `undoDepth` operations (see user settings).
+"""
+
+import archive
+import blobs
+import client
+import copy
+import flow
+import hooks
+import json
+import lanes
+import ranks
+import releases
+import settings
+import sparse
+import sync
+import time
+import timeline
+
+DEFAULT_UNDO_DEPTH = 100
+
+# Loaded lazily from disk the first time the log is needed
+_history = None
+
+def history_path():
+    """
+    The history file lives next to settings.json.
+    """
+    return settings.SETTINGS_PATH.parent / "history.json"
+
+def get_undo_depth(user_settings):
+    """
+    Returns the configured maximum number of operations to keep.
+    """
+    return max(0, int(user_settings.get("undoDepth", DEFAULT_UNDO_DEPTH)))
+
+def load_history():
+    """
+    Reads the operation log from disk. A missing or unreadable
+    log simply starts a fresh history.
+    """
+    global _history
+    if _history is None:
+        _history = {"undo": [], "redo": []}
+        try:
+            with open(history_path(), 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            _history["undo"] = list(data.get("undo", []))
+            _history["redo"] = list(data.get("redo", []))
+        except (OSError, ValueError):
+            pass
+    return _history
+
+def save_history():
+    """
+    Persists the operation log so undo survives restarts.
+    """
+    history = load_history()
+    try:
+        history_path().parent.mkdir(parents=True, exist_ok=True)
+        with open(history_path(), 'w', encoding='utf-8') as f:
+            json.dump(history, f)
+    except OSError:
+        # Losing the undo log should never break the board itself
+        pass
+
+def _trim(stack, depth):
+    if len(stack) > depth:
+        del stack[:len(stack) - depth]
+
+def record(user_settings, op):
+    """
+    Records a newly performed operation. Any redo history is
+    discarded since it no longer follows from the current state.
+    """
+    history = load_history()
+    history["undo"].append(copy.deepcopy(op))
+    _trim(history["undo"], get_undo_depth(user_settings))
+    history["redo"].clear()
+    save_history()
+
+def perform(user_settings, op):
+    """
+    Applies a new operation, recording it if it applied. An operation
+    that failed changed nothing, so there is nothing to undo.
+
+    Returns:
+        str: error message if the operation could not be applied
+        None: on success
+    """
+    error = apply(user_settings, op)
+    if error is None:
+        record(user_settings, op)
+    return error
+
+def invert(op):
+    """
+    Returns the operation that reverses `op`.
+    """
+    kind = op["op"]
+    if kind == "update":
+        return {**op, "before": op["after"], "after": op["before"]}
+    elif kind == "insert":
+        return {**op, "op": "remove"}
+    elif kind == "remove":
+        return {**op, "op": "insert"}
+    elif kind == "archive":
+        return {**op, "op": "unarchive"}
+    elif kind == "unarchive":
+        return {**op, "op": "archive"}
+    elif kind == "batch":
+        return {"op": "batch", "ops": [invert(o) for o in reversed(op["ops"])]}
+    raise ValueError(f"Unknown operation '{kind}'")
+
+def apply(user_settings, op, record_flow: bool = True):
+    """
+    Applies an operation to the user settings in memory. Undo and redo
+    pass `record_flow` False, since stepping through the history is no
+    work done on the board and must not show up in `kb stats`.
+
+    Returns:
+        str: error message if the operation no longer applies
+        None: on success
+    """
+    kind = op["op"]
+    if kind == "batch":
+        for position, sub_op in enumerate(op["ops"]):
+            error = apply(user_settings, sub_op, record_flow)
+            if error:
+                # A batch applies whole or not at all
+                for applied in reversed(op["ops"][:position]):
+                    apply(user_settings, invert(applied), record_flow)
+                return error
+        return None
+
+    project = settings.get_project_by_id(user_settings, op["project"])
+    if not project:
+        return "Project not found."
+
+    # (before, after) copies of every task touched by the operation
+    changes = []
+
+    if kind == "update":
+        task = next((t for t in project["tasks"] if t["id"] == op["task"]), None)
+        if not task:
+            return f"Task with id {op['task']} not found."
+        # The task may already hold the new values (edited in place), so
+        # rebuild its previous state from the recorded field diff. A field
+        # changed since without being recorded (such as a respaced rank)
+        # still holds its previous state
+        before = dict(task)
+        for field, value in op["before"].items():
+            if task.get(field) == op["after"].get(field):
+                before[field] = copy.deepcopy(value)
+        for field, value in op["after"].items():
+            task[field] = copy.deepcopy(value)
+        changes.append((before, task))
+    elif kind == "insert":
+        index = min(op["index"], len(project["tasks"]))
+        task = sparse.Task(copy.deepcopy(op["task"]))
+        project["tasks"].insert(index, task)
+        changes.append((None, task))
+    elif kind == "remove":
+        task_id = op["task"]["id"]
+        index = next((i for i, t in enumerate(project["tasks"]) if t["id"] == task_id), None)
+        if index is None:
+            return f"Task with id {task_id} not found."
+        changes.append((project["tasks"].pop(index), None))
+    elif kind == "archive":
+        # Move the tasks from settings.json into cold storage
+        archived_ids = {task["id"] for _index, task in op["tasks"]}
+        project["tasks"][:] = [t for t in project["tasks"] if t["id"] not in archived_ids]
+        archived = [{**copy.deepcopy(task), "status": "archived"} for _index, task in op["tasks"]]
+        archive.append_tasks(project, archived)
+        changes.extend(zip((task for _index, task in op["tasks"]), archived))
+    elif kind == "unarchive":
+        # Bring the tasks back onto the board, hiding their archived copies
+        for index, task in sorted(op["tasks"], key=lambda entry: entry[0]):
+            restored = sparse.Task(copy.deepcopy(task))
+            if restored.get("status") == "archived":
+                restored["status"] = "done"
+            project["tasks"].insert(min(index, len(project["tasks"])), restored)
+            changes.append(({**task, "status": "archived"}, restored))
+        archive.append_restored(project, [task["id"] for _index, task in op["tasks"]])
+
+    # Mark the project as changed so cached summaries are recomputed
+    project["revision"] = project.get("revision", 0) + 1
+    project["modified"] = time.time()
+
+    # Keep the derived data in step with the board
+    for before, after in changes:
+        releases.task_changed(project, before, after)
+    lanes.changes_applied(project, changes)
+    ranks.changes_applied(project, changes)
+    blobs.changes_applied(project, changes)
+    timeline.changes_applied(project, changes)
+    sync.record_changes(user_settings, project, changes)
+    if record_flow:
+        flow.record_op(op)
+    # Run once the change is saved, on the hooks' own threads
+    hooks.emit(user_settings, project, op, changes)
+    return None
+
+def _step(user_settings, source, target, transform, empty_message):
+    history = load_history()
+    if not history[source]:
+        return empty_message
+
+    op = history[source].pop()
+    error = apply(user_settings, transform(op), record_flow=False)
+    if error:
+        # The operation no longer applies, drop it rather than getting stuck
+        save_history()
+        return error
+
+    history[target].append(op)
+    _trim(history[target], get_undo_depth(user_settings))
+    save_history()
+    settings.update_settings(user_settings)
+    return None
+
+@client.remote
+def undo(user_settings):
+    """
+    Reverts the most recent operation.
+
+    Returns:
+        str: error message if nothing could be undone
+        None: on success
+    """
+    return _step(user_settings, "undo", "redo", invert, "Nothing to undo!")
+
+@client.remote
+def redo(user_settings):
+    """
+    Re-applies the most recently undone operation.
+
+    Returns:
+        str: error message if nothing could be redone
+        None: on success
+    """
+    return _step(user_settings, "redo", "undo", lambda op: op, "Nothing to redo!")
@@ -0,0 +1,479 @@
+"""
+kb - hooks.py
+author: narlock
+
+This file controls the hooks run after tasks change, configured per
+project with `kb hooks <board> --add <type> [<target>]`:
+
+    {"id": 0, "title": "kb", "hooks": [
+        {"name": "audit", "type": "audit"},
+        {"name": "webhook", "type": "webhook", "url": "http://127.0.0.1:8787/kb"},
+        {"name": "report", "type": "report", "path": "~/kb-report.md"}], ...}
+
+The built in hook types are
+
+    audit     appends every event to a JSON lines log, by default
+              ~/Documents/narlock/kb/hooks/audit-<project id>.jsonl
+    webhook   POSTs {"events": [...]} as JSON to a url, such as a
+              local stub receiving the board's changes
+    report    rewrites a Markdown report of the board, by default
+              ~/Documents/narlock/kb/hooks/report-<project id>.md
+
+and more are registered with the `hook_type` decorator. Every
+operation applied through history.apply to a project with hooks
+produces one event, holding a copy of each task it touched (long
+text fields stay blob references, see blobs.py):
+
+    {"project": 0, "board": "kb", "revision": 41, "time": 1760865300.1,
+     "op": "update", "changes": [{"id": 4, "before": {...}, "after": {...}}]}
+
+Events are held back, per settings object, until those settings are
+saved to settings.json and dropped if the save fails or the changes
+are reverted, so a hook never sees a change that was not kept. Saved
+events are queued for a small pool of low priority worker threads. Applying an operation only copies the tasks
+it touched; the hooks themselves never run on the thread that made
+the change, so a slow hook never delays a move or create.
+
+Each hook of a project has at most one job waiting in the queue, and
+events arriving while it waits are added to it, so a slow hook is
+handed everything since its last run at once rather than falling
+further behind. A job keeps at most MAX_QUEUED_EVENTS events and the
+oldest are dropped beyond that. A hook runs one job at a time, so it
+sees its events in order. A failed job is retried up to RETRIES
+times, waiting RETRY_DELAY seconds and twice as long after every
+further failure, then dropped.
+
+The number of runs, events, failures, retries, and dropped events,
+and the time spent running and waiting in the queue, are kept for
+every hook in ~/Documents/narlock/kb/hooks/metrics.json and shown by
+`kb hooks <board>`.
+"""
+
+import atexit
+import collections
+import copy
+import json
+import os
+import threading
+import time
+import urllib.request
+from pathlib import Path
+import codec
+import ranks
+import settings
+import sparse
+
+WORKERS = 2
+MAX_QUEUED_EVENTS = 1000
+RETRIES = 3
+RETRY_DELAY = 1
+WEBHOOK_TIMEOUT = 5
+EXIT_WAIT_SECONDS = 5
+
+# hook type -> (function(config, project id, events), field naming its target)
+HOOK_TYPES = {}
+
+def hook_type(name: str, target: str = None):
+    """
+    Registers a hook type. The function is called on a worker thread
+    with the hook's configuration, the project id, and the events
+    since it last ran, and raises to have them retried.
+    """
+    def register(function):
+        HOOK_TYPES[name] = (function, target)
+        return function
+    return register
+
+def hooks_dir():
+    """
+    Hook output and metrics live next to settings.json.
+    """
+    return settings.SETTINGS_PATH.parent / "hooks"
+
+def metrics_path():
+    return hooks_dir() / "metrics.json"
+
+def hook_name(config):
+    return config.get("name", config["type"])
+
+def _output_path(config, default: str):
+    return Path(config["path"]).expanduser() if config.get("path") else hooks_dir() / default
+
+# Built in hooks
+
+@hook_type("audit", "path")
+def audit_log(config, project_id: int, events):
+    """
+    Appends the events to a JSON lines log.
+    """
+    path = _output_path(config, f"audit-{project_id}.jsonl")
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, 'a', encoding='utf-8') as f:
+        f.write("".join(json.dumps(event, separators=codec.COMPACT_SEPARATORS) + "\n" for event in events))
+
+@hook_type("webhook", "url")
+def post_webhook(config, project_id: int, events):
+    """
+    POSTs the events to the hook's url.
+    """
+    request = urllib.request.Request(
+        config["url"],
+        data=json.dumps({"events": events}).encode("utf-8"),
+        headers={"Content-Type": "application/json"},
+        method="POST",
+    )
+    with urllib.request.urlopen(request, timeout=WEBHOOK_TIMEOUT) as response:
+        response.read()
+
+# (project id, hook name) -> {"title", "tasks": {task id: task}}, as of the last report
+_reports = {}
+
+def _load_board(project_id: int):
+    with open(settings.SETTINGS_PATH, 'rb') as f:
+        user_settings = codec.decode(f.read())
+    project = next((p for p in user_settings["projects"] if p["id"] == project_id), {"title": "", "tasks": []})
+    return {"title": project["title"], "tasks": {task["id"]: task for task in project["tasks"] if task.get("status") != "archived"}}
+
+def render_report(board):
+    """
+    Returns the Markdown report of a board: its columns, with their
+    tasks in rank order.
+    """
+    columns = {}
+    for task in board["tasks"].values():
+        columns.setdefault(task.get("status"), []).append(task)
+    lines = [f"# {board['title']}", "", f"Exported {time.strftime('%Y-%m-%d %H:%M:%S')}"]
+    for status in settings.TASK_STATUS_TYPE_OPTIONS:
+        tasks = sorted(columns.get(status, []), key=lambda task: (ranks.rank_of(task), task["id"]))
+        effort = sum(task.get("effort") or 0 for task in tasks)
+        lines += ["", f"## {status} ({len(tasks)} tasks, {effort} effort)"]
+        if tasks:
+            lines.append("")
+            lines += [f"- [{task['id']}] {task.get('title', '')} ({task.get('priority', '')})" for task in tasks]
+    return "\n".join(lines) + "\n"
+
+@hook_type("report", "path")
+def export_report(config, project_id: int, events):
+    """
+    Rewrites the board's report. The board is read from settings.json
+    on the first run and kept up to date from the events after that.
+    """
+    key = (project_id, hook_name(config))
+    board = _reports.get(key)
+    if board is None:
+        # Saved before the events were released, so it already holds them
+        board = _reports[key] = _load_board(project_id)
+    for event in events:
+        board["title"] = event["board"]
+        for change in event["changes"]:
+            after = change["after"]
+            if after is None or after.get("status") == "archived":
+                board["tasks"].pop(change["id"], None)
+            else:
+                board["tasks"][change["id"]] = after
+    path = _output_path(config, f"report-{project_id}.md")
+    path.parent.mkdir(parents=True, exist_ok=True)
+    temp_path = path.with_suffix(".tmp")
+    with open(temp_path, 'w', encoding='utf-8') as f:
+        f.write(render_report(board))
+    os.replace(temp_path, path)
+
+# The worker pool
+
+def _new_metrics(config):
+    return {
+        "type": config["type"], "runs": 0, "events": 0, "failures": 0, "retries": 0, "dropped": 0,
+        "totalSeconds": 0.0, "maxSeconds": 0.0, "lastSeconds": 0.0, "maxWaitSeconds": 0.0,
+        "lastRun": None, "lastError": None,
+    }
+
+def load_metrics():
+    """
+    Returns the saved metrics, keyed by "<project id>/<hook name>".
+    """
+    try:
+        with open(metrics_path(), 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+class _Job:
+    __slots__ = ("key", "config", "events", "attempts", "queued_at", "not_before")
+
+    def __init__(self, key, config):
+        # key: (project id, hook name)
+        self.key = key
+        self.config = config
+        self.events = []
+        self.attempts = 0
+        self.queued_at = time.monotonic()
+        self.not_before = 0
+
+class Pipeline:
+    """
+    Runs the hooks of saved changes on a pool of worker threads.
+    """
+
+    def __init__(self, workers: int = WORKERS):
+        self.workers = workers
+        self.condition = threading.Condition()
+        # id of the settings changed -> (those settings, [(project id,
+        # hook configs, event)]) applied to them but not saved yet. The
+        # settings are kept so their id is not reused while staged
+        self.staged = {}
+        # key -> the job waiting to run, in queue order
+        self.jobs = {}
+        self.order = collections.deque()
+        self.running = set()
+        self.metrics = None
+        self.threads = []
+        self.flushing = False
+        # Held while metrics.json is written
+        self.saving = threading.Lock()
+
+    def stage(self, user_settings, project, event):
+        with self.condition:
+            _settings, events = self.staged.setdefault(id(user_settings), (user_settings, []))
+            events.append((project["id"], list(project["hooks"]), event))
+
+    def discard(self, user_settings):
+        """
+        Forgets the events staged for the settings, such as when their
+        changes were reverted or could not be saved.
+        """
+        with self.condition:
+            self.staged.pop(id(user_settings), None)
+
+    def release(self, user_settings):
+        """
+        Queues the events staged for the settings for their hooks.
+        """
+        with self.condition:
+            _settings, events = self.staged.pop(id(user_settings), (None, []))
+            if not events:
+                return
+            for project_id, configs, event in events:
+                for config in configs:
+                    self._queue((project_id, hook_name(config)), config, [event])
+            if not self.threads:
+                for number in range(self.workers):
+                    thread = threading.Thread(target=self.run, name=f"kb-hooks-{number}", daemon=True)
+                    thread.start()
+                    self.threads.append(thread)
+                atexit.register(self.wait, EXIT_WAIT_SECONDS)
+            self.condition.notify_all()
+
+    def _metric(self, key, config):
+        if self.metrics is None:
+            self.metrics = load_metrics()
+        return self.metrics.setdefault(f"{key[0]}/{key[1]}", _new_metrics(config))
+
+    def _queue(self, key, config, events, front: bool = False):
+        job = self.jobs.get(key)
+        if job is None:
+            job = self.jobs[key] = _Job(key, config)
+            self.order.append(key)
+        if front:
+            job.events[:0] = events
+        else:
+            job.events.extend(events)
+        job.config = config
+        if len(job.events) > MAX_QUEUED_EVENTS:
+            # Shed the oldest rather than make anyone wait for a hook that cannot keep up
+            dropped = len(job.events) - MAX_QUEUED_EVENTS
+            del job.events[:dropped]
+            self._metric(key, config)["dropped"] += dropped
+        return job
+
+    def _next(self, now: float):
+        """
+        Returns the first job that may run now, and the seconds until
+        the next one may if there is none.
+        """
+        delay = None
+        for key in self.order:
+            if key in self.running:
+                continue
+            job = self.jobs[key]
+            if self.flushing or job.not_before <= now:
+                return job, None
+            wait = job.not_before - now
+            delay = wait if delay is None else min(delay, wait)
+        return None, delay
+
+    def run(self):
+        try:
+            # Linux gives every thread its own nice value
+            os.setpriority(os.PRIO_PROCESS, threading.get_native_id(), 19)
+        except (AttributeError, OSError):
+            pass
+        while True:
+            with self.condition:
+                job, delay = self._next(time.monotonic())
+                while job is None:
+                    self.condition.wait(delay)
+                    job, delay = self._next(time.monotonic())
+                del self.jobs[job.key]
+                self.order.remove(job.key)
+                self.running.add(job.key)
+            started = time.monotonic()
+            error = None
+            try:
+                function, _target = HOOK_TYPES[job.config["type"]]
+                function(job.config, job.key[0], job.events)
+            except Exception as e:
+                # A failing hook must never disturb the board
+                error = f"{type(e).__name__}: {e}"
+            with self.condition:
+                self._finished(job, started, error)
+                metrics = copy.deepcopy(self.metrics)
+            # Still running until its metrics are saved, so waiting before exit covers them
+            self._save_metrics(metrics)
+            with self.condition:
+                self.running.discard(job.key)
+                self.condition.notify_all()
+
+    def _finished(self, job, started: float, error):
+        elapsed = time.monotonic() - started
+        metric = self._metric(job.key, job.config)
+        metric["runs"] += 1
+        metric["totalSeconds"] += elapsed
+        metric["lastSeconds"] = elapsed
+        metric["maxSeconds"] = max(metric["maxSeconds"], elapsed)
+        metric["maxWaitSeconds"] = max(metric["maxWaitSeconds"], started - job.queued_at)
+        metric["lastRun"] = time.time()
+        if error is None:
+            metric["events"] += len(job.events)
+            metric["lastError"] = None
+            return
+        metric["failures"] += 1
+        metric["lastError"] = error
+        if job.attempts >= RETRIES:
+            metric["dropped"] += len(job.events)
+            return
+        # Back in front of the events that arrived meanwhile, so they stay in order
+        metric["retries"] += 1
+        retry = self._queue(job.key, job.config, job.events, front=True)
+        retry.attempts = job.attempts + 1
+        retry.queued_at = min(retry.queued_at, job.queued_at)
+        retry.not_before = time.monotonic() + RETRY_DELAY * 2 ** job.attempts
+        self.order.remove(job.key)
+        self.order.appendleft(job.key)
+
+    def _save_metrics(self, metrics):
+        with self.saving:
+            try:
+                hooks_dir().mkdir(parents=True, exist_ok=True)
+                temp_path = metrics_path().with_suffix(".tmp")
+                with open(temp_path, 'w', encoding='utf-8') as f:
+                    json.dump(metrics, f, indent=2)
+                os.replace(temp_path, metrics_path())
+            except OSError:
+                pass
+
+    def wait(self, timeout: float = None):
+        """
+        Waits for the queued events to be handled, retrying failed
+        jobs without delay, such as before exiting.
+        """
+        with self.condition:
+            self.flushing = True
+            self.condition.notify_all()
+            self.condition.wait_for(lambda: not self.jobs and not self.running, timeout)
+            self.flushing = False
+
+_pipeline = Pipeline()
+
+def _task_copy(task):
+    return None if task is None else copy.deepcopy(sparse.strip(task))
+
+def emit(user_settings, project, op, changes):
+    """
+    Records the event of an operation applied to a project of the
+    user settings, for its hooks to receive once those settings are
+    saved. Called by history.apply with the operation's (before, after)
+    task changes.
+    """
+    if not project.get("hooks"):
+        return
+    _pipeline.stage(user_settings, project, {
+        "project": project["id"],
+        "board": project["title"],
+        "revision": project.get("revision", 0),
+        "time": project.get("modified", time.time()),
+        "op": op["op"],
+        "changes": [
+            {"id": (after or before)["id"], "before": _task_copy(before), "after": _task_copy(after)}
+            for before, after in changes
+        ],
+    })
+
+def release(user_settings):
+    """
+    Hands the events of the changes to the user settings just saved
+    to the hooks.
+    """
+    _pipeline.release(user_settings)
+
+def discard(user_settings):
+    """
+    Drops the events of the changes to the user settings that were
+    not saved, so no hook ever hears of them.
+    """
+    _pipeline.discard(user_settings)
+
+def wait(timeout: float = None):
+    _pipeline.wait(timeout)
+
+# Configuration
+
+def add_hook(user_settings, project_title: str, kind: str, target: str = None):
+    """
+    Adds a hook of a registered type to a project, with its target
+    (such as a webhook's url) if given, and saves.
+
+    Returns:
+        str: error message if the hook cannot be added
+        None: on success
+    """
+    project = settings.get_project_by_title(user_settings, project_title)
+    if not project:
+        return "Project not found."
+    if kind not in HOOK_TYPES:
+        return f"Unknown hook type '{kind}'. Valid options: {', '.join(HOOK_TYPES)}"
+    _function, target_field = HOOK_TYPES[kind]
+    config = {"name": kind, "type": kind}
+    if target:
+        config[target_field] = target
+    elif target_field == "url":
+        return f"A {kind} hook needs a url."
+    hooks = project.setdefault("hooks", [])
+    # Hooks of the same type are told apart by a number
+    names = {hook_name(hook) for hook in hooks}
+    number = 2
+    while config["name"] in names:
+        config["name"] = f"{kind}-{number}"
+        number += 1
+    hooks.append(config)
+    settings.update_settings(user_settings)
+    return None
+
+def remove_hook(user_settings, project_title: str, name: str):
+    """
+    Removes a project's hook by name, and saves.
+
+    Returns:
+        str: error message if there is no such hook
+        None: on success
+    """
+    project = settings.get_project_by_title(user_settings, project_title)
+    if not project:
+        return "Project not found."
+    hooks = project.get("hooks", [])
+    if not any(hook_name(hook) == name for hook in hooks):
+        return f"Project '{project_title}' has no hook '{name}'."
+    project["hooks"] = [hook for hook in hooks if hook_name(hook) != name]
+    if not project["hooks"]:
+        del project["hooks"]
+    settings.update_settings(user_settings)
+    return None
@@ -12,8 +12,19 @@ import shutil, os, textwrap, sys, ansi
 import settings
 import signal
 import kbutils
+import client
+import layout
 import task_interface
+import history
+import archive
+import analytics
+import releases
+import lanes
+import ranks
+import sync
+import timeline
 import re
+from datetime import date
 
 def print_kanban_columns(
     todo,
@@ -23,124 +34,104 @@ def print_kanban_columns(
     *,
     min_col_width: int = 15,
     reserve_rows: int = 2,      # free rows for your prompt
-    clear_screen: bool = True
+    clear_screen: bool = True,
+    lanes=None
 ):
     """
     Clear the screen and print a color-coded, boxed Kanban board.
 
+    When `lanes` is given, the board is split into swimlanes instead of
+    showing todo, doing, and done directly. Each lane is a tuple
+    (header text, [todo, doing, done] or None when collapsed), and
+    collapsed lanes only print their header.
+
     • Lines  : red          (ansi.GREY)
     • Todo   : bright blue  (ansi.BRIGHT_BLUE)
     • Doing  : orange       (ansi.ORANGE)
     • Done   : green        (ansi.GREEN)
     """
-    line_color = ansi.GREY
-
     # 0. Clear screen
     if clear_screen:
         os.system("cls" if os.name == "nt" else "clear")
 
-    # 1. Terminal geometry 
-    term_cols, term_rows = shutil.get_terminal_size(fallback=(80, 24))
-    usable_cols = max(term_cols - 4, min_col_width * 3)           # 4 borders (┌││┐)
-    base, extra = divmod(usable_cols, 3)
-    col_widths = [max(min_col_width, base + (1 if i < extra else 0)) for i in range(3)]
-    board_width = sum(col_widths) + 4                             # 3 inner + 2 outer bars
-
-    # 2. Column metadata
-    cols = [
-        ("Todo",  list(todo),  ansi.BRIGHT_BLUE),
-        ("Doing", list(doing), ansi.ORANGE),
-        ("Done",  list(done),  ansi.GREEN),
-    ]
+    # 1. Terminal geometry and width dependent strings (cached until resized)
+    geometry = layout.LAYOUT.board(min_col_width)
+    term_rows = geometry.term_rows
+    col_widths = geometry.col_widths
 
     def fmt(task):
         tid, tname = (task["id"], task["name"]) if isinstance(task, dict) else task
         return f"[{tid}] {tname}"
 
-    # 3. Box‑drawing helpers
-    V = lambda ch="│": f"{line_color}{ch}{ansi.RESET}"
-    H = lambda n:       f"{line_color}{'─'*n}{ansi.RESET}"
-    def join_h(parts, mid):
-        return f"{line_color}{mid}{ansi.RESET}".join(parts)
-
-    # 3a. Top border: ┌──┬──┬──┐
-    top_border = (
-        V("┌") +
-        join_h([H(w) for w in col_widths], "┬") +
-        V("┐")
-    )
-
-    # 3b. Mid border (under header): ├──┼──┼──┤
-    mid_border = (
-        V("├") +
-        join_h([H(w) for w in col_widths], "┼") +
-        V("┤")
-    )
-
-    # Vertical separator used inside rows
-    V_SEP = V("│")
-
-    # 4. Collect all lines
+    def task_rows(columns):
+        wrapped_cols = []
+        for tasks, w in zip(columns, col_widths):
+            cell_lines = []
+            for t in tasks:
+                cell_lines.extend(textwrap.wrap(fmt(t), width=w) or [""])
+            wrapped_cols.append(cell_lines)
+
+        max_rows = max(len(c) for c in wrapped_cols)
+        return [geometry.task_row(c[i] if i < len(c) else "" for c in wrapped_cols) for i in range(max_rows)]
+
+    # 2. Collect all lines
     lines = []
 
-    # 4a. Project title + full‑width red rule
+    # 2a. Project title, top border, header row (column titles) and mid border
     if project_title:
-        centered_title = project_title.center(board_width)
-        lines.append(f"{ansi.RED}{ansi.BOLD}{centered_title}{ansi.RESET}")
-        lines.append(top_border)
+        lines.append(geometry.title_row(project_title))
+    lines.extend([geometry.top_border, geometry.header_row, geometry.mid_border])
+
+    # 2b. Task rows (wrapped, color‑safe), lane by lane when grouped
+    if lanes is None:
+        lines.extend(task_rows((todo, doing, done)))
     else:
-        # still draw top border even if no title
-        lines.append(top_border)
-
-    # 4b. Header row (column titles)
-    header_cells = [
-        f"{color}{title.center(w)}{ansi.RESET}"
-        for (title, _tasks, color), w in zip(cols, col_widths)
-    ]
-    header_row = V_SEP + V_SEP.join(header_cells) + V_SEP
-    lines.extend([header_row, mid_border])
-
-    # 4c. Task rows (wrapped, color‑safe)
-    wrapped_cols = []
-    for (_title, tasks, _color), w in zip(cols, col_widths):
-        cell_lines = []
-        for t in tasks:
-            cell_lines.extend(textwrap.wrap(fmt(t), width=w) or [""])
-        wrapped_cols.append(cell_lines)
-
-    max_rows = max(len(c) for c in wrapped_cols)
-    for i in range(max_rows):
-        row_cells = []
-        for col_idx, (_title, _tasks, color) in enumerate(cols):
-            raw = wrapped_cols[col_idx][i] if i < len(wrapped_cols[col_idx]) else ""
-            raw = raw[:col_widths[col_idx]]
-            padding = " " * (col_widths[col_idx] - len(raw))
-            row_cells.append(f"{raw}{ansi.RESET}{padding}")
-        lines.append(V_SEP + V_SEP.join(row_cells) + V_SEP)
-
-    # 4d. Blank padding rows so borders reach bottom
+        for index, (header, columns) in enumerate(lanes):
+            if index:
+                lines.append(geometry.mid_border)
+            lines.append(geometry.lane_row(header, ansi.BOLD))
+            # Collapsed lanes are never wrapped or laid out
+            if columns is not None:
+                lines.extend(task_rows(columns))
+
+    # 2c. Blank padding rows so borders reach bottom
     visible = len(lines)
     pad_needed = max(0, term_rows - reserve_rows - visible - 1)   # -1 for bottom border
-    blank_cells = [" " * w for w in col_widths]
-    empty_row = V_SEP + V_SEP.join(blank_cells) + V_SEP
-    lines.extend([empty_row] * pad_needed)
-
-    # 4e. Bottom border: └──┴──┴──┘
-    bottom_border = (
-        V("└") +
-        join_h([H(w) for w in col_widths], "┴") +
-        V("┘")
-    )
-    lines.append(bottom_border)
-
-    # 5. Print in one shot
-    sys.stdout.write("\n".join(lines))
+    lines.extend([geometry.empty_row] * pad_needed)
+
+    # 2d. Bottom border: └──┴──┴──┘
+    lines.append(geometry.bottom_border)
+
+    # 3. Print in one shot, only switching colors where they change. Rows
+    # end with "\r\n" so a repaint after a resize also lines up while the
+    # terminal is in raw mode.
+    sys.stdout.write(layout.render_frame(lines))
     sys.stdout.flush()
 
-def display_kanban(user_settings, project_title: str):
+def lane_header(index: int, field: str, key, counts, collapsed: bool):
+    todo, doing, done = counts
+    arrow = "▸" if collapsed else "▾"
+    return f" {arrow} {index + 1}. {lanes.label(field, key)}  ({todo} todo · {doing} doing · {done} done)"
+
+def display_kanban(user_settings, project_title: str, lane_view=None):
     """
-    Displays the kanban board based on the input project_title
+    Displays the kanban board based on the input project_title.
+
+    `lane_view` groups the board into swimlanes: {"field": a lanes.LANE_FIELDS
+    entry or None, "collapsed": set of collapsed lane keys}.
     """
+    if lane_view and lane_view["field"]:
+        project = settings.get_project_by_title(user_settings, project_title)
+        if project:
+            field = lane_view["field"]
+            index = lanes.lane_index(project, field)
+            board_lanes = []
+            for number, key in enumerate(index.keys()):
+                collapsed = key in lane_view["collapsed"]
+                header = lane_header(number, field, key, index.counts(key), collapsed)
+                board_lanes.append((header, None if collapsed else index.columns(key)))
+            print_kanban_columns([], [], [], project_title, lanes=board_lanes)
+            return
 
     # Obtain task map
     task_map = settings.generate_task_map_for_project(user_settings, project_title)
@@ -155,12 +146,32 @@ def display_interactive_kanban(user_settings, project_title):
     displayable_error = ""
     mode = "CMD"
     input_text = ""
+    lane_view = {"field": None, "collapsed": set()}
+    # The menus may have only read the project summaries
+    settings.load_projects(user_settings, [p["id"] for p in user_settings["projects"] if p["title"] == project_title])
+    # Opening a board is what upgrades an older project
+    displayable_error = settings.upgrade_project(user_settings, project_title) or ""
+
+    def repaint():
+        display_kanban(user_settings, project_title, lane_view)
+        kbutils.print_bottom_input_with_mode_and_error(input_text, mode, displayable_error)
 
     while True:
-        display_kanban(user_settings, project_title)
-        
-        kbutils.print_bottom_input_with_mode_and_error(input_text, mode, displayable_error)
-        key = kbutils.get_keypress()
+        # Pick up changes other clients made through the kb daemon
+        client.sync(user_settings)
+        # And changes other machines logged to the shared sync directory
+        sync.pull(user_settings)
+        repaint()
+        # Respace columns whose rank keys grew too long once no key has
+        # been pressed for a while, so it never holds up a keypress
+        if ranks.rebalance_due() and not kbutils.key_waiting(ranks.IDLE_SECONDS):
+            for project_id, status in ranks.pending_rebalances():
+                settings.rebalance_ranks(user_settings, project_id, status)
+            repaint()
+
+        # Redraw right away if the terminal is resized while waiting for a key
+        with layout.repaint_on_resize(repaint):
+            key = kbutils.get_keypress()
 
         # TODO once more modes are implemented, add checks, but for now it is just CMD
         """
@@ -174,7 +185,17 @@ def display_interactive_kanban(user_settings, project_title):
                         - You can create subtasks for the task.
                     "create" will open the create task interface.
                     "backlog" will show a list of backlog items (those not in the view)
-                    "complete" will delete all items that are in the done column.
+                    "complete" will archive all items that are in the done column.
+                    "undo" will revert the last change made to the board.
+                    "redo" will re-apply the last change that was undone.
+                    "stats" will show flow analytics for the board.
+                    "releases" will show effort and progress for each fixVersion.
+                    "rank 3 top" will move task 3 to the top of its column. Also
+                        "rank 3 bottom", "rank 3 before 5", and "rank 3 after 5".
+                    "lanes priority" will group the board into swimlanes by priority,
+                        type, tag, or fixVersion. "lanes off" removes them.
+                    "fold 2" will collapse or expand the second swimlane, "fold all" all of them.
+                    "timeline" will show when each task was worked on.
         """
         if key == kbutils.EXIT_CMD:
             print(f"{ansi.RED}Exiting Kanban CLI...{ansi.RESET}")
@@ -236,28 +257,102 @@ def display_interactive_kanban(user_settings, project_title):
                     displayable_error = "There are no backlog tasks!"
             elif cmd == "archive" or cmd == "arc":
                 # If there are no items archived, don't display the interface.
-                archived_items_length = len(settings.get_kanban_tasks_by_status(user_settings, project_title, "archived"))
-                if (archived_items_length > 0):
+                project = settings.get_project_by_title(user_settings, project_title)
+                if project and archive.has_archive(project["id"]):
                     display_archive(user_settings, project_title)
                 else:
                     displayable_error = "There are no archived tasks!"
             elif cmd == "complete":
                 settings.archive_completed_kanban_tasks(user_settings, project_title)
+            elif cmd == "stats":
+                displayable_error = display_stats(user_settings, project_title) or ""
+            elif cmd == "releases" or cmd == "rel":
+                displayable_error = display_releases(user_settings, project_title) or ""
+            elif cmd == "timeline" or cmd == "tl":
+                displayable_error = display_timeline(user_settings, project_title) or ""
+            elif cmd == "rank":
+                positions = settings.RANK_POSITIONS
+                if (len(args) < 2 or not args[0].isdigit() or args[1] not in positions
+                        or (args[1] in ("before", "after") and (len(args) < 3 or not args[2].isdigit()))):
+                    displayable_error = "Usage: rank <index> top|bottom|before <index>|after <index>"
+                else:
+                    other_id = int(args[2]) if len(args) > 2 else None
+                    error = settings.rank_kanban_task(user_settings, project_title, int(args[0]), args[1], other_id)
+                    if error:
+                        displayable_error = error
+            elif cmd == "lanes":
+                displayable_error = set_lanes(lane_view, args) or ""
+            elif cmd == "fold":
+                displayable_error = fold_lanes(user_settings, project_title, lane_view, args) or ""
+            elif cmd == "undo":
+                error = history.undo(user_settings)
+                if error:
+                    displayable_error = error
+            elif cmd == "redo":
+                error = history.redo(user_settings)
+                if error:
+                    displayable_error = error
             elif cmd == "home":
                 main.interactive_menu(user_settings)
             elif cmd == "quit":
                 os.system('clear')
                 sys.exit(0)
             elif cmd.isdigit():
-                # TODO: open view for this task
-                task_id = int(cmd)
-                displayable_error = "View interface not implemented!"
+                displayable_error = task_interface.display_task_view(user_settings, project_title, int(cmd)) or ""
             else:
                 displayable_error = f"Invalid command input: {input_text}"
 
             # Reset input text
             input_text = ''
 
+def set_lanes(lane_view, args):
+    """
+    Groups the board into swimlanes by a field, or removes them with "off".
+
+    Returns:
+        str: error message for an invalid field
+        None: on success
+    """
+    fields = {field.lower(): field for field in lanes.LANE_FIELDS}
+    if len(args) != 1 or (args[0].lower() not in fields and args[0].lower() != "off"):
+        return f"Usage: lanes <{'|'.join(lanes.LANE_FIELDS)}|off>"
+
+    lane_view["field"] = fields.get(args[0].lower())
+    lane_view["collapsed"] = set()
+    return None
+
+def fold_lanes(user_settings, project_title, lane_view, args):
+    """
+    Collapses or expands a swimlane by its number, or every lane with "all".
+
+    Returns:
+        str: error message if the lane does not exist
+        None: on success
+    """
+    if not lane_view["field"]:
+        return "The board has no lanes. Group it with `lanes <field>` first."
+    if len(args) != 1 or not (args[0].isdigit() or args[0] == "all"):
+        return "Usage: fold <lane number|all>"
+
+    project = settings.get_project_by_title(user_settings, project_title)
+    if not project:
+        return "Project not found."
+    keys = lanes.lane_index(project, lane_view["field"]).keys()
+
+    if args[0] == "all":
+        # Collapse every lane, or expand them all if they already are
+        if set(keys) <= lane_view["collapsed"]:
+            lane_view["collapsed"] = set()
+        else:
+            lane_view["collapsed"] = set(keys)
+        return None
+
+    number = int(args[0])
+    if not 1 <= number <= len(keys):
+        return f"There is no lane {number}."
+    lane_view["collapsed"] ^= {keys[number - 1]}
+    return None
+
 def display_backlog(user_settings, project_title):
     """
     Displays the backlog and allows the user to move items
@@ -308,7 +403,13 @@ def display_backlog(user_settings, project_title):
         elif key in kbutils.KEY_ENTER:
             command_parts = input_text.strip().split()
             if not command_parts:
-                displayable_error = "View interface not implemented!"
+                # Open the selected task
+                displayable_error = task_interface.display_task_view(user_settings, project_title, backlog_task_id_list[selected_index]) or ""
+                backlog_tasks = settings.get_kanban_tasks_by_status(user_settings, project_title, "backlog")
+                backlog_task_id_list = settings.get_backlog_task_ids(user_settings, project_title)
+                if not backlog_tasks:
+                    return
+                selected_index = min(selected_index, len(backlog_tasks) - 1)
                 continue
 
             cmd = command_parts[0]
@@ -341,11 +442,307 @@ def display_backlog(user_settings, project_title):
             displayable_error = ""
             input_text += key
 
-def display_archive():
+def display_archive(user_settings, project_title):
+    """
+    Displays the archived tasks of a project, newest first, one
+    page at a time. Archive segments are only read as pages are
+    requested, so opening the archive stays fast for old projects.
+
+    UP and DOWN move between tasks, LEFT and RIGHT move between pages.
+    Supported commands:
+        "search <text>" only shows tasks matching the text.
+        "clear" shows all archived tasks again.
+        "restore <index>" moves the task back to the done column.
+    """
+    project = settings.get_project_by_title(user_settings, project_title)
+    if not project:
+        return
+
+    reader = archive.ArchiveReader(project["id"])
+    search_results = None
+    search_text = ""
+
+    mode = "CMD"
+    input_text = ""
+    displayable_error = ""
+    selected_index = 0
+    page_index = 0
+
+    while True:
+        # Leave room for the title, hint, and the input row
+        _columns, rows = layout.LAYOUT.size()
+        page_size = max(1, rows - 5)
+
+        if search_results is None:
+            page = reader.page(page_index, page_size)
+            has_next_page = len(reader.page(page_index + 1, page_size)) > 0
+        else:
+            start = page_index * page_size
+            page = search_results[start:start + page_size]
+            has_next_page = len(search_results) > start + page_size
+        selected_index = min(selected_index, max(0, len(page) - 1))
+
+        os.system('clear')
+        title = f"{project_title} Archived Tasks (page {page_index + 1})"
+        if search_results is not None:
+            title += f" matching '{search_text}'"
+        print(f"{ansi.ORANGE}{ansi.BOLD}{title}{ansi.RESET}")
+        print(f"{ansi.GREY}Use `search <text>`, `clear`, or `restore <index>`. ←→ change page.{ansi.RESET}\n")
+
+        if not page:
+            print(f"{ansi.GREY}No archived tasks to show.{ansi.RESET}")
+        for index, task in enumerate(page):
+            if index == selected_index:
+                print(f"{ansi.BRIGHT_GREEN}{ansi.BOLD}→ [{task['id']}] {task['title']}{ansi.RESET}")
+            else:
+                print(f"{ansi.GREEN}[{task['id']}] {task['title']}{ansi.RESET}")
+
+        # Await user input
+        kbutils.print_bottom_input_with_mode_and_error(input_text, mode, displayable_error)
+        key = kbutils.get_keypress()
+
+        if key == kbutils.EXIT_CMD:
+            return
+        elif key == kbutils.KEY_UP and page:
+            displayable_error = ""
+            selected_index = (selected_index - 1) % len(page)
+        elif key == kbutils.KEY_DOWN and page:
+            displayable_error = ""
+            selected_index = (selected_index + 1) % len(page)
+        elif key == kbutils.KEY_LEFT:
+            displayable_error = ""
+            if page_index > 0:
+                page_index -= 1
+                selected_index = 0
+        elif key == kbutils.KEY_RIGHT:
+            displayable_error = ""
+            if has_next_page:
+                page_index += 1
+                selected_index = 0
+        elif key in kbutils.KEY_ENTER:
+            command_parts = input_text.strip().split()
+            input_text = ""
+            if not command_parts:
+                continue
+
+            cmd = command_parts[0]
+            args = command_parts[1:]
+
+            if cmd == "search":
+                if len(args) < 1:
+                    displayable_error = "Usage: search <text>"
+                else:
+                    search_text = " ".join(args)
+                    search_results = reader.search(search_text)
+                    page_index = 0
+                    selected_index = 0
+            elif cmd == "clear":
+                search_results = None
+                search_text = ""
+                page_index = 0
+                selected_index = 0
+            elif cmd == "restore":
+                if len(args) < 1 or not args[0].isdigit():
+                    displayable_error = "Usage: restore <index>"
+                    continue
+
+                task_id = int(args[0])
+                task = reader.get(task_id)
+                if task is None:
+                    displayable_error = f"Archived task with id {task_id} not found."
+                    continue
+
+                error = settings.restore_archived_task(user_settings, project_title, task)
+                if error:
+                    displayable_error = error
+                else:
+                    reader.forget(task_id)
+                    if search_results is not None:
+                        search_results = [t for t in search_results if t["id"] != task_id]
+            else:
+                displayable_error = f"Invalid command: {cmd}!"
+        elif key in kbutils.KEY_BACKSPACE:
+            displayable_error = ""
+            input_text = input_text[:-1]
+        elif re.fullmatch(kbutils.STR_REGEX, key):
+            displayable_error = ""
+            input_text += key
+
+def display_stats(user_settings, project_title):
     """
-    TODO
+    Displays the flow analytics chart for the project until a
+    key is pressed.
+
+    Returns:
+        str: error message if the analytics could not be computed
+        None: after the chart was shown
+    """
+    project = settings.get_project_by_title(user_settings, project_title)
+    if not project:
+        return "Project not found."
+
+    try:
+        metrics = analytics.project_flow(project["id"])
+    except RuntimeError as e:
+        return str(e)
+
+    columns, _rows = layout.LAYOUT.size()
+    os.system('clear')
+    print(analytics.format_report(project_title, metrics, columns))
+    print(f"\n{ansi.GREY}Press any key to return to the board...{ansi.RESET}", end="", flush=True)
+    kbutils.get_keypress()
+
+def display_releases(user_settings, project_title):
+    """
+    Displays the rollup of each fixVersion in the project: effort,
+    task counts by status, checklist completion, and a burndown of
+    the remaining effort. Shown until a key is pressed.
+
+    Returns:
+        str: error message if the project does not exist
+        None: after the releases were shown
     """
-    pass
+    project = settings.get_project_by_title(user_settings, project_title)
+    if not project:
+        return "Project not found."
+
+    project_releases = releases.ensure(project)
+
+    os.system('clear')
+    print(f"{ansi.ORANGE}{ansi.BOLD}{project_title} Releases{ansi.RESET}\n")
+    if not project_releases:
+        print(f"{ansi.GREY}There are no tasks in this project.{ansi.RESET}")
+
+    for version in sorted(project_releases):
+        release = project_releases[version]
+        counts = " · ".join(
+            f"{status} {count}" for status, count in sorted(release["statusCounts"].items())
+        )
+        burndown = analytics.sparkline([remaining for _day, remaining in release["burndown"]])
+        print(f"{ansi.BRIGHT_GREEN}{ansi.BOLD}{version or '(no fixVersion)'}{ansi.RESET}  "
+              f"{release['tasks']} tasks, effort {release['effort']} "
+              f"({release['remainingEffort']} remaining), "
+              f"checklist {releases.checklist_percent(release):.0f}%")
+        print(f"  {ansi.GREY}{counts}{ansi.RESET}  burndown {ansi.GREEN}{burndown}{ansi.RESET}\n")
+
+    print(f"{ansi.GREY}Press any key to return to the board...{ansi.RESET}", end="", flush=True)
+    kbutils.get_keypress()
+
+def display_timeline(user_settings, project_title):
+    """
+    Displays the spans of the project's tasks over a window of days,
+    one row per task. Only the tasks overlapping the window are looked
+    up in the timeline index (see timeline.py), and only the rows that
+    fit the terminal are drawn.
+
+    LEFT and RIGHT move the window a week, UP and DOWN scroll the tasks.
+    Supported commands:
+        "goto <day>" moves the window to a date or ISO week (2025-W32).
+        "today" moves the window back to today.
+
+    Returns:
+        str: error message if the project does not exist
+        None: when the user leaves the timeline
+    """
+    project = settings.get_project_by_title(user_settings, project_title)
+    if not project:
+        return "Project not found."
+
+    mode = "CMD"
+    input_text = ""
+    displayable_error = ""
+    top = 0
+    state = {"first": None, "count": 0}
+
+    def window():
+        columns, rows = layout.LAYOUT.size()
+        days = max(7, columns - timeline.LABEL_WIDTH)
+        # Rows left for tasks below the title, hint, and date rows, and above the input row
+        return days, max(1, rows - 6)
+
+    def show_day(day: int):
+        # Days to come are mostly empty, so today sits two thirds across
+        days, _height = window()
+        state["first"] = day - days * 2 // 3
+
+    def repaint():
+        days, height = window()
+        index = timeline.timeline_index(project)
+        rows, state["count"] = timeline.viewport_rows(index, state["first"], days, top, height)
+        last = state["first"] + days - 1
+        title = (f"{project_title} Timeline {timeline.format_day(state['first'])} to "
+                 f"{timeline.format_day(last)} ({state['count']} tasks)")
+        frame = [
+            [(ansi.ORANGE + ansi.BOLD, title)],
+            [(ansi.GREY, "Use `goto <day>` or `today`. ←→ move a week, ↑↓ scroll.")],
+            [],
+        ] + rows
+        if state["count"] == 0:
+            frame.append([(ansi.GREY, "No tasks were worked on in these days.")])
+        sys.stdout.write("\033[H\033[2J" + layout.render_frame(frame))
+        paint_input()
+
+    def paint_input():
+        kbutils.print_bottom_input_with_mode_and_error(input_text, mode, displayable_error)
+
+    show_day(date.today().toordinal())
+    repaint()
+
+    while True:
+        with layout.repaint_on_resize(repaint):
+            key = kbutils.get_keypress()
+
+        if key == kbutils.EXIT_CMD:
+            return None
+        elif key == kbutils.KEY_LEFT:
+            state["first"] -= 7
+            top = 0
+        elif key == kbutils.KEY_RIGHT:
+            state["first"] += 7
+            top = 0
+        elif key == kbutils.KEY_UP:
+            top = max(0, top - 1)
+        elif key == kbutils.KEY_DOWN:
+            _days, height = window()
+            if top + height >= state["count"]:
+                continue
+            top += 1
+        elif key in kbutils.KEY_ENTER:
+            command_parts = input_text.strip().split()
+            input_text = ""
+            displayable_error = ""
+            if not command_parts:
+                paint_input()
+                continue
+
+            cmd = command_parts[0]
+            args = command_parts[1:]
+
+            if cmd == "goto":
+                try:
+                    show_day(timeline.parse_day(args[0]))
+                    top = 0
+                except (IndexError, ValueError):
+                    displayable_error = "Usage: goto <YYYY-MM-DD|YYYY-Www>"
+            elif cmd == "today":
+                show_day(date.today().toordinal())
+                top = 0
+            else:
+                displayable_error = f"Invalid command: {cmd}!"
+        elif key in kbutils.KEY_BACKSPACE:
+            displayable_error = ""
+            input_text = input_text[:-1]
+            paint_input()
+            continue
+        elif re.fullmatch(kbutils.STR_REGEX, key):
+            displayable_error = ""
+            input_text += key
+            paint_input()
+            continue
+        else:
+            continue
+        # The window moved or a command ran
+        repaint()
 
 def handle_exit(signum, frame):
     """
@@ -1,10 +1,11 @@
-import shutil
+import select
 import sys
 import termios
 import tty
 import re
 import os
 import ansi
+import layout
 
 # Regex to remove ANSI escape sequences
 ANSI_ESCAPE = re.compile(r'\x1B[@-_][0-?]*[ -/]*[@-~]')
@@ -15,6 +16,8 @@ STR_REGEX = r'^[A-Za-z0-9\s\-\_\.\$\{\}\!\@\#\%\^\&\*\(\)]+$'
 # Keybindings
 KEY_UP = "\x1b[A"
 KEY_DOWN = "\x1b[B"
+KEY_RIGHT = "\x1b[C"
+KEY_LEFT = "\x1b[D"
 KEY_ENTER = ('\r', '\n')
 KEY_BACKSPACE = ('\x08', '\x7f')
 KEY_ESC = "\x1b"
@@ -24,7 +27,7 @@ def strip_ansi(text):
     return ANSI_ESCAPE.sub('', text)
 
 def print_centered(text):
-    columns, rows = shutil.get_terminal_size()
+    columns, rows = layout.LAYOUT.size()
 
     # Split into lines
     lines = text.splitlines()
@@ -45,39 +48,56 @@ def print_centered(text):
         x_padding = max(0, (columns // 2) - (len(visible_line) // 2))
         print(" " * x_padding + line)
 
+def print_at(row: int, text: str):
+    """
+    Replaces one row of the screen, leaving the rest as it is.
+    """
+    print(f"\033[{row};1H\033[2K{text}{ansi.RESET}", end="", flush=True)
+
 def print_bottom_input(input_text):
-    # Get terminal size
-    columns, height = shutil.get_terminal_size()
+    # Get terminal size (cached until the terminal is resized)
+    columns, height = layout.LAYOUT.size()
 
     # Move to the bottom row, column 1
-    print(f"\033[{height};1H", end="")  # Position cursor
+    print(f"\033[{height};1H\033[2K", end="")  # Position cursor, clear the row
     print(f"{ansi.RESET}>> {input_text}{ansi.RESET}", end="", flush=True)
 
 def print_bottom_input_with_error(input_text, error):
-    # Get terminal size
-    columns, height = shutil.get_terminal_size()
+    # Get terminal size (cached until the terminal is resized)
+    columns, height = layout.LAYOUT.size()
 
     # Add space to error if applicable
     if error:
         error = f"{error} "
 
     # Move to the bottom row, column 1
-    print(f"\033[{height};1H", end="")  # Position cursor
+    print(f"\033[{height};1H\033[2K", end="")  # Position cursor, clear the row
     print(f"{ansi.RED}{error}{ansi.RESET}>> {input_text}{ansi.RESET}", end="", flush=True)
 
 
 def print_bottom_input_with_mode_and_error(input_text, mode, error):
-    # Get terminal size
-    columns, height = shutil.get_terminal_size()
+    # Get terminal size (cached until the terminal is resized)
+    columns, height = layout.LAYOUT.size()
 
     # Add space to error if applicable
     if error:
         error = f"{error} "
 
     # Move to the bottom row, column 1
-    print(f"\033[{height};1H", end="")  # Position cursor
+    print(f"\033[{height};1H\033[2K", end="")  # Position cursor, clear the row
     print(f"{ansi.RED}{error}{ansi.RESET}{mode} >> {input_text}{ansi.RESET}", end="", flush=True)
 
+def key_waiting(timeout: float):
+    """
+    Returns whether a keypress arrives within `timeout` seconds,
+    without reading it.
+    """
+    try:
+        ready, _, _ = select.select([sys.stdin], [], [], timeout)
+    except (OSError, ValueError):
+        return True
+    return bool(ready)
+
 def get_keypress():
     """
     Reads a single keypress from the user without requiring Enter.
@@ -0,0 +1,148 @@
+"""
+kb - lanes.py
+author: narlock
+
+This file maintains the secondary indexes behind swimlanes, which
+split the board into horizontal lanes grouped by one task field:
+
+    priority, type, tag, or fixVersion
+
+An index maps every lane to the board tasks in it, column by column:
+
+    {"high": {"todo": {4: task, 9: task}, "doing": {...}, "done": {...}}}
+
+Indexes are kept in memory only. Each one is built the first time a
+board is grouped by its field, and afterwards every operation applied
+through history.apply moves just the tasks it touched, so lane
+membership and lane counts never require a scan of the board. A task
+with several tags appears in the lane of each tag.
+"""
+
+import ranks
+import settings
+
+LANE_FIELDS = ["priority", "type", "tag", "fixVersion"]
+BOARD_STATUSES = ("todo", "doing", "done")
+NO_LANE = ""
+
+# (project id, field) -> LaneIndex
+_indexes = {}
+
+class LaneIndex:
+    """
+    The tasks of one project's board grouped by one field.
+    """
+
+    def __init__(self, project, field: str):
+        self.field = field
+        self.revision = project.get("revision", 0)
+        self.lanes = {}
+        for task in project.get("tasks", []):
+            self._add(task)
+
+    def _keys(self, task):
+        if self.field == "tag":
+            return list(dict.fromkeys(task.get("tags") or [])) or [NO_LANE]
+        return [task.get(self.field) or NO_LANE]
+
+    def _add(self, task):
+        status = task.get("status")
+        if status not in BOARD_STATUSES:
+            return
+        for key in self._keys(task):
+            lane = self.lanes.setdefault(key, {s: {} for s in BOARD_STATUSES})
+            lane[status][task["id"]] = task
+
+    def _remove(self, task):
+        status = task.get("status")
+        if status not in BOARD_STATUSES:
+            return
+        for key in self._keys(task):
+            lane = self.lanes.get(key)
+            if lane is None:
+                continue
+            lane[status].pop(task["id"], None)
+            if not any(lane.values()):
+                del self.lanes[key]
+
+    def task_changed(self, before, after):
+        if before is not None:
+            self._remove(before)
+        if after is not None:
+            self._add(after)
+
+    def keys(self):
+        """
+        Returns the lane keys in display order, tasks without a value last.
+        """
+        if self.field == "priority":
+            order = list(reversed(settings.TASK_PRIORITY_TYPE_OPTIONS))
+        elif self.field == "type":
+            order = settings.TASK_TYPE_OPTIONS
+        else:
+            order = []
+        rank = {key: index for index, key in enumerate(order)}
+        return sorted(self.lanes, key=lambda key: (key == NO_LANE, rank.get(key, len(rank)), str(key)))
+
+    def counts(self, key):
+        """
+        Returns the number of tasks in each column of a lane.
+        """
+        lane = self.lanes.get(key, {})
+        return [len(lane.get(status, ())) for status in BOARD_STATUSES]
+
+    def columns(self, key):
+        """
+        Returns the (id, title) cards of a lane's todo, doing, and done
+        columns, in rank order.
+        """
+        lane = self.lanes.get(key, {})
+        return [
+            [(task["id"], task["title"]) for task in sorted(lane.get(status, {}).values(), key=ranks.rank_of)]
+            for status in BOARD_STATUSES
+        ]
+
+def label(field: str, key):
+    """
+    Returns the text shown for a lane.
+    """
+    if key == NO_LANE:
+        return f"No {field}"
+    return str(key)
+
+def lane_index(project, field: str):
+    """
+    Returns the project's index for a field, building it if it is
+    missing or the project was changed without going through
+    history.apply (such as by another client of the kb daemon).
+    """
+    cache_key = (project["id"], field)
+    index = _indexes.get(cache_key)
+    if index is None or index.revision != project.get("revision", 0):
+        index = LaneIndex(project, field)
+        _indexes[cache_key] = index
+    return index
+
+def invalidate(project_id: int):
+    """
+    Drops the project's indexes, such as after reloading it from disk.
+    """
+    for key in [key for key in _indexes if key[0] == project_id]:
+        del _indexes[key]
+
+def changes_applied(project, changes):
+    """
+    Updates the project's indexes for the (before, after) task changes
+    of one operation. Must be called after the project's revision has
+    been bumped for that operation.
+    """
+    revision = project.get("revision", 0)
+    for (project_id, field), index in list(_indexes.items()):
+        if project_id != project["id"]:
+            continue
+        if index.revision != revision - 1:
+            del _indexes[(project_id, field)]
+            continue
+        for before, after in changes:
+            index.task_changed(before, after)
+        index.revision = revision
@@ -0,0 +1,197 @@
+"""
+kb - layout.py
+author: narlock
+
+This file caches the terminal geometry and every string that only
+depends on the terminal width (column widths, box borders, header
+and blank rows) so frames do not rebuild them on every keypress.
+
+The cache is only invalidated by SIGWINCH. When the terminal is
+resized while a view is waiting for a key, the layout is rebuilt
+once and the view's repaint callback redraws it immediately.
+
+Frames are built as rows of (style, text) runs and written with
+render_frame, which only emits an escape sequence when the style
+changes, instead of wrapping every glyph in its own color and reset.
+"""
+
+import shutil
+import signal
+from contextlib import contextmanager
+from functools import lru_cache
+import ansi
+
+LINE_COLOR = ansi.GREY
+DEFAULT_STYLE = ""
+BOARD_COLUMNS = [
+    ("Todo", ansi.BRIGHT_BLUE),
+    ("Doing", ansi.ORANGE),
+    ("Done", ansi.GREEN),
+]
+
+class BoardGeometry:
+    """
+    Width dependent pieces of the boxed kanban board, kept as rows of
+    (style, text) runs for render_frame.
+    """
+
+    def __init__(self, term_cols: int, term_rows: int, min_col_width: int):
+        column_count = len(BOARD_COLUMNS)
+        usable_cols = max(term_cols - (column_count + 1), min_col_width * column_count)
+        base, extra = divmod(usable_cols, column_count)
+
+        self.term_cols = term_cols
+        self.term_rows = term_rows
+        self.col_widths = [max(min_col_width, base + (1 if i < extra else 0)) for i in range(column_count)]
+        self.board_width = sum(self.col_widths) + column_count + 1
+
+        def border(left, mid, right):
+            return [(LINE_COLOR, left + mid.join("─" * w for w in self.col_widths) + right)]
+
+        def row(cells):
+            runs = [self.v_sep]
+            for cell in cells:
+                runs.extend((cell, self.v_sep))
+            return runs
+
+        self.v_sep = (LINE_COLOR, "│")
+        self.top_border = border("┌", "┬", "┐")
+        self.mid_border = border("├", "┼", "┤")
+        self.bottom_border = border("└", "┴", "┘")
+        self.header_row = row(
+            (color, title.center(w)) for (title, color), w in zip(BOARD_COLUMNS, self.col_widths)
+        )
+        self.empty_row = row((DEFAULT_STYLE, " " * w) for w in self.col_widths)
+
+    def title_row(self, project_title: str):
+        """
+        Returns the centered, colored project title.
+        """
+        return [(ansi.RED + ansi.BOLD, project_title.center(self.board_width))]
+
+    def lane_row(self, text: str, style: str):
+        """
+        Returns a full width row inside the box, used for swimlane headers.
+        """
+        inner = self.board_width - 2
+        return [self.v_sep, (style, text[:inner].ljust(inner)), self.v_sep]
+
+    def task_row(self, cells):
+        """
+        Returns a row of uncolored cell texts, padded to the column widths.
+        """
+        runs = [self.v_sep]
+        for text, w in zip(cells, self.col_widths):
+            text = text[:w]
+            runs.extend(((DEFAULT_STYLE, text), (DEFAULT_STYLE, " " * (w - len(text))), self.v_sep))
+        return runs
+
+def _sgr_params(style: str):
+    return [code[:-1] for code in style.split("\033[") if code]
+
+@lru_cache(maxsize=None)
+def _blank_safe(style: str):
+    """
+    True if spaces look the same in this style as in any other,
+    which holds for foreground colors and bold.
+    """
+    return all(param == "1" or param[:1] in ("3", "9") for param in _sgr_params(style))
+
+@lru_cache(maxsize=None)
+def _transition(current: str, style: str):
+    """
+    Returns the shortest sequence that switches from one style to another.
+    A foreground color replaces the previous color, anything else resets first.
+    """
+    if style == DEFAULT_STYLE:
+        return ansi.RESET
+    current_params = _sgr_params(current)
+    if all(param[:1] in ("3", "9") for param in current_params) and _sgr_params(style)[0][:1] in ("3", "9"):
+        return style
+    return ansi.RESET + style
+
+def render_frame(rows, line_end: str = "\r\n"):
+    """
+    Joins rows of (style, text) runs into one string.
+
+    The current terminal style is tracked across the whole frame, so
+    an SGR sequence is only written where the style actually changes:
+    adjacent runs of the same style are merged, and blank runs keep
+    whatever style is current unless either style changes how a space
+    looks (such as a background). The frame always ends in the default style.
+    """
+    out = []
+    current = DEFAULT_STYLE
+    for index, row in enumerate(rows):
+        if index:
+            out.append(line_end)
+        for style, text in row:
+            if not text:
+                continue
+            if style != current and not (text.isspace() and _blank_safe(current) and _blank_safe(style)):
+                out.append(_transition(current, style))
+                current = style
+            out.append(text)
+    if current != DEFAULT_STYLE:
+        out.append(ansi.RESET)
+    return "".join(out)
+
+class Layout:
+    """
+    The cached terminal layout shared by every view.
+    """
+
+    def __init__(self):
+        self.repaint = None
+        self._size = None
+        self._boards = {}
+
+    def invalidate(self):
+        self._size = None
+        self._boards.clear()
+
+    def size(self):
+        """
+        Returns the cached (columns, rows) of the terminal.
+        """
+        if self._size is None:
+            self._size = tuple(shutil.get_terminal_size(fallback=(80, 24)))
+        return self._size
+
+    def board(self, min_col_width: int = 15):
+        """
+        Returns the cached board geometry for the current terminal size.
+        """
+        geometry = self._boards.get(min_col_width)
+        if geometry is None:
+            term_cols, term_rows = self.size()
+            geometry = BoardGeometry(term_cols, term_rows, min_col_width)
+            self._boards[min_col_width] = geometry
+        return geometry
+
+LAYOUT = Layout()
+
+def handle_resize(signum, frame):
+    """
+    Drops the cached layout and repaints the waiting view, if any,
+    which rebuilds the layout exactly once.
+    """
+    LAYOUT.invalidate()
+    if LAYOUT.repaint is not None:
+        LAYOUT.repaint()
+
+@contextmanager
+def repaint_on_resize(callback):
+    """
+    Repaints with `callback` if the terminal is resized while the
+    body runs. Used around blocking keypress reads.
+    """
+    previous = LAYOUT.repaint
+    LAYOUT.repaint = callback
+    try:
+        yield
+    finally:
+        LAYOUT.repaint = previous
+
+if hasattr(signal, "SIGWINCH"):
+    signal.signal(signal.SIGWINCH, handle_resize)
@@ -14,6 +14,18 @@ import tty, termios  # For keypress detection on Unix
 import settings
 import time
 import kanban
+import analytics
+import codec
+import dashboard
+import fsck
+import fuzzy
+import hooks
+import layout
+import server
+import snapshots
+import sync
+import timeline
+import watch
 
 # Development information
 DEV_NAME = "narlock"
@@ -24,7 +36,28 @@ CONTROLS = f"{ansi.BLUE}←↑↓→ Navigate, ENTER to Confirm, Type for New Bo
 
 # Command information
 HELP_CMD = "-help"
+STATS_CMD = "stats"
+DASHBOARD_CMD = "dashboard"
+SERVE_CMD = "serve"
+ATTACH_CMD = "attach"
+CODEC_CMD = "codec"
+WATCH_CMD = "watch"
+SYNC_CMD = "sync"
+FSCK_CMD = "fsck"
+REPAIR_FLAG = "--repair"
+SNAPSHOTS_CMD = "snapshots"
+RESTORE_CMD = "restore"
+TIMELINE_CMD = "timeline"
+HOOKS_CMD = "hooks"
+FROM_FLAG = "--from"
+TO_FLAG = "--to"
+ADD_FLAG = "--add"
+REMOVE_FLAG = "--remove"
 EXIT_CMD = "\x03"  # Ctrl+Q
+COMMANDS = (HELP_CMD, STATS_CMD, DASHBOARD_CMD, SERVE_CMD, CODEC_CMD, WATCH_CMD, SYNC_CMD, FSCK_CMD, SNAPSHOTS_CMD, RESTORE_CMD, TIMELINE_CMD, HOOKS_CMD)
+
+# Number of entries in the main menu
+MENU_ITEM_COUNT = 6
 
 # Board data storage location
 BOARDS_DIR = os.path.expanduser("~/Documents/narlock/kb")
@@ -72,10 +105,10 @@ def interactive_menu(user_settings):
             os.system('clear')
             sys.exit(0)
         elif key == KEY_UP:  # Up arrow
-            selected_index = (selected_index - 1) % 5
+            selected_index = (selected_index - 1) % MENU_ITEM_COUNT
             displayable_error = ""
         elif key == KEY_DOWN:  # Down arrow
-            selected_index = (selected_index + 1) % 5
+            selected_index = (selected_index + 1) % MENU_ITEM_COUNT
             displayable_error = ""
         elif key in KEY_ENTER:  # Enter key
             if selected_index == 0:
@@ -108,19 +141,20 @@ def interactive_menu(user_settings):
                     continue
 
                 # Create new project with the project title and save
-                project = {
-                    "id": user_settings['nextProjectId'],
-                    "title": input_text,
-                    "nextTaskId": 0,
-                    "tasks": []
-                }
-                user_settings['nextProjectId'] = user_settings['nextProjectId'] + 1
-                user_settings['projects'].append(project)
-                user_settings['recentProjectTitle'] = project['title']
-                settings.update_settings(user_settings)
+                error = settings.add_kanban_project(user_settings, input_text)
+                if error:
+                    displayable_error = error
+                    continue
                 kanban.display_interactive_kanban(user_settings, user_settings['recentProjectTitle'])
                 return
-            elif selected_index == 4:
+            elif selected_index == 3:
+                project_title = dashboard.display_dashboard(user_settings)
+                if project_title is not None:
+                    user_settings['recentProjectTitle'] = project_title
+                    settings.update_settings(user_settings)
+                    kanban.display_interactive_kanban(user_settings, project_title)
+                    return
+            elif selected_index == 5:
                 os.system('clear')
                 sys.exit(0)
         elif key.isalnum() or key in (' ', '-', '_'):
@@ -148,6 +182,7 @@ def get_title_text(user_settings, selected_index: int) -> str:
         f"Open recent project: {ansi.RESET}{user_settings['recentProjectTitle']}",
         "Open existing project",
         "Create new project",
+        "Project dashboard",
         "Open Settings",
         "Quit kb",
     ]
@@ -168,37 +203,60 @@ def display_project_interactive_menu(user_settings):
     Displays the project selection interface and allows the user
     to choose which project they want to open.
 
+    Typing filters the projects with a fuzzy match on their titles.
+    BACKSPACE removes a typed character, or asks to delete the
+    selected project when nothing is typed.
+
     When a user selects a project, the recentProjectTitle will be
     updated based on the project that is opened.
     """
-    project_ids = settings.get_project_ids(user_settings)
-    if len(project_ids) == 0:
+    projects = user_settings['projects']
+    if len(projects) == 0:
         return
 
+    matcher = fuzzy.FuzzyMatcher([project['title'] for project in projects])
     input_message = ""
     selected_index = 0
-    current_project_title = ""
+    first_visible = 0
 
     while True:
-        os.system('clear')
-        print(f"{ansi.ORANGE}{ansi.BOLD}Projects\n")
-        # Debugging
-        # print(f"{ansi.ORANGE}{ansi.BOLD}Projects [project_ids={project_ids}, selected_index={selected_index}]\n")
-
-        for project in user_settings['projects']:
-            if project_ids[selected_index] == project['id']:
-                print(f"{ansi.BRIGHT_GREEN}{ansi.BOLD}→ {project['title']}{ansi.RESET}")
-                current_project_title = project['title']
+        matches = matcher.indices()
+        selected_index = min(selected_index, max(0, len(matches) - 1))
+        current_project_title = projects[matches[selected_index]]['title'] if matches else ""
+
+        # Only render the window of projects that fits on the screen
+        _columns, rows = layout.LAYOUT.size()
+        window_size = max(1, rows - 4)
+        if selected_index < first_visible:
+            first_visible = selected_index
+        elif selected_index >= first_visible + window_size:
+            first_visible = selected_index - window_size + 1
+
+        lines = [f"{ansi.ORANGE}{ansi.BOLD}Projects{ansi.RESET}", ""]
+        for position in range(first_visible, min(first_visible + window_size, len(matches))):
+            title = projects[matches[position]]['title']
+            if position == selected_index:
+                lines.append(f"{ansi.BRIGHT_GREEN}{ansi.BOLD}→ {title}{ansi.RESET}")
             else:
-                print(f"{ansi.GREEN}{project['title']}{ansi.RESET}")
+                lines.append(f"{ansi.GREEN}{title}{ansi.RESET}")
+        if not matches:
+            lines.append(f"{ansi.GREY}No projects match '{matcher.query}'.{ansi.RESET}")
+
+        os.system('clear')
+        print("\n".join(lines))
 
         # Await user input
-        kbutils.print_bottom_input(input_message)
+        if input_message:
+            kbutils.print_bottom_input(input_message)
+        else:
+            kbutils.print_bottom_input(matcher.query)
         key = kbutils.get_keypress()
 
         if key == kbutils.EXIT_CMD:
             return
         elif key in kbutils.KEY_ENTER:
+            if not current_project_title:
+                continue
             if "Delete project" in input_message:
                 # Delete the current project by current project title
                 input_message = ""
@@ -209,14 +267,15 @@ def display_project_interactive_menu(user_settings):
                     user_settings['recentProjectTitle'] = None
                     settings.update_settings(user_settings)
 
-                # Update the current interface
-                project_ids = settings.get_project_ids(user_settings)
-                selected_index = 0
-
                 # Exit if there are no projects
-                if len(project_ids) == 0:
+                if len(projects) == 0:
                     return
-                
+
+                # Rebuild the matcher for the remaining projects
+                query = matcher.query
+                matcher = fuzzy.FuzzyMatcher([project['title'] for project in projects])
+                matcher.set_query(query)
+                selected_index = 0
                 continue
             else:
                 # Open the kanban project
@@ -224,14 +283,23 @@ def display_project_interactive_menu(user_settings):
                 settings.update_settings(user_settings)
                 kanban.display_interactive_kanban(user_settings, user_settings['recentProjectTitle'])
                 return
-        elif key == kbutils.KEY_DOWN:
-            selected_index = (selected_index + 1) % len(project_ids)
+        elif key == kbutils.KEY_DOWN and matches:
+            selected_index = (selected_index + 1) % len(matches)
             input_message = ""
-        elif key == kbutils.KEY_UP:
-            selected_index = (selected_index - 1) % len(project_ids)
+        elif key == kbutils.KEY_UP and matches:
+            selected_index = (selected_index - 1) % len(matches)
             input_message = ""
         elif key in kbutils.KEY_BACKSPACE:
-            input_message = f"{ansi.RED}Delete project {current_project_title}? {ansi.GREY}Press ENTER to confirm...{ansi.RESET}"
+            if matcher.query:
+                matcher.pop()
+                selected_index = 0
+                input_message = ""
+            elif current_project_title:
+                input_message = f"{ansi.RED}Delete project {current_project_title}? {ansi.GREY}Press ENTER to confirm...{ansi.RESET}"
+        elif len(key) == 1 and (key.isalnum() or key in (' ', '-', '_', '.')):
+            matcher.push(key)
+            selected_index = 0
+            input_message = ""
 
 # Display help information
 def show_help():
@@ -241,19 +309,260 @@ def show_help():
     print(f"Where options include:\n")
     print(f"\t-help         Show this help message")
     print(f"\t<board_name>  Open directly to a board view")
+    print(f"\tstats <board> Show cycle time, throughput, and cumulative flow for a board")
+    print(f"\tdashboard     Show the status of every project")
+    print(f"\tserve         Run the kb daemon, serving boards over a Unix socket")
+    print(f"\tattach        Open the main menu through the running kb daemon")
+    print(f"\tcodec <name>  Store settings.json as json-pretty, json, or binary")
+    print(f"\twatch <board> Show a board read-only, refreshing when it changes on disk")
+    print(f"\tsync [<dir>]  Sync boards through a shared directory, or merge its changes now")
+    print(f"\tfsck          Verify stored boards, with --repair to fix or quarantine problems")
+    print(f"\tsnapshots     List the snapshots taken when boards were saved")
+    print(f"\trestore <id>  Restore the boards from a snapshot")
+    print(f"\ttimeline <board> [--from <day>] [--to <day>]")
+    print(f"\t              List the tasks worked on between two dates or ISO weeks (2025-W32)")
+    print(f"\thooks <board> [--add <type> [<target>] | --remove <name>]")
+    print(f"\t              List a board's hooks and their timings, or add or remove one")
     print(f"\nNo arguments will open the main menu.\n")
 
+def print_stats(user_settings, project_title: str):
+    """
+    Prints the flow analytics report for a project.
+    """
+    settings.load_projects(user_settings, [p["id"] for p in user_settings["projects"] if p["title"] == project_title])
+    project = settings.get_project_by_title(user_settings, project_title)
+    if not project:
+        print(f"{ansi.RED}Project '{project_title}' not found.{ansi.RESET}")
+        sys.exit(1)
+    error = settings.upgrade_project(user_settings, project_title)
+    if error:
+        print(f"{ansi.RED}{error}{ansi.RESET}")
+
+    try:
+        metrics = analytics.project_flow(project["id"])
+    except RuntimeError as e:
+        print(f"{ansi.RED}{e}{ansi.RESET}")
+        sys.exit(1)
+
+    columns, _rows = layout.LAYOUT.size()
+    print(analytics.format_report(project_title, metrics, columns))
+
+def change_codec(user_settings, codec_name: str):
+    """
+    Rewrites settings.json with another codec.
+    """
+    if codec_name not in codec.CODEC_NAMES:
+        print(f"{ansi.RED}Unknown codec '{codec_name}'. Valid options: {', '.join(codec.CODEC_NAMES)}{ansi.RESET}")
+        sys.exit(1)
+
+    user_settings["codec"] = codec_name
+    settings.update_settings(user_settings)
+
+def sync_boards(user_settings, directory=None):
+    """
+    Starts syncing through a directory, or merges the changes other
+    replicas made since the last merge.
+    """
+    if directory is not None:
+        error = sync.enable(user_settings, directory)
+        if error:
+            print(f"{ansi.RED}{error}{ansi.RESET}")
+            sys.exit(1)
+        print(f"Syncing boards through {user_settings['syncDir']}")
+        return
+
+    if not sync.sync_dir(user_settings):
+        print(f"{ansi.RED}Syncing is not enabled. Start with `kb {SYNC_CMD} <directory>`.{ansi.RESET}")
+        sys.exit(1)
+    print(f"Merged {sync.pull(user_settings)} changes from {user_settings['syncDir']}")
+
+def print_snapshots():
+    """
+    Lists the snapshots, oldest first, with the space each one added.
+    """
+    records = snapshots.list_snapshots()
+    if not records:
+        print("No snapshots yet, one is taken every time boards are saved.")
+        return
+    print(f"{ansi.BOLD}{'id':<22} {'taken':<19} {'size':>10} {'new data':>10}{ansi.RESET}")
+    for record, added in zip(records, snapshots.new_bytes(records)):
+        taken = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(record["time"]))
+        added_text = f"{added / 1024:.1f} KB" if added is not None else f"{ansi.RED}damaged{ansi.RESET}"
+        print(f"{record['id']:<22} {taken:<19} {record['size'] / 1024:>7.1f} KB {added_text:>10}")
+
+def restore_snapshot(snapshot_id: str):
+    """
+    Restores the boards from a snapshot.
+    """
+    if server.daemon_running():
+        print(f"{ansi.RED}Stop the kb daemon before restoring, it would overwrite the restored boards.{ansi.RESET}")
+        sys.exit(1)
+    error = snapshots.restore(snapshot_id)
+    if error:
+        print(f"{ansi.RED}{error}{ansi.RESET}")
+        sys.exit(1)
+    print(f"Restored snapshot {snapshot_id}. The boards before restoring were snapshotted too.")
+
+def print_timeline(user_settings, args):
+    """
+    Lists the tasks of a board worked on in a range of days, from the
+    `kb timeline <board> [--from <day>] [--to <day>]` arguments.
+    """
+    usage = f"Usage: kb {TIMELINE_CMD} <board_name> [{FROM_FLAG} <day>] [{TO_FLAG} <day>]"
+    words = []
+    first, last = 0, timeline.OPEN_END
+    try:
+        position = 0
+        while position < len(args):
+            if args[position] == FROM_FLAG:
+                first = timeline.parse_day(args[position + 1])
+                position += 2
+            elif args[position] == TO_FLAG:
+                last = timeline.parse_day(args[position + 1], end=True)
+                position += 2
+            else:
+                words.append(args[position])
+                position += 1
+    except (IndexError, ValueError):
+        print(usage)
+        sys.exit(1)
+    if not words:
+        print(usage)
+        sys.exit(1)
+
+    project_title = " ".join(words)
+    settings.load_projects(user_settings, [p["id"] for p in user_settings["projects"] if p["title"] == project_title])
+    project = settings.get_project_by_title(user_settings, project_title)
+    if not project:
+        print(f"{ansi.RED}Project '{project_title}' not found.{ansi.RESET}")
+        sys.exit(1)
+    error = settings.upgrade_project(user_settings, project_title)
+    if error:
+        print(f"{ansi.RED}{error}{ansi.RESET}")
+
+    index = timeline.timeline_index(project)
+    tasks = index.overlapping(first, last)
+    if not tasks:
+        print("No tasks were worked on in these days.")
+        return
+    for task in tasks:
+        start, end = index.spans[task["id"]]
+        style = timeline.STATUS_STYLES.get(task.get("status"), "")
+        print(f"{timeline.format_day(start)} to {timeline.format_day(end):<10}  "
+              f"{style}{task.get('status', ''):<8}{ansi.RESET} [{task['id']}] {task.get('title', '')}")
+
+def manage_hooks(user_settings, args):
+    """
+    Lists a board's hooks with their metrics, or adds or removes one,
+    from the `kb hooks <board> [--add <type> [<target>] | --remove <name>]`
+    arguments.
+    """
+    usage = f"Usage: kb {HOOKS_CMD} <board_name> [{ADD_FLAG} <{'|'.join(hooks.HOOK_TYPES)}> [<target>] | {REMOVE_FLAG} <name>]"
+    flag = next((position for position, arg in enumerate(args) if arg in (ADD_FLAG, REMOVE_FLAG)), len(args))
+    project_title = " ".join(args[:flag])
+    action, rest = args[flag:flag + 1], args[flag + 1:]
+    if not project_title or (action == [ADD_FLAG] and len(rest) not in (1, 2)) or (action == [REMOVE_FLAG] and len(rest) != 1):
+        print(usage)
+        sys.exit(1)
+
+    settings.load_projects(user_settings, [p["id"] for p in user_settings["projects"] if p["title"] == project_title])
+    if action:
+        if server.daemon_running():
+            print(f"{ansi.RED}Stop the kb daemon before changing hooks, it would overwrite them.{ansi.RESET}")
+            sys.exit(1)
+        if action == [ADD_FLAG]:
+            error = hooks.add_hook(user_settings, project_title, rest[0], rest[1] if len(rest) > 1 else None)
+        else:
+            error = hooks.remove_hook(user_settings, project_title, rest[0])
+        if error:
+            print(f"{ansi.RED}{error}{ansi.RESET}")
+            sys.exit(1)
+        return
+
+    project = settings.get_project_by_title(user_settings, project_title)
+    if not project:
+        print(f"{ansi.RED}Project '{project_title}' not found.{ansi.RESET}")
+        sys.exit(1)
+    if not project.get("hooks"):
+        print(f"No hooks. Add one with `kb {HOOKS_CMD} {project_title} {ADD_FLAG} <{'|'.join(hooks.HOOK_TYPES)}> [<target>]`.")
+        return
+    metrics = hooks.load_metrics()
+    print(f"{ansi.BOLD}{'name':<12} {'type':<8} {'runs':>6} {'events':>7} {'avg ms':>8} {'max ms':>8} {'max wait':>9} {'failed':>6} {'retried':>7} {'dropped':>7}{ansi.RESET}")
+    for config in project["hooks"]:
+        name = hooks.hook_name(config)
+        metric = metrics.get(f"{project['id']}/{name}")
+        if metric is None:
+            print(f"{name:<12} {config['type']:<8} {ansi.GREY}not run yet{ansi.RESET}")
+            continue
+        average = metric["totalSeconds"] / metric["runs"] * 1000 if metric["runs"] else 0
+        failed = f"{ansi.RED}{metric['failures']:>6}{ansi.RESET}" if metric["failures"] else f"{0:>6}"
+        print(f"{name:<12} {config['type']:<8} {metric['runs']:>6} {metric['events']:>7} {average:>8.1f} "
+              f"{metric['maxSeconds'] * 1000:>8.1f} {metric['maxWaitSeconds'] * 1000:>7.0f}ms {failed} "
+              f"{metric['retries']:>7} {metric['dropped']:>7}")
+        if metric["lastError"]:
+            print(f"{'':<12} {ansi.RED}last error: {metric['lastError']}{ansi.RESET}")
+
 # Main function
 def main():
     args = sys.argv[1:]
-    user_settings = settings.load_settings()
 
-    if not args:
+    if args and args[0] == ATTACH_CMD:
+        try:
+            user_settings = server.attach()
+        except OSError:
+            print(f"{ansi.RED}No kb daemon is running. Start one with `kb {SERVE_CMD}`.{ansi.RESET}")
+            sys.exit(1)
         interactive_menu(user_settings)
-    elif args[0] == HELP_CMD:
+        return
+
+    # Checked before loading, which would already set damaged projects aside
+    if args and args[0] == FSCK_CMD:
+        sys.exit(1 if fsck.fsck(repair=REPAIR_FLAG in args[1:]) else 0)
+
+    # The menus only need the projects' summaries, boards are loaded when opened
+    if not args or args[0] not in COMMANDS:
+        interactive_menu(settings.load_summary())
+        return
+
+    # Commands load the boards they work on, the dashboard only needs the summaries
+    user_settings = settings.load_summary()
+
+    if args[0] == HELP_CMD:
         show_help()
-    else:
-        interactive_menu(user_settings)
+    elif args[0] == STATS_CMD:
+        if len(args) < 2:
+            print(f"Usage: kb {STATS_CMD} <board_name>")
+            sys.exit(1)
+        print_stats(user_settings, " ".join(args[1:]))
+    elif args[0] == DASHBOARD_CMD:
+        dashboard.print_dashboard(user_settings)
+    elif args[0] == SERVE_CMD:
+        settings.load_projects(user_settings)
+        server.serve(user_settings)
+    elif args[0] == CODEC_CMD:
+        if len(args) != 2:
+            print(f"Usage: kb {CODEC_CMD} <{'|'.join(codec.CODEC_NAMES)}>")
+            sys.exit(1)
+        change_codec(user_settings, args[1])
+    elif args[0] == WATCH_CMD:
+        if len(args) < 2:
+            print(f"Usage: kb {WATCH_CMD} <board_name>")
+            sys.exit(1)
+        watch.watch(" ".join(args[1:]))
+    elif args[0] == SYNC_CMD:
+        settings.load_projects(user_settings)
+        sync_boards(user_settings, " ".join(args[1:]) or None)
+    elif args[0] == SNAPSHOTS_CMD:
+        print_snapshots()
+    elif args[0] == RESTORE_CMD:
+        if len(args) != 2:
+            print(f"Usage: kb {RESTORE_CMD} <snapshot id>")
+            sys.exit(1)
+        restore_snapshot(args[1])
+    elif args[0] == TIMELINE_CMD:
+        print_timeline(user_settings, args[1:])
+    elif args[0] == HOOKS_CMD:
+        manage_hooks(user_settings, args[1:])
 
 if __name__ == '__main__':
     main()
\ No newline at end of file
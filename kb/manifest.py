@@ -0,0 +1,101 @@
+"""
+kb - manifest.py
+author: narlock
+
+This file controls the project manifest, a small summary of every
+project kept next to settings.json:
+
+~/Documents/narlock/kb/manifest.json
+
+    {"stamp": [52011, 1760861234567891234],
+     "settings": {"recentProjectTitle": "kb", "nextProjectId": 2, ...},
+     "projects": [{"id": 0, "title": "kb", "counts": {"todo": 3, "done": 12},
+                   "modified": 1760861234.5, "nextTaskId": 15, "revision": 40,
+                   "bytes": [151, 51688, 3735928559]}]}
+
+The main menu, the project picker, and kanban_project_exists only
+need what is in the manifest, so `kb` starts without parsing a single
+task. A project's tasks are loaded when its board is opened (see
+settings.load_projects).
+
+The manifest is rewritten whenever settings.json is saved, and its
+stamp records the size and modification time settings.json had after
+that save. If the two ever disagree (settings.json was edited by
+hand, or kb stopped between the two writes), the manifest is ignored
+and rebuilt from settings.json.
+
+"bytes" is the offset and length of the project in settings.json,
+and its checksum (see codec.encode). Saving copies the projects whose
+boards were never opened from there, rather than parsing them only to
+write them back (see settings.save_settings).
+"""
+
+import json
+import os
+import settings
+
+def manifest_path():
+    """
+    The manifest lives next to settings.json.
+    """
+    return settings.SETTINGS_PATH.parent / "manifest.json"
+
+def file_stamp(stat):
+    return [stat.st_size, stat.st_mtime_ns]
+
+def summarize(project):
+    """
+    Returns the manifest entry of a project.
+    """
+    if "tasks" not in project:
+        # Only summarized, so written back unchanged
+        return {key: value for key, value in project.items() if key != "bytes"}
+    counts = {}
+    for task in project.get("tasks", []):
+        status = task.get("status", "backlog")
+        counts[status] = counts.get(status, 0) + 1
+    return {
+        "id": project["id"],
+        "title": project["title"],
+        "counts": counts,
+        "modified": project.get("modified"),
+        "nextTaskId": project.get("nextTaskId", 0),
+        "revision": project.get("revision", 0),
+    }
+
+def write(user_settings, stamp, layout=None):
+    """
+    Replaces the manifest with one describing `user_settings`, which
+    were just saved to a settings.json with the given stamp, and the
+    layout codec.encode wrote it with, if it is known.
+    """
+    projects = [summarize(project) for project in user_settings.get("projects", [])]
+    for entry, span in zip(projects, layout or []):
+        entry["bytes"] = span
+    manifest = {
+        "stamp": stamp,
+        "settings": {key: value for key, value in user_settings.items() if key != "projects"},
+        "projects": projects,
+    }
+    temp_path = manifest_path().with_suffix(".tmp")
+    try:
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, separators=(",", ":"))
+        os.replace(temp_path, manifest_path())
+    except OSError:
+        # Without a manifest the menus read settings.json instead
+        pass
+
+def load():
+    """
+    Returns the manifest, or None if it is missing or does not describe
+    the current settings.json.
+    """
+    try:
+        with open(manifest_path(), 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+        if manifest.get("stamp") != file_stamp(os.stat(settings.SETTINGS_PATH)):
+            return None
+        return manifest
+    except (OSError, ValueError):
+        return None
@@ -0,0 +1,245 @@
+"""
+kb - ranks.py
+author: narlock
+
+This file controls the order of cards within a column.
+
+Every task may carry a "rank", a fractional key compared as a plain
+string, such as "V3" or "k". Between any two keys there is always
+another one, so moving a card only changes its own rank:
+
+    {"op": "update", "project": 0, "task": 4,
+     "before": {"rank": "V00004V"}, "after": {"rank": "F"}}
+
+Tasks that were never ranked sort by an implicit key derived from
+their id, which keeps them in creation order.
+
+Each column is kept in memory as a list of (rank, task id) sorted
+with bisect, so finding a card's neighbors and moving it costs
+O(log n) comparisons. The lists are built the first time a board is
+shown and afterwards updated with the tasks each operation touched
+(see history.apply). When a key grows longer than MAX_RANK_LENGTH,
+which takes many moves into the same gap, the column is queued and
+respaced when the board is next idle (IDLE_SECONDS without a key in
+the TUI, on a background thread in the kb daemon). Respacing keeps
+the order, so it is not an undo step of its own.
+"""
+
+import bisect
+
+DIGITS = "0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz"
+BASE = len(DIGITS)
+IMPLICIT_PREFIX = "V"
+IMPLICIT_WIDTH = 6
+MAX_RANK_LENGTH = 12
+IDLE_SECONDS = 1
+
+# project id -> ColumnIndex
+_indexes = {}
+
+# (project id, status) of columns whose ranks should be respaced
+_rebalance_queue = set()
+
+def _encode(number: int, width: int):
+    digits = []
+    for _ in range(width):
+        number, digit = divmod(number, BASE)
+        digits.append(DIGITS[digit])
+    return "".join(reversed(digits))
+
+def implicit_rank(task_id: int):
+    """
+    The key of a task that was never ranked. It ends with a non zero
+    digit, like every generated key, so there is room before it.
+    """
+    return IMPLICIT_PREFIX + _encode(task_id, IMPLICIT_WIDTH) + IMPLICIT_PREFIX
+
+def rank_of(task):
+    return task.get("rank") or implicit_rank(task["id"])
+
+def _midpoint(a: str, b):
+    """
+    Returns a key strictly between the fractions 0.a and 0.b, where
+    b is None for 1. Neither may end in the zero digit.
+    """
+    if b is not None:
+        # Keep the common prefix, padding a with zeros
+        n = 0
+        while n < len(b) and (a[n] if n < len(a) else DIGITS[0]) == b[n]:
+            n += 1
+        if n > 0:
+            return b[:n] + _midpoint(a[n:], b[n:])
+
+    digit_a = DIGITS.index(a[0]) if a else 0
+    digit_b = DIGITS.index(b[0]) if b is not None else BASE
+    if digit_b - digit_a > 1:
+        return DIGITS[(digit_a + digit_b) // 2]
+    if b is not None and len(b) > 1:
+        return b[0]
+    return DIGITS[digit_a] + _midpoint(a[1:], None)
+
+def key_between(before, after):
+    """
+    Returns a key that sorts after `before` and before `after`. Either
+    may be None for the start or end of the column.
+    """
+    if before is not None and after is not None and before >= after:
+        raise ValueError(f"{before!r} does not sort before {after!r}")
+    return _midpoint(before or "", after)
+
+def spaced_keys(count: int):
+    """
+    Returns `count` short, evenly spaced keys in ascending order.
+    """
+    width = 1
+    while BASE ** width <= count:
+        width += 1
+    step = BASE ** width // (count + 1)
+    return [_encode(step * (i + 1), width).rstrip(DIGITS[0]) for i in range(count)]
+
+class ColumnIndex:
+    """
+    The tasks of one project, per status, sorted by rank.
+    """
+
+    def __init__(self, project):
+        self.revision = project.get("revision", 0)
+        self.columns = {}
+        self.tasks = {}
+        for task in project.get("tasks", []):
+            self.columns.setdefault(task.get("status"), []).append((rank_of(task), task["id"]))
+            self.tasks[task["id"]] = task
+        for column in self.columns.values():
+            column.sort()
+
+    def _add(self, task):
+        # Archived copies live in cold storage, not on the board
+        if task.get("status") == "archived":
+            return
+        bisect.insort(self.columns.setdefault(task.get("status"), []), (rank_of(task), task["id"]))
+        self.tasks[task["id"]] = task
+
+    def _remove(self, task):
+        column = self.columns.get(task.get("status"), [])
+        entry = (rank_of(task), task["id"])
+        position = bisect.bisect_left(column, entry)
+        if position < len(column) and column[position] == entry:
+            del column[position]
+            self.tasks.pop(task["id"], None)
+
+    def task_changed(self, before, after):
+        if before is not None:
+            self._remove(before)
+        if after is not None:
+            self._add(after)
+
+    def statuses(self):
+        return [status for status, column in self.columns.items() if column]
+
+    def ids(self, status: str):
+        """
+        Returns the ids of a column's tasks, top to bottom.
+        """
+        return [task_id for _rank, task_id in self.columns.get(status, [])]
+
+    def tasks_in(self, status: str):
+        """
+        Returns a column's tasks, top to bottom.
+        """
+        return [self.tasks[task_id] for _rank, task_id in self.columns.get(status, [])]
+
+    def new_rank(self, task, position: str, other=None):
+        """
+        Returns the rank that moves `task` to the top or bottom of its
+        column, or before or after `other`, another task in the column.
+        """
+        column = [entry for entry in self.columns.get(task.get("status"), []) if entry[1] != task["id"]]
+        if position == "top":
+            index = 0
+        elif position == "bottom":
+            index = len(column)
+        else:
+            index = bisect.bisect_left(column, (rank_of(other), other["id"]))
+            if position == "after":
+                index += 1
+
+        before = column[index - 1][0] if index > 0 else None
+        after = column[index][0] if index < len(column) else None
+        # Already in place
+        current = rank_of(task)
+        if (before is None or before < current) and (after is None or current < after):
+            return current
+        # Two tasks may share a rank if another client ranked them concurrently
+        if before is not None and after is not None and before >= after:
+            return None
+        return key_between(before, after)
+
+def column_index(project):
+    """
+    Returns the project's column index, rebuilding it if the project
+    was changed without going through history.apply.
+    """
+    index = _indexes.get(project["id"])
+    if index is None or index.revision != project.get("revision", 0):
+        index = ColumnIndex(project)
+        _indexes[project["id"]] = index
+    return index
+
+def invalidate(project_id: int):
+    """
+    Drops the project's column index, such as after reloading it from disk.
+    """
+    _indexes.pop(project_id, None)
+
+def changes_applied(project, changes):
+    """
+    Updates the project's column index for the (before, after) task
+    changes of one operation and queues columns whose keys grew too long.
+    Must be called after the project's revision has been bumped.
+    """
+    for _before, after in changes:
+        if after is not None and len(after.get("rank") or "") > MAX_RANK_LENGTH:
+            queue_rebalance(project["id"], after.get("status"))
+
+    index = _indexes.get(project["id"])
+    if index is None:
+        return
+    if index.revision != project.get("revision", 0) - 1:
+        del _indexes[project["id"]]
+        return
+    for before, after in changes:
+        index.task_changed(before, after)
+    index.revision = project["revision"]
+
+def rebalance_op(project, status: str):
+    """
+    Returns a batch operation giving a column's tasks short, evenly
+    spaced ranks in their current order, or None if it has no tasks.
+    """
+    tasks = column_index(project).tasks_in(status)
+    ops = [
+        {
+            "op": "update",
+            "project": project["id"],
+            "task": task["id"],
+            "before": {"rank": task.get("rank")},
+            "after": {"rank": key}
+        }
+        for task, key in zip(tasks, spaced_keys(len(tasks)))
+        if task.get("rank") != key
+    ]
+    return {"op": "batch", "ops": ops} if ops else None
+
+def queue_rebalance(project_id: int, status: str):
+    _rebalance_queue.add((project_id, status))
+
+def rebalance_due():
+    return bool(_rebalance_queue)
+
+def pending_rebalances():
+    """
+    Returns and clears the queued (project id, status) columns.
+    """
+    pending = sorted(_rebalance_queue, key=str)
+    _rebalance_queue.clear()
+    return pending
@@ -0,0 +1,137 @@
+"""
+kb - releases.py
+author: narlock
+
+This file maintains per fixVersion rollups of a project's tasks,
+stored on the project as:
+
+    "releases": {
+        "v1.0.0": {
+            "tasks": 4,
+            "effort": 13,
+            "remainingEffort": 5,
+            "statusCounts": {"todo": 1, "doing": 1, "done": 2},
+            "checklistTotal": 6,
+            "checklistDone": 3,
+            "burndown": [["2025-04-10", 8], ["2025-04-11", 5]]
+        }
+    }
+
+Rather than scanning the project, each task change subtracts the old
+task's contribution and adds the new one, so the release view is
+available instantly no matter how many tasks a project has.
+"""
+
+import archive
+from datetime import date
+
+NO_VERSION = ""
+COMPLETED_STATUSES = ("done", "archived")
+MAX_BURNDOWN_POINTS = 365
+
+def _empty_release():
+    return {
+        "tasks": 0,
+        "effort": 0,
+        "remainingEffort": 0,
+        "statusCounts": {},
+        "checklistTotal": 0,
+        "checklistDone": 0,
+        "burndown": []
+    }
+
+def _effort(task):
+    try:
+        return int(task.get("effort") or 0)
+    except (TypeError, ValueError):
+        return 0
+
+def _add_task(releases, task, sign: int):
+    """
+    Adds (sign = 1) or removes (sign = -1) a task's contribution to its release.
+    """
+    version = task.get("fixVersion") or NO_VERSION
+    release = releases.setdefault(version, _empty_release())
+    status = task.get("status", "backlog")
+    effort = _effort(task)
+    checklist = task.get("checklistItems") or []
+
+    release["tasks"] += sign
+    release["effort"] += sign * effort
+    if status not in COMPLETED_STATUSES:
+        release["remainingEffort"] += sign * effort
+    counts = release["statusCounts"]
+    counts[status] = counts.get(status, 0) + sign
+    if counts[status] == 0:
+        del counts[status]
+    release["checklistTotal"] += sign * len(checklist)
+    release["checklistDone"] += sign * sum(1 for item in checklist if item.get("completed"))
+    return version
+
+def _record_burndown(release):
+    """
+    Records today's remaining effort, replacing an earlier point from today.
+    """
+    today = date.today().isoformat()
+    burndown = release["burndown"]
+    if burndown and burndown[-1][0] == today:
+        burndown[-1][1] = release["remainingEffort"]
+    else:
+        burndown.append([today, release["remainingEffort"]])
+        if len(burndown) > MAX_BURNDOWN_POINTS:
+            del burndown[0]
+
+def rebuild(project, archived_tasks=()):
+    """
+    Builds the rollups from scratch. Only needed once for projects
+    created before rollups were maintained.
+    """
+    releases = {}
+    for task in list(project.get("tasks", [])) + list(archived_tasks):
+        _add_task(releases, task, 1)
+    for release in releases.values():
+        _record_burndown(release)
+    project["releases"] = releases
+    return releases
+
+def ensure(project):
+    """
+    Returns the project's rollups, building them on first use.
+    """
+    if "releases" not in project:
+        reader = archive.ArchiveReader(project["id"])
+        reader.load_all()
+        rebuild(project, reader.tasks)
+    return project["releases"]
+
+def task_changed(project, before, after):
+    """
+    Updates the rollups for one task change in constant time. `before`
+    is None for a newly added task and `after` is None for a deleted one.
+    Must be called after the change has been applied to the project.
+    """
+    if "releases" not in project:
+        ensure(project)
+        return
+
+    releases = project["releases"]
+    touched = set()
+    if before is not None:
+        touched.add(_add_task(releases, before, -1))
+    if after is not None:
+        touched.add(_add_task(releases, after, 1))
+
+    for version in touched:
+        release = releases[version]
+        if release["tasks"] <= 0:
+            del releases[version]
+        else:
+            _record_burndown(release)
+
+def checklist_percent(release):
+    """
+    Returns the percentage of checklist items completed in a release.
+    """
+    if release["checklistTotal"] == 0:
+        return 0.0
+    return 100.0 * release["checklistDone"] / release["checklistTotal"]
@@ -0,0 +1,164 @@
+"""
+kb - schema.py
+author: narlock
+
+This file controls the schema version of projects and the migrations
+that bring older projects up to date.
+
+Every project records the version of the format it was written in:
+
+    {"id": 0, "title": "kb", "schemaVersion": 4, "tasks": [...]}
+
+Projects from before versioning have no "schemaVersion" and are
+version 1. A migration upgrades a project from one version to the
+next and is registered with the `migration` decorator:
+
+    @migration(2)
+    def fill_task_defaults(project):
+        ...
+
+Projects are not upgraded when settings.json is loaded, nor when they
+are looked up. Each one is upgraded when its board is opened (see
+settings.upgrade_project): in the TUI, by the commands naming a board,
+when sync merges into it, and up front by the daemon and the Store.
+Starting kb costs the same however many projects are waiting for
+migrations, and projects that are never opened are never rewritten. An upgraded
+project is saved with the next change to settings.json.
+
+Migrations change the project in place and keep every field they do
+not know about. They run on a copy, so if one fails the project is
+left exactly as it was loaded, a copy of it and the error are written
+to the quarantine directory next to settings.json, and the project is
+not migrated again until kb restarts; opening it again reports the
+same error.
+"""
+
+import copy
+import json
+import time
+import traceback
+import archive
+import settings
+
+SCHEMA_VERSION = 4
+UNVERSIONED = 1
+
+# version -> function upgrading a project from that version to the next
+MIGRATIONS = {}
+
+# Id -> error message, of projects whose migration failed in this session
+_quarantined = {}
+
+def migration(from_version: int):
+    """
+    Registers a function that upgrades a project from `from_version`.
+    """
+    def register(function):
+        MIGRATIONS[from_version] = function
+        return function
+    return register
+
+def quarantine_dir():
+    """
+    Quarantined data lives next to settings.json.
+    """
+    return settings.SETTINGS_PATH.parent / "quarantine"
+
+def quarantine(name: str, data: bytes):
+    """
+    Writes data that could not be used to the quarantine directory
+    and returns its path. The same data is only kept once per name.
+    """
+    directory = quarantine_dir()
+    directory.mkdir(parents=True, exist_ok=True)
+    for existing in directory.glob(f"*-{name}"):
+        if existing.read_bytes() == data:
+            return existing
+    path = directory / f"{time.strftime('%Y%m%d-%H%M%S')}-{name}"
+    with open(path, 'wb') as f:
+        f.write(data)
+    return path
+
+def version_of(project):
+    return project.get("schemaVersion", UNVERSIONED)
+
+def needs_upgrade(project):
+    """
+    Returns True if the project is loaded, older than this version of
+    kb, and has not failed to migrate.
+    """
+    return (
+        "tasks" in project
+        and version_of(project) < SCHEMA_VERSION
+        and project["id"] not in _quarantined
+    )
+
+def upgrade(project):
+    """
+    Runs the pending migrations of a project.
+
+    Returns:
+        str: error message if a migration failed and the project was quarantined
+        None: on success, or if there was nothing to do
+    """
+    if project["id"] in _quarantined and version_of(project) < SCHEMA_VERSION:
+        # Opening it again reports why it was left as it was
+        return _quarantined[project["id"]]
+    if not needs_upgrade(project):
+        return None
+
+    upgraded = copy.deepcopy(project)
+    version = version_of(upgraded)
+    try:
+        while version < SCHEMA_VERSION:
+            MIGRATIONS[version](upgraded)
+            version += 1
+            upgraded["schemaVersion"] = version
+    except Exception:
+        record = {"failedVersion": version, "error": traceback.format_exc(), "project": project}
+        path = quarantine(f"project-{project['id']}-v{version}.json", json.dumps(record, indent=2, default=str).encode("utf-8"))
+        _quarantined[project["id"]] = f"Could not upgrade project '{project['title']}' from version {version}, it was left unchanged (see {path})."
+        return _quarantined[project["id"]]
+
+    project.clear()
+    project.update(upgraded)
+    # Cached indexes keyed by revision were built from the old format
+    project["revision"] = project.get("revision", 0) + 1
+    return None
+
+# Migrations
+
+@migration(1)
+def archive_board_tasks(project):
+    """
+    Before cold storage, archived tasks stayed in settings.json with
+    the "archived" status. Moves them into the project's archive.
+    """
+    archived = [task for task in project.get("tasks", []) if task.get("status") == "archived"]
+    if not archived:
+        return
+    project["tasks"] = [task for task in project["tasks"] if task.get("status") != "archived"]
+    if archive.has_archive(project["id"]):
+        # Some may have been moved by an attempt whose later migration failed
+        reader = archive.ArchiveReader(project["id"])
+        archived = [task for task in archived if reader.get(task["id"]) is None]
+    if archived:
+        archive.append_tasks(project, archived)
+
+@migration(2)
+def fill_task_defaults(project):
+    """
+    Gives tasks the fields added to DEFAULT_TASK after they were written.
+    """
+    project.setdefault("nextTaskId", max((task["id"] for task in project.get("tasks", [])), default=-1) + 1)
+    for task in project.get("tasks", []):
+        for key, value in settings.DEFAULT_TASK.items():
+            if key not in task:
+                task[key] = copy.deepcopy(value)
+
+@migration(3)
+def sparse_tasks(project):
+    """
+    From version 4, fields left at their default are not written to
+    settings.json (see sparse.py). Tasks are unchanged in memory.
+    """
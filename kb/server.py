@@ -0,0 +1,357 @@
+"""
+kb - server.py
+author: narlock
+
+This file controls the kb daemon started by `kb serve`.
+
+The daemon keeps the parsed settings in memory and answers JSON-RPC
+2.0 requests (one JSON object per line) over the Unix domain socket
+at ~/Documents/narlock/kb/kb.sock, so editor plugins, prompts, and
+status bars do not have to reparse settings.json on every query.
+
+Methods:
+    list      {"project"?, "status"?}   projects, or the tasks of a project
+    get       {"project", "id"}         a single task
+    move      {"project", "id", "column"?}
+    create    {"project", "task"}       returns {"id": new task id}
+    edit      {"project", "id", "fields"}
+    archive   {"project"}               archives the done column
+    search    {"project", "text"}       tasks whose title or description match
+    subscribe {}                        the connection then receives
+                                        {"method": "changed", "params": {...}}
+                                        notifications after every write
+    load      {}                        the whole settings object
+    changes   {"revisions"}             projects changed since the given revisions
+    call      {"function", "args", "revisions"}
+                                        runs a settings function, used by `kb attach`
+
+Requests are handled on one thread per connection, while every
+access to the settings happens under a single lock, so writes are
+serialized and readers never observe a half applied change.
+"""
+
+import copy
+import json
+import os
+import socket
+import socketserver
+import threading
+import ansi
+import blobs
+import client
+import history
+import ranks
+import settings
+import sparse
+import sync
+
+# Settings functions `kb attach` may run in the daemon (without forwarding them again)
+REMOTE_FUNCTIONS = {
+    function.__name__: function.__wrapped__ for function in (
+        settings.move_kanban_item_by_id,
+        settings.rank_kanban_task,
+        settings.rebalance_ranks,
+        settings.update_kanban_task,
+        settings.delete_kanban_item_by_id,
+        settings.add_kanban_task,
+        settings.archive_completed_kanban_tasks,
+        settings.restore_archived_task,
+        settings.add_kanban_project,
+        settings.delete_project_by_title,
+        settings.update_top_level_settings,
+        history.undo,
+        history.redo,
+        sync.pull,
+    )
+}
+
+# JSON-RPC error codes
+PARSE_ERROR = -32700
+METHOD_NOT_FOUND = -32601
+INVALID_PARAMS = -32602
+REQUEST_FAILED = -32000
+
+def socket_path():
+    """
+    The daemon's socket lives next to settings.json.
+    """
+    return settings.SETTINGS_PATH.parent / "kb.sock"
+
+class RequestError(Exception):
+    def __init__(self, code, message):
+        super().__init__(message)
+        self.code = code
+
+def _task_summary(task):
+    return {"id": task["id"], "title": task["title"], "status": task.get("status")}
+
+class BoardServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, path, user_settings):
+        self.user_settings = user_settings
+        self.lock = threading.Lock()
+        self.subscribers = {}
+        self.subscribers_lock = threading.Lock()
+        super().__init__(str(path), RequestHandler)
+
+    # Helpers (called with self.lock held)
+
+    def _project(self, title):
+        project = settings.get_project_by_title(self.user_settings, title)
+        if not project:
+            raise RequestError(REQUEST_FAILED, "Project not found.")
+        return project
+
+    def _check(self, result):
+        # Settings functions report failures by returning a message
+        if isinstance(result, str):
+            raise RequestError(REQUEST_FAILED, result)
+        return result
+
+    def _changes(self, revisions):
+        """
+        Returns the top level settings and the projects that differ
+        from the given {project id: revision} map.
+        """
+        known = {str(key): value for key, value in (revisions or {}).items()}
+        current = {str(project["id"]) for project in self.user_settings["projects"]}
+        return {
+            "settings": {k: v for k, v in self.user_settings.items() if k != "projects"},
+            "projects": [
+                project for project in self.user_settings["projects"]
+                if known.get(str(project["id"])) != project.get("revision", 0)
+            ],
+            "removed": [int(project_id) for project_id in known if project_id not in current],
+        }
+
+    def _revisions(self):
+        return {str(p["id"]): p.get("revision", 0) for p in self.user_settings["projects"]}
+
+    # Methods
+
+    def rpc_list(self, project=None, status=None):
+        if project is None:
+            return [{"id": p["id"], "title": p["title"], "tasks": len(p["tasks"])} for p in self.user_settings["projects"]]
+        tasks = self._project(project)["tasks"]
+        return [_task_summary(t) for t in tasks if status is None or t.get("status") == status]
+
+    def rpc_get(self, project, id):
+        return self._check(settings.get_kanban_task_by_id(self.user_settings, project, id))
+
+    def rpc_move(self, project, id, column=None):
+        self._check(settings.move_kanban_item_by_id(self.user_settings, project, id, column))
+        return None
+
+    def rpc_create(self, project, task):
+        new_task = sparse.new_task(task)
+        self._check(settings.add_kanban_task(self.user_settings, project, new_task))
+        return {"id": new_task["id"]}
+
+    def rpc_edit(self, project, id, fields):
+        task = self._check(settings.get_kanban_task_by_id(self.user_settings, project, id))
+        original = copy.deepcopy(task)
+        edited = {**task, **fields, "id": task["id"]}
+        self._check(settings.update_kanban_task(self.user_settings, project, edited, original))
+        return None
+
+    def rpc_archive(self, project):
+        self._check(settings.archive_completed_kanban_tasks(self.user_settings, project))
+        return None
+
+    def rpc_search(self, project, text):
+        needle = text.lower()
+        return [
+            _task_summary(t) for t in self._project(project)["tasks"]
+            if needle in t.get("title", "").lower() or needle in blobs.text(t.get("description")).lower()
+        ]
+
+    def rpc_load(self):
+        return self.user_settings
+
+    def rpc_changes(self, revisions=None):
+        return self._changes(revisions)
+
+    def rpc_call(self, function, args=(), revisions=None):
+        if function not in REMOTE_FUNCTIONS:
+            raise RequestError(METHOD_NOT_FOUND, f"Unknown function '{function}'")
+        result = REMOTE_FUNCTIONS[function](self.user_settings, *args)
+        return {"result": result, "changes": self._changes(revisions)}
+
+    WRITE_METHODS = ("move", "create", "edit", "archive", "call")
+
+    def dispatch(self, method, params):
+        """
+        Runs a method under the store lock and returns its JSON encoded
+        result, so the result is serialized before another write can run.
+        """
+        handler = getattr(self, f"rpc_{method}", None)
+        if handler is None:
+            raise RequestError(METHOD_NOT_FOUND, f"Unknown method '{method}'")
+
+        changed = None
+        with self.lock:
+            if method in self.WRITE_METHODS:
+                before = self._revisions()
+            try:
+                # Save failures go back to the client as errors
+                with settings.saves_reported_to_caller():
+                    result = handler(**params) if isinstance(params, dict) else handler(*params)
+            except TypeError as e:
+                raise RequestError(INVALID_PARAMS, str(e))
+            encoded = json.dumps(result, separators=(",", ":"))
+            if method in self.WRITE_METHODS:
+                after = self._revisions()
+                changed = {
+                    "projects": {key: value for key, value in after.items() if before.get(key) != value},
+                    "removed": [int(key) for key in before if key not in after],
+                }
+                rebalances = ranks.pending_rebalances()
+
+        # Notify outside of the lock so a slow subscriber never holds up writes
+        if changed is not None and (changed["projects"] or changed["removed"]):
+            self.notify(changed)
+        if changed is not None and rebalances:
+            threading.Thread(target=self.rebalance, args=(rebalances,), daemon=True).start()
+        return encoded
+
+    def rebalance(self, columns):
+        """
+        Respaces columns whose rank keys grew too long, in the background
+        so the write that made them long is answered right away.
+        """
+        for project_id, status in columns:
+            try:
+                self.dispatch("call", {"function": "rebalance_ranks", "args": [project_id, status]})
+            except RequestError:
+                pass
+
+    def notify(self, params):
+        """
+        Sends a change notification to every subscribed connection.
+        """
+        message = (json.dumps({"jsonrpc": "2.0", "method": "changed", "params": params}) + "\n").encode("utf-8")
+        with self.subscribers_lock:
+            subscribers = list(self.subscribers.items())
+        for handler, write_lock in subscribers:
+            try:
+                with write_lock:
+                    handler.wfile.write(message)
+            except OSError:
+                self.unsubscribe(handler)
+
+    def subscribe(self, handler):
+        with self.subscribers_lock:
+            self.subscribers[handler] = handler.write_lock
+
+    def unsubscribe(self, handler):
+        with self.subscribers_lock:
+            self.subscribers.pop(handler, None)
+
+class RequestHandler(socketserver.StreamRequestHandler):
+    """
+    Handles the requests of one connection, one JSON object per line.
+    """
+
+    def setup(self):
+        super().setup()
+        self.write_lock = threading.Lock()
+
+    def respond(self, request_id, result_json=None, error=None):
+        if request_id is None:
+            return
+        if error is not None:
+            body = json.dumps({"jsonrpc": "2.0", "id": request_id, "error": error})
+        else:
+            body = f'{{"jsonrpc":"2.0","id":{json.dumps(request_id)},"result":{result_json}}}'
+        with self.write_lock:
+            self.wfile.write((body + "\n").encode("utf-8"))
+
+    def handle(self):
+        try:
+            for line in self.rfile:
+                try:
+                    request = json.loads(line)
+                except ValueError:
+                    self.respond(0, error={"code": PARSE_ERROR, "message": "Parse error"})
+                    continue
+
+                request_id = request.get("id")
+                method = request.get("method", "")
+                params = request.get("params") or {}
+                try:
+                    if method == "subscribe":
+                        self.server.subscribe(self)
+                        self.respond(request_id, "null")
+                    else:
+                        self.respond(request_id, self.server.dispatch(method, params))
+                except RequestError as e:
+                    self.respond(request_id, error={"code": e.code, "message": str(e)})
+                except Exception as e:
+                    self.respond(request_id, error={"code": REQUEST_FAILED, "message": str(e)})
+        except OSError:
+            pass
+        finally:
+            self.server.unsubscribe(self)
+
+def daemon_running(path=None):
+    """
+    Returns True if a daemon is accepting connections on the socket.
+    """
+    path = path or socket_path()
+    if not os.path.exists(path):
+        return False
+    probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        probe.connect(str(path))
+        return True
+    except OSError:
+        return False
+    finally:
+        probe.close()
+
+def create_server(user_settings, path=None):
+    """
+    Binds the daemon to its socket, removing a stale socket left
+    behind by a daemon that did not shut down cleanly.
+    """
+    path = path or socket_path()
+    if daemon_running(path):
+        raise RuntimeError(f"A kb daemon is already running on {path}")
+    if os.path.exists(path):
+        os.unlink(path)
+    return BoardServer(path, user_settings)
+
+def serve(user_settings):
+    """
+    Runs the daemon until interrupted.
+    """
+    # Clients open any board, so upgrade them all before serving any
+    for project in user_settings["projects"]:
+        error = settings.upgrade_project(user_settings, project["title"])
+        if error:
+            print(f"{ansi.RED}{error}{ansi.RESET}")
+
+    try:
+        server = create_server(user_settings)
+    except RuntimeError as e:
+        print(f"{ansi.RED}{e}{ansi.RESET}")
+        return
+
+    print(f"{ansi.GREEN}kb daemon listening on {socket_path()}{ansi.RESET}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        if os.path.exists(socket_path()):
+            os.unlink(socket_path())
+
+def attach():
+    """
+    Connects to the running daemon and routes every settings change
+    through it. Returns the daemon's settings.
+    """
+    client.ATTACHED = client.Client(socket_path())
+    return client.ATTACHED.call("load")
@@ -7,7 +7,23 @@ This file controls reading and writing settings to
 """
 
 import ansi
+import blobs
+import client
+import codec
+import copy
 import json
+import history
+import hooks
+import manifest
+import os
+import ranks
+import schema
+import snapshots
+import sparse
+import threading
+import zlib
+from contextlib import contextmanager
+from datetime import date
 from pathlib import Path
 
 SETTINGS_PATH = Path.home() / "Documents" / "narlock" / "kb" / "settings.json"
@@ -15,6 +31,7 @@ SETTINGS_PATH = Path.home() / "Documents" / "narlock" / "kb" / "settings.json"
 INITIAL_SETTINGS = {
     "recentProjectTitle": "kb",
     "nextProjectId": 1,
+    "undoDepth": 100,
     "projects": [
         {
             "id": 0,
@@ -89,6 +106,10 @@ TASK_TYPE_OPTIONS = ["story", "bug", "feature", "spike"]
 TASK_PRIORITY_TYPE_OPTIONS = ["very low", "low", "medium", "high", "very high", "critical"]
 TASK_STATUS_TYPE_OPTIONS = ["backlog", "todo", "doing", "done"]
 
+# The stamp settings.json had when it was loaded with damaged projects
+# left out, which saving over it would lose (see save_settings)
+_damaged_stamp = None
+
 def write_initial_settings():
     """
     Called when there is no settings.json, this function
@@ -101,40 +122,237 @@ def write_initial_settings():
     settings_dir = SETTINGS_PATH.parent
     settings_dir.mkdir(parents=True, exist_ok=True)
     
-    with open(SETTINGS_PATH, 'w', encoding='utf-8') as f:
-        json.dump(INITIAL_SETTINGS, f, indent=4)
+    # Stamped here rather than in INITIAL_SETTINGS, since schema imports this module.
+    # The initial board is already in the current format and needs no migrations.
+    initial_settings = copy.deepcopy(INITIAL_SETTINGS)
+    for project in initial_settings["projects"]:
+        project["schemaVersion"] = schema.SCHEMA_VERSION
+
+    with open(SETTINGS_PATH, 'wb') as f:
+        f.write(codec.encode(initial_settings))
     print("Initial settings.json file created.")
 
+def save_settings(settings, drop_damaged: bool = False):
+    """
+    Writes the settings object to settings.json with the codec named
+    by the "codec" setting (see codec.py), without printing anything.
+    Raises an exception, leaving settings.json as it was, if it cannot
+    be written.
+
+    Settings loaded from a settings.json with damaged projects are
+    missing those projects, so saving over that file is refused until
+    `kb fsck --repair` has quarantined them, which passes
+    `drop_damaged`.
+    """
+    codec_name = settings.get("codec", codec.DEFAULT_CODEC)
+    # Projects only known from the manifest are copied as they are, or read if they cannot be
+    pieces = _unloaded_pieces(settings, codec_name)
+    if pieces is None:
+        load_projects(settings)
+    if not drop_damaged and _damaged_stamp is not None and _damaged_stamp == _settings_stamp():
+        raise RuntimeError("settings.json has damaged projects that saving would lose, run `kb fsck --repair` first")
+    # Long descriptions are kept in the blob store, not in settings.json
+    blobs.externalize()
+    layout = []
+    data = codec.encode(settings, codec_name, pieces, layout)
+    temp_path = SETTINGS_PATH.with_suffix(".tmp")
+    with open(temp_path, 'wb') as f:
+        f.write(data)
+        # Flushed first, or the stamp would miss the buffered bytes
+        f.flush()
+        stamp = manifest.file_stamp(os.fstat(f.fileno()))
+    os.replace(temp_path, SETTINGS_PATH)
+    manifest.write(settings, stamp, layout)
+    # Chunked and stored on a background thread
+    snapshots.schedule(data)
+    # The hooks only hear of changes once they are saved
+    hooks.release(settings)
+
+def _unloaded_pieces(settings, codec_name: str):
+    """
+    Returns the (bytes, checksum) of every summarized project of the
+    settings, keyed by id, copied from settings.json at the offsets
+    the manifest records. Returns None if any of them cannot be
+    copied: settings.json or the project changed since, or it is
+    written with another codec.
+    """
+    unloaded = [project for project in settings.get("projects", []) if "tasks" not in project]
+    if not unloaded:
+        return {}
+    current = manifest.load()
+    if current is None or current["settings"].get("codec", codec.DEFAULT_CODEC) != codec_name:
+        return None
+    entries = {entry["id"]: entry for entry in current["projects"]}
+    pieces = {}
+    try:
+        with open(SETTINGS_PATH, 'rb') as f:
+            if manifest.file_stamp(os.fstat(f.fileno())) != current["stamp"]:
+                return None
+            for project in unloaded:
+                entry = entries.get(project["id"])
+                if entry is None or "bytes" not in entry or entry.get("revision") != project.get("revision", 0):
+                    return None
+                offset, length, checksum = entry["bytes"]
+                f.seek(offset)
+                pieces[project["id"]] = (f.read(length), checksum)
+    except OSError:
+        return None
+    return pieces
+
+def _settings_stamp():
+    try:
+        return manifest.file_stamp(os.stat(SETTINGS_PATH))
+    except OSError:
+        return None
+
 def update_settings(settings):
     """
     Updates the settings.json file with an updated
-    settings object.
+    settings object (see save_settings), reporting
+    the outcome on the terminal (see saves_reported_to_caller).
+
+    When attached to a kb daemon, the daemon owns settings.json,
+    so only the top level values (such as recentProjectTitle)
+    are sent to it.
     """
+    if client.ATTACHED is not None:
+        update_top_level_settings(settings, {k: v for k, v in settings.items() if k != "projects"})
+        return
+
     try:
-        with open(SETTINGS_PATH, 'w', encoding='utf-8') as f:
-            json.dump(settings, f, indent=4)
-        print(f"\n{ansi.GREEN}{ansi.BOLD}Settings updated successfully.{ansi.RESET}")
+        save_settings(settings)
     except Exception as e:
+        # The hooks never hear of changes that were not saved
+        hooks.discard(settings)
+        if getattr(_reporting, "active", False):
+            raise
         print(f"{ansi.RED}{ansi.BOLD}Error updating settings: {e}{ansi.RESET}")
+        return
+    if not getattr(_reporting, "active", False):
+        print(f"\n{ansi.GREEN}{ansi.BOLD}Settings updated successfully.{ansi.RESET}")
+
+# Set per thread by saves_reported_to_caller
+_reporting = threading.local()
+
+@contextmanager
+def saves_reported_to_caller():
+    """
+    Within the block, update_settings saves silently on this thread
+    and raises when saving fails, leaving the outcome to the caller.
+    The kb daemon uses it to answer its clients instead of printing.
+    """
+    _reporting.active = True
+    try:
+        yield
+    finally:
+        _reporting.active = False
+
+@client.remote
+def update_top_level_settings(user_settings, values):
+    """
+    Updates top level settings values (everything except projects)
+    and saves them.
+    """
+    user_settings.update({k: v for k, v in values.items() if k != "projects"})
+    update_settings(user_settings)
 
 def load_settings():
     """
     Reads settings from $HOME/Documents/narlock/kb/settings.json.
     If any of the directories or paths do not exist, we will run
     write_initial_settings function, and then reload our settings.
+    The codec the file was written with is detected automatically.
     """
     if not SETTINGS_PATH.exists():
         print("Settings file not found. Creating initial settings.")
         write_initial_settings()
     
+    global _damaged_stamp
+    data = None
+    damaged = []
     try:
-        with open(SETTINGS_PATH, 'r', encoding='utf-8') as f:
-            return json.load(f)
+        with open(SETTINGS_PATH, 'rb') as f:
+            data = f.read()
+            stamp = manifest.file_stamp(os.fstat(f.fileno()))
+        user_settings = codec.decode(data, damaged)
+        blobs.track(user_settings.get("projects", []))
+        if damaged:
+            _damaged_stamp = stamp
+        for description, record in damaged:
+            # Load the intact projects, keeping the damaged ones for `kb fsck`
+            if record:
+                path = schema.quarantine(f"project-{zlib.crc32(record):08x}.damaged", record)
+                description += f", kept at {path}"
+            print(f"{ansi.RED}settings.json: {description}. Run `kb fsck`.{ansi.RESET}")
+        return user_settings
     except Exception as e:
         print(f"Error loading settings: {e}. Resetting to default.")
+        if data:
+            # Keep the unreadable file rather than losing it to the defaults
+            print(f"The unreadable settings were kept at {schema.quarantine('settings.json', data)}")
         write_initial_settings()
-        return INITIAL_SETTINGS
+        return copy.deepcopy(INITIAL_SETTINGS)
     
+def load_summary():
+    """
+    Returns the user settings with every project summarized from the
+    manifest (see manifest.py) instead of loaded, which is all the
+    menus need. Summarized projects have no "tasks" until
+    load_projects is called. Falls back to load_settings when the
+    manifest is missing or out of date.
+    """
+    summary = manifest.load() if SETTINGS_PATH.exists() else None
+    if summary is None:
+        user_settings = load_settings()
+        if SETTINGS_PATH.exists():
+            manifest.write(user_settings, manifest.file_stamp(os.stat(SETTINGS_PATH)))
+        return user_settings
+    return {**summary["settings"], "projects": summary["projects"]}
+
+def _load_project_records(projects, project_ids):
+    # The manifest lists projects in the order settings.json stores them
+    try:
+        with open(SETTINGS_PATH, 'rb') as f:
+            data = f.read()
+    except OSError:
+        return None
+    loaded = {}
+    for position, project in enumerate(projects):
+        if "tasks" in project or project["id"] not in project_ids:
+            continue
+        record = codec.decode_project(data, position)
+        if record is None or record.get("id") != project["id"]:
+            return None
+        loaded[project["id"]] = record
+    blobs.track(loaded.values())
+    return loaded
+
+def load_projects(user_settings, project_ids=None):
+    """
+    Replaces the summarized projects of user settings from
+    load_summary with the projects in settings.json, in place.
+    Projects that are already loaded are kept as they are.
+
+    With `project_ids`, only those projects are loaded, decoding just
+    their part of settings.json where the codec allows (see
+    codec.decode_project), so opening one board does not parse the
+    others.
+    """
+    projects = user_settings.get("projects", [])
+    if all("tasks" in project for project in projects if project_ids is None or project["id"] in project_ids):
+        return
+    if project_ids is not None:
+        loaded = _load_project_records(projects, set(project_ids))
+        if loaded is not None:
+            projects[:] = [loaded.get(project["id"], project) for project in projects]
+            return
+    loaded = {project["id"]: project for project in load_settings().get("projects", [])}
+    projects[:] = [
+        project if "tasks" in project else loaded[project["id"]]
+        for project in projects
+        if "tasks" in project or project["id"] in loaded
+    ]
+
 def generate_task_map_for_project(settings, project_title):
     """
     Given the settings object and a title of a project, this function
@@ -150,35 +368,21 @@ def generate_task_map_for_project(settings, project_title):
         "done": []
     }
 
-    for project in settings.get("projects", []):
-        if project.get("title") == project_title:
-            for task in project.get("tasks", []):
-                status = task.get("status", "").lower()
-                if status in task_map:
-                    task_map[status].append((task["id"], task["title"]))
-                else:
-                    task_map.setdefault(status, []).append((task["id"], task["title"]))
-            break  # Found the project, no need to keep looping
+    project = get_project_by_title(settings, project_title)
+    if project:
+        # Columns come out of the rank index already in order
+        index = ranks.column_index(project)
+        for status in index.statuses():
+            task_map.setdefault(status.lower(), []).extend((task["id"], task["title"]) for task in index.tasks_in(status))
 
     return task_map
 
-def move_kanban_item_by_id(user_settings, project_title, item_id: int, column: str = None):
+def move_op(project, item_id: int, column: str = None):
     """
-    Moves the respective kanban item to the next or defined column.
-
-    If `column` is None, it moves the task to the next column in the flow.
-    Valid columns are: "backlog", "todo", "doing", "done".
-
-    Returns:
-        str: error message if something goes wrong
-        None: on successful move
+    Returns the operation moving a task of the project to the next or
+    defined column (see move_kanban_item_by_id), or an error message.
     """
     valid_columns = ["backlog", "todo", "doing", "done"]
-    project = next((p for p in user_settings["projects"] if p["title"] == project_title), None)
-
-    if not project:
-        return "Project not found."
-
     task = next((t for t in project["tasks"] if t["id"] == item_id), None)
 
     if not task:
@@ -200,7 +404,142 @@ def move_kanban_item_by_id(user_settings, project_title, item_id: int, column: s
             return f"Invalid destination column '{column}'. Valid options: {valid_columns}"
         new_status = column
 
-    task["status"] = new_status
+    before = {"status": current_status}
+    after = {"status": new_status}
+
+    # Track when work on the task started and finished
+    today = date.today().isoformat()
+    if new_status == "doing" and not task.get("startDate"):
+        before["startDate"] = task.get("startDate", "")
+        after["startDate"] = today
+    if new_status == "done":
+        before["completeDate"] = task.get("completeDate")
+        after["completeDate"] = today
+    elif task.get("completeDate"):
+        before["completeDate"] = task.get("completeDate")
+        after["completeDate"] = None
+
+    return {
+        "op": "update",
+        "project": project["id"],
+        "task": item_id,
+        "before": before,
+        "after": after
+    }
+
+@client.remote
+def move_kanban_item_by_id(user_settings, project_title, item_id: int, column: str = None):
+    """
+    Moves the respective kanban item to the next or defined column.
+
+    If `column` is None, it moves the task to the next column in the flow.
+    Valid columns are: "backlog", "todo", "doing", "done".
+
+    Returns:
+        str: error message if something goes wrong
+        None: on successful move
+    """
+    project = get_project_by_title(user_settings, project_title)
+
+    if not project:
+        return "Project not found."
+
+    op = move_op(project, item_id, column)
+    if isinstance(op, str):
+        return op
+
+    history.perform(user_settings, op)
+    update_settings(user_settings)
+
+RANK_POSITIONS = ["top", "bottom", "before", "after"]
+
+@client.remote
+def rank_kanban_task(user_settings, project_title: str, item_id: int, position: str, other_id: int = None):
+    """
+    Moves a task to the top or bottom of its column, or before or
+    after another task in the same column. Only the task's own rank
+    changes.
+
+    Returns:
+        str: error message if something went wrong
+        None: on success
+    """
+    project = get_project_by_title(user_settings, project_title)
+    if not project:
+        return "Project not found."
+    if position not in RANK_POSITIONS:
+        return f"Invalid position '{position}'. Valid options: {RANK_POSITIONS}"
+
+    index = ranks.column_index(project)
+    task = index.tasks.get(item_id)
+    if not task:
+        return f"Task with id {item_id} not found."
+
+    other = None
+    if position in ("before", "after"):
+        other = index.tasks.get(other_id)
+        if not other:
+            return f"Task with id {other_id} not found."
+        if other["status"] != task["status"] or other is task:
+            return f"Task {other_id} is not another task in the {task['status']} column."
+
+    new_rank = index.new_rank(task, position, other)
+    if new_rank is None:
+        ranks.queue_rebalance(project["id"], task["status"])
+        return "Ranks in this column collide and will be respaced, please try again."
+    if new_rank == ranks.rank_of(task):
+        return None
+
+    history.perform(user_settings, {
+        "op": "update",
+        "project": project["id"],
+        "task": task["id"],
+        "before": {"rank": task.get("rank")},
+        "after": {"rank": new_rank}
+    })
+    update_settings(user_settings)
+
+@client.remote
+def rebalance_ranks(user_settings, project_id: int, status: str):
+    """
+    Respaces the ranks of a column whose keys have grown too long,
+    keeping its order. The respace is applied without being recorded,
+    since it changes nothing the user can see, so undo and redo still
+    step through the user's own changes.
+    """
+    project = get_project_by_id(user_settings, project_id)
+    if not project:
+        return "Project not found."
+
+    op = ranks.rebalance_op(project, status)
+    if op:
+        history.apply(user_settings, op)
+        update_settings(user_settings)
+
+@client.remote
+def update_kanban_task(user_settings, project_title: str, task, original):
+    """
+    Persists edits made to `task`, where `original` is a copy of the
+    task from before editing began. Only the changed fields are
+    recorded in the undo history.
+
+    Returns:
+        str: Error message if the project is not found.
+        None: On successful update.
+    """
+    project = get_project_by_title(user_settings, project_title)
+    if not project:
+        return "Project not found."
+
+    changed = [key for key in task if sparse.field(original, key) != task[key]]
+    if changed:
+        history.perform(user_settings, {
+            "op": "update",
+            "project": project["id"],
+            "task": task["id"],
+            "before": {key: sparse.field(original, key) for key in changed},
+            "after": {key: task[key] for key in changed}
+        })
     update_settings(user_settings)
 
 def get_kanban_task_by_id(user_settings, project_title: str, item_id: int):
@@ -213,11 +552,11 @@ def get_kanban_task_by_id(user_settings, project_title: str, item_id: int):
         item_id (int): The ID of the task to retrieve.
 
     Returns:
-        dict: The task if found.
+        dict: A copy of the task if found, with its long text read back.
         str: Error message if the project or task is not found.
     """
     # Get project
-    project = next((p for p in user_settings["projects"] if p["title"] == project_title), None)
+    project = get_project_by_title(user_settings, project_title)
     if not project:
         return "Project not found."
 
@@ -226,7 +565,9 @@ def get_kanban_task_by_id(user_settings, project_title: str, item_id: int):
     if not task:
         return f"Task with id {item_id} not found."
     
-    return task
+    # Read long text fields back from the blob store now that the task is
+    # opened, into a copy so the board keeps its references
+    return blobs.materialize(copy.deepcopy(task))
 
 def get_kanban_tasks(user_settings, project_title: str):
     """
@@ -237,7 +578,7 @@ def get_kanban_tasks(user_settings, project_title: str):
         str: Error message if the project is not found.
     """
     # Get project
-    project = next((p for p in user_settings["projects"] if p["title"] == project_title), None)
+    project = get_project_by_title(user_settings, project_title)
     if not project:
         return "Project not found."
     
@@ -255,13 +596,12 @@ def get_kanban_tasks_by_status(user_settings, project_title: str, status: str):
         str: Error message if the project is not found.
     """
     # Get project
-    project = next((p for p in user_settings["projects"] if p["title"] == project_title), None)
+    project = get_project_by_title(user_settings, project_title)
     if not project:
         return "Project not found."
     
-    # Filter tasks with status 'status'
-    status_tasks = [task for task in project["tasks"] if task["status"] == status]
-    return status_tasks
+    # Tasks with status 'status', in rank order
+    return ranks.column_index(project).tasks_in(status)
 
 def get_backlog_task_ids(user_settings, project_title: str):
     """
@@ -272,14 +612,14 @@ def get_backlog_task_ids(user_settings, project_title: str):
         str: Error message if the project is not found.
     """
     # Get project
-    project = next((p for p in user_settings["projects"] if p["title"] == project_title), None)
+    project = get_project_by_title(user_settings, project_title)
     if not project:
         return "Project not found."
     
-    # Extract IDs of tasks with status 'backlog'
-    backlog_ids = [task["id"] for task in project["tasks"] if task["status"] == "backlog"]
-    return backlog_ids
+    # IDs of tasks with status 'backlog', in rank order
+    return ranks.column_index(project).ids("backlog")
 
+@client.remote
 def delete_kanban_item_by_id(user_settings, project_title: str, item_id: int):
     """
     Deletes the respective kanban item from the specified project.
@@ -289,7 +629,7 @@ def delete_kanban_item_by_id(user_settings, project_title: str, item_id: int):
         None: on successful delete
     """
     # Get project
-    project = next((p for p in user_settings["projects"] if p["title"] == project_title), None)
+    project = get_project_by_title(user_settings, project_title)
     if not project:
         return "Project not found."
     
@@ -301,18 +641,25 @@ def delete_kanban_item_by_id(user_settings, project_title: str, item_id: int):
     # Find and delete the task
     for index, task in enumerate(project['tasks']):
         if item_id == task['id']:
-            del project['tasks'][index]
+            history.perform(user_settings, {
+                "op": "remove",
+                "project": project["id"],
+                "index": index,
+                "task": task
+            })
+            break
     
     # Persist changes to the settings model on disk
     update_settings(user_settings)
 
+@client.remote
 def add_kanban_task(user_settings, project_title: str, kanban_task):
     """
     Adds the kanban task to the user settings.
     Assigns a unique ID based on project["nextTaskId"].
     """
     # Get project
-    project = next((p for p in user_settings["projects"] if p["title"] == project_title), None)
+    project = get_project_by_title(user_settings, project_title)
     if not project:
         return "Project not found."
     
@@ -321,34 +668,64 @@ def add_kanban_task(user_settings, project_title: str, kanban_task):
     project["nextTaskId"] = kanban_task["id"] + 1
 
     # Add task to the project
-    project["tasks"].append(kanban_task)
+    history.perform(user_settings, {
+        "op": "insert",
+        "project": project["id"],
+        "index": len(project["tasks"]),
+        "task": kanban_task
+    })
 
     # Persist changes to disk or wherever your update_settings function goes
     update_settings(user_settings)
 
+@client.remote
 def archive_completed_kanban_tasks(user_settings, project_title: str):
     """
-    Used for the "complete" operation, this function deletes
-    all of the tasks for the specified project where the 
-    status attribute is 'done'.
+    Used for the "complete" operation, this function moves
+    all of the tasks for the specified project where the
+    status attribute is 'done' out of settings.json and
+    into the project's archive.
 
     Returns:
         str: Error message if the project is not found.
-        None: On successful deletion of tasks.
+        None: On successful archive of tasks.
     """
     # Get project
-    project = next((p for p in user_settings["projects"] if p["title"] == project_title), None)
+    project = get_project_by_title(user_settings, project_title)
     if not project:
         return "Project not found."
 
-    # Filter out tasks that are not done
-    for task in project["tasks"]:
-        if task["status"] == "done":
-            task["status"] = "archived"
+    # Collect completed tasks (and any left over from the old in-place archive)
+    archived = [
+        [index, task] for index, task in enumerate(project["tasks"])
+        if task["status"] in ("done", "archived")
+    ]
+    if not archived:
+        return None
+
+    op = {"op": "archive", "project": project["id"], "tasks": archived}
+    history.perform(user_settings, op)
 
     # Persist changes to disk or user settings
     update_settings(user_settings)
 
+@client.remote
+def restore_archived_task(user_settings, project_title: str, archived_task):
+    """
+    Restores a task from the project's archive back to the done column.
+
+    Returns:
+        str: Error message if the project is not found.
+        None: On successful restore.
+    """
+    project = get_project_by_title(user_settings, project_title)
+    if not project:
+        return "Project not found."
+
+    op = {"op": "unarchive", "project": project["id"], "tasks": [[len(project["tasks"]), archived_task]]}
+    history.perform(user_settings, op)
+    update_settings(user_settings)
+
 def get_next_task_id(user_settings, project_title: str):
     """
     Retrieves the next task id given the user_settings and
@@ -359,7 +736,7 @@ def get_next_task_id(user_settings, project_title: str):
         int: The next task ID.
     """
     # Get project
-    project = next((p for p in user_settings["projects"] if p["title"] == project_title), None)
+    project = get_project_by_title(user_settings, project_title)
     if not project:
         return "Project not found."
 
@@ -376,6 +753,31 @@ def kanban_project_exists(user_settings, project_title: str):
     
     return True
 
+def get_project_by_title(user_settings, project_title: str):
+    """
+    Returns the project with the given title, or None if it does not exist.
+    """
+    return next((p for p in user_settings["projects"] if p["title"] == project_title), None)
+
+def get_project_by_id(user_settings, project_id: int):
+    """
+    Returns the project with the given id, or None if it does not exist.
+    """
+    return next((p for p in user_settings["projects"] if p["id"] == project_id), None)
+
+def upgrade_project(user_settings, project_title: str):
+    """
+    Upgrades a loaded project to the current schema (see schema.py).
+    Called where a board is opened, so looking a project up never
+    changes it.
+
+    Returns:
+        str: error message if the project could not be upgraded
+        None: on success, or if there was nothing to do
+    """
+    project = get_project_by_title(user_settings, project_title)
+    return schema.upgrade(project) if project is not None else None
+
 def get_project_ids(user_settings):
     """
     Returns a list of project ids as they appear in user settings.
@@ -383,6 +785,32 @@ def get_project_ids(user_settings):
     """
     return [project['id'] for project in user_settings['projects']]
 
+@client.remote
+def add_kanban_project(user_settings, project_title: str):
+    """
+    Creates a new, empty kanban project and makes it the recent project.
+    Assigns a unique ID based on user_settings["nextProjectId"].
+
+    Returns:
+        str: Error message if a project with the title already exists.
+        None: On successful creation.
+    """
+    if kanban_project_exists(user_settings, project_title):
+        return "Project already exists!"
+
+    project = {
+        "id": user_settings['nextProjectId'],
+        "title": project_title,
+        "nextTaskId": 0,
+        "schemaVersion": schema.SCHEMA_VERSION,
+        "tasks": []
+    }
+    user_settings['nextProjectId'] = user_settings['nextProjectId'] + 1
+    user_settings['projects'].append(project)
+    user_settings['recentProjectTitle'] = project['title']
+    update_settings(user_settings)
+
+@client.remote
 def delete_project_by_title(user_settings, project_title: str):
     """
     Deletes a kanban project given its project_title.
@@ -0,0 +1,407 @@
+"""
+kb - snapshots.py
+author: narlock
+
+This file controls the point-in-time snapshots of settings.json taken
+every time it is saved, kept at
+
+~/Documents/narlock/kb/snapshots/<snapshot id>.json
+~/Documents/narlock/kb/snapshots/chunks/<first 2 hex digits>/<sha-256 of the chunk>.z
+
+A snapshot is cut into content-defined chunks: a boundary is placed
+after a newline or between two JSON objects ("},{") whenever the
+CRC-32 of the text since the previous candidate has its low bits
+clear. Boundaries therefore depend on the nearby content alone, so
+an edit only changes the chunks around it, and every chunk that is
+already stored is shared with the snapshots before it.
+
+The list of chunk digests is itself chunked the same way, so the
+snapshot record only names the few index chunks:
+
+    {"id": "20251019-091500-3fa2", "time": 1760865300.1, "size": 52011,
+     "sha256": "9f86d0...", "index": ["2c26b4...", ...]}
+
+Moving one task therefore stores a few KB of new chunks, however big
+the board is.
+
+Saving only hands the new contents to a low priority background
+thread, which waits until saving pauses for QUIET_SECONDS, chunks
+and writes the snapshot (only the newest of several quick saves),
+and applies the retention policy: the KEEP_RECENT newest
+snapshots and the newest snapshot of each of the last KEEP_DAILY days
+are kept. Chunks no snapshot refers to any more, and blobs nothing
+refers to (see blobs.py), are collected at most once every
+GC_INTERVAL seconds.
+
+Blobs are never rewritten, and every board lists the archive
+segments that go with it (see archive.py), so a snapshot of
+settings.json is all a restore needs: segments archived after the
+snapshot are set aside rather than showing tasks twice. Restoring is
+refused while syncing, since the other replicas would bring the
+replaced changes back, and the restored boards do not sync until
+`kb sync <directory>` publishes them again.
+"""
+
+import archive
+import atexit
+import blobs
+import hashlib
+import json
+import os
+import re
+import secrets
+import threading
+import time
+import zlib
+import codec
+import history
+import settings
+import sync
+
+MIN_CHUNK = 2048
+MAX_CHUNK = 65536
+BOUNDARY_MASK = 0x3F
+CANDIDATES = re.compile(rb"\n|\},\{")
+
+KEEP_RECENT = 50
+KEEP_DAILY = 30
+GC_INTERVAL = 3600
+# Chunks written this recently may belong to a snapshot still being taken
+GC_GRACE = 600
+EXIT_WAIT_SECONDS = 10
+QUIET_SECONDS = 2
+
+def snapshots_dir():
+    """
+    Snapshots live next to settings.json.
+    """
+    return settings.SETTINGS_PATH.parent / "snapshots"
+
+def chunks_dir():
+    return snapshots_dir() / "chunks"
+
+def chunk_path(digest: str):
+    return blobs.object_path(chunks_dir(), digest)
+
+def record_path(snapshot_id: str):
+    return snapshots_dir() / f"{snapshot_id}.json"
+
+def gc_stamp_path():
+    return snapshots_dir() / "gc-stamp"
+
+# Chunking
+
+def cut(data):
+    """
+    Returns the content-defined chunks of data, in order.
+    """
+    chunks = []
+    start = 0
+    previous = 0
+    for match in CANDIDATES.finditer(data):
+        end = match.end()
+        if end - start > MAX_CHUNK:
+            # Too long without a boundary, cut at the last candidate
+            if previous > start:
+                chunks.append(data[start:previous])
+                start = previous
+            # or every MAX_CHUNK bytes if there was none
+            while end - start > MAX_CHUNK:
+                chunks.append(data[start:start + MAX_CHUNK])
+                start += MAX_CHUNK
+        if end - start >= MIN_CHUNK and zlib.crc32(data[previous:end]) & BOUNDARY_MASK == 0:
+            chunks.append(data[start:end])
+            start = end
+        previous = end
+    while len(data) - start > MAX_CHUNK:
+        chunks.append(data[start:start + MAX_CHUNK])
+        start += MAX_CHUNK
+    if start < len(data):
+        chunks.append(data[start:])
+    return chunks
+
+def put_chunk(chunk):
+    """
+    Stores a chunk in the chunk store (see blobs.write_object),
+    returning its digest.
+    """
+    return blobs.write_object(chunks_dir(), chunk)
+
+def get_chunk(digest: str):
+    return blobs.read_object(chunks_dir(), digest)
+
+def put_chunks(data):
+    return [put_chunk(chunk) for chunk in cut(data)]
+
+# Snapshot records
+
+def list_snapshots():
+    """
+    Returns the snapshot records, oldest first.
+    """
+    directory = snapshots_dir()
+    if not directory.exists():
+        return []
+    records = []
+    for path in sorted(directory.glob("*.json")):
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                records.append(json.load(f))
+        except (OSError, ValueError):
+            continue
+    # Ids only tell snapshots of the same second apart, not their order
+    records.sort(key=lambda record: record["time"])
+    return records
+
+def chunk_digests(record):
+    """
+    Returns the digests of a snapshot's data chunks, in order.
+    """
+    index = b"".join(get_chunk(digest) for digest in record["index"])
+    return index.decode("ascii").split()
+
+def take(data):
+    """
+    Stores a snapshot of settings.json contents, unless they equal
+    the newest snapshot. Returns the new record or None.
+    """
+    sha256 = hashlib.sha256(data).hexdigest()
+    records = list_snapshots()
+    if records and records[-1]["sha256"] == sha256:
+        return None
+
+    digests = put_chunks(data)
+    index = "".join(f"{digest}\n" for digest in digests).encode("ascii")
+    now = time.time()
+    record = {
+        "id": f"{time.strftime('%Y%m%d-%H%M%S', time.localtime(now))}-{secrets.token_hex(2)}",
+        "time": now,
+        "size": len(data),
+        "sha256": sha256,
+        "index": put_chunks(index),
+    }
+    temp_path = record_path(record["id"]).with_suffix(".tmp")
+    with open(temp_path, 'w', encoding='utf-8') as f:
+        json.dump(record, f)
+    os.replace(temp_path, record_path(record["id"]))
+    return record
+
+def read(snapshot_id: str):
+    """
+    Returns the settings.json contents saved by a snapshot.
+    Raises ValueError if it does not exist or is damaged.
+    """
+    record = next((r for r in list_snapshots() if r["id"] == snapshot_id), None)
+    if record is None:
+        raise ValueError(f"No snapshot '{snapshot_id}'")
+    try:
+        data = b"".join(get_chunk(digest) for digest in chunk_digests(record))
+    except (OSError, zlib.error) as e:
+        raise ValueError(f"Snapshot '{snapshot_id}' is incomplete: {e}")
+    if hashlib.sha256(data).hexdigest() != record["sha256"]:
+        raise ValueError(f"Snapshot '{snapshot_id}' is damaged")
+    return data
+
+# Retention and garbage collection
+
+def expired(records, now: float):
+    """
+    Returns the records the retention policy no longer keeps.
+    """
+    keep = {record["id"] for record in records[-KEEP_RECENT:]}
+    newest_of_day = {}
+    for record in records:
+        if now - record["time"] < KEEP_DAILY * 86400:
+            newest_of_day[time.strftime("%Y-%m-%d", time.localtime(record["time"]))] = record["id"]
+    keep.update(newest_of_day.values())
+    return [record for record in records if record["id"] not in keep]
+
+def prune(now: float):
+    for record in expired(list_snapshots(), now):
+        try:
+            os.unlink(record_path(record["id"]))
+        except OSError:
+            pass
+
+def collect_garbage(now: float):
+    """
+    Deletes the chunks no snapshot refers to.
+    """
+    live = set()
+    for record in list_snapshots():
+        live.update(record["index"])
+        try:
+            live.update(chunk_digests(record))
+        except (OSError, ValueError, zlib.error):
+            # Keep what a damaged snapshot may still refer to
+            return
+    blobs.sweep(chunks_dir(), live, now, GC_GRACE)
+
+def maintain(now: float):
+    """
+    Applies the retention policy, collecting garbage if it is due.
+    """
+    prune(now)
+    try:
+        last_gc = gc_stamp_path().stat().st_mtime
+    except OSError:
+        last_gc = 0
+    if now - last_gc >= GC_INTERVAL:
+        gc_stamp_path().touch()
+        collect_garbage(now)
+        blobs.collect_garbage(now)
+
+# The background snapshot thread
+
+class Snapshotter:
+    """
+    Takes snapshots on a background thread, newest contents first.
+    """
+
+    def __init__(self):
+        self.condition = threading.Condition()
+        self.pending = None
+        self.scheduled_at = 0
+        self.flushing = False
+        self.busy = False
+        self.thread = None
+
+    def schedule(self, data):
+        with self.condition:
+            self.pending = data
+            self.scheduled_at = time.monotonic()
+            if self.thread is None:
+                self.thread = threading.Thread(target=self.run, name="kb-snapshots", daemon=True)
+                self.thread.start()
+                atexit.register(self.wait, EXIT_WAIT_SECONDS)
+            self.condition.notify()
+
+    def run(self):
+        try:
+            # Linux gives every thread its own nice value
+            os.setpriority(os.PRIO_PROCESS, threading.get_native_id(), 19)
+        except (AttributeError, OSError):
+            pass
+        while True:
+            with self.condition:
+                while self.pending is None:
+                    self.condition.wait()
+                # Start once saves pause, so snapshotting never competes with the next keypress
+                while not self.flushing:
+                    quiet = time.monotonic() - self.scheduled_at
+                    if quiet >= QUIET_SECONDS:
+                        break
+                    self.condition.wait(QUIET_SECONDS - quiet)
+                data, self.pending = self.pending, None
+                self.busy = True
+            try:
+                take(data)
+                maintain(time.time())
+            except Exception:
+                # A failed snapshot must never disturb the board
+                pass
+            finally:
+                with self.condition:
+                    self.busy = False
+                    self.condition.notify_all()
+
+    def wait(self, timeout: float = None):
+        """
+        Waits for scheduled snapshots to be written, such as before exiting.
+        """
+        with self.condition:
+            self.flushing = True
+            self.condition.notify_all()
+            self.condition.wait_for(lambda: self.pending is None and not self.busy, timeout)
+            self.flushing = False
+
+_snapshotter = Snapshotter()
+
+def schedule(data):
+    """
+    Snapshots the settings.json contents that were just saved, in the
+    background.
+    """
+    _snapshotter.schedule(data)
+
+def wait(timeout: float = None):
+    _snapshotter.wait(timeout)
+
+# Restoring
+
+def new_bytes(records):
+    """
+    Returns, for every record, the stored size of the chunks it
+    added to those of the snapshot before it.
+    """
+    sizes = []
+    previous = set()
+    for record in records:
+        try:
+            digests = set(chunk_digests(record)) | set(record["index"])
+            sizes.append(sum(chunk_path(digest).stat().st_size for digest in digests - previous))
+        except (OSError, ValueError, zlib.error):
+            digests = set()
+            sizes.append(None)
+        previous = digests
+    return sizes
+
+def _rebase_archives(current, restored):
+    """
+    Sets aside the archive segments that do not go with the restored
+    boards, returning project id -> the segments it had before.
+    """
+    previous = {}
+    wanted = {project["id"]: archive.segment_numbers(project) for project in restored.get("projects", [])}
+    for project in current.get("projects", []):
+        # Boards created after the snapshot keep no archive, their ids may be given out again
+        wanted.setdefault(project["id"], set())
+    for project_id, numbers in wanted.items():
+        if numbers is not None:
+            previous[project_id] = {archive.segment_number(path) for path in archive.list_segments(project_id)}
+            archive.rebase(project_id, numbers)
+    return previous
+
+def restore(snapshot_id: str):
+    """
+    Replaces settings.json with a snapshot, after snapshotting the
+    current contents so the restore itself can be undone. The undo
+    history is cleared, since it describes the replaced boards.
+
+    Returns:
+        str: error message if the snapshot cannot be restored
+        None: on success
+    """
+    current = settings.load_settings()
+    if sync.sync_dir(current):
+        return (f"Boards sync through {current['syncDir']}, whose other replicas would undo the restore. "
+                f"Remove \"syncDir\" from {settings.SETTINGS_PATH} on every machine first.")
+    try:
+        restored = codec.decode(read(snapshot_id))
+    except ValueError as e:
+        return str(e)
+    # Sync state is kept outside the snapshot, so the restored boards start unsynced
+    restored.pop("syncDir", None)
+    blobs.track(restored.get("projects", []))
+
+    with open(settings.SETTINGS_PATH, 'rb') as f:
+        take(f.read())
+
+    # Revisions must move forward so no cached summary or index is reused
+    revisions = {project["id"]: project.get("revision", 0) for project in current.get("projects", [])}
+    for project in restored.get("projects", []):
+        project["revision"] = max(project.get("revision", 0), revisions.get(project["id"], 0)) + 1
+    previous = _rebase_archives(current, restored)
+    try:
+        # Damaged projects of the replaced file are kept in the snapshot just taken
+        settings.save_settings(restored, drop_damaged=True)
+    except Exception as e:
+        for project_id, numbers in previous.items():
+            archive.rebase(project_id, numbers)
+        return f"Could not save settings.json: {e}"
+
+    log = history.load_history()
+    log["undo"].clear()
+    log["redo"].clear()
+    history.save_history()
+    return None
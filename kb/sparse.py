@@ -0,0 +1,113 @@
+"""
+kb - sparse.py
+author: narlock
+
+This file controls the sparse encoding of tasks in settings.json.
+
+Most tasks leave most of their fields at the empty values of
+settings.DEFAULT_TASK: no description or acceptance criteria, no
+effort, dates, fixVersion, tags, links, or checklist. From schema
+version 4 (see schema.py), a task is written without the fields that
+still hold their default:
+
+    {"id": 4, "title": "Fix login", "type": "bug", "priority": "high", "status": "todo"}
+
+The fields every view and index reads (id, title, type, priority, and
+status) are always written. Readers that use task.get already treat
+a missing field like its empty default, so only indexing needs help:
+tasks are loaded as Task dicts, which answer task["tags"] for a
+missing field with its default. Immutable defaults are shared; a
+mutable one (an empty list) is copied into the task the first time it
+is indexed, since that is how it gets changed, so a task only grows
+the fields that are actually used.
+"""
+
+import copy
+import settings
+
+SPARSE_VERSION = 4
+ALWAYS_STORED = ("id", "title", "type", "priority", "status")
+
+# field -> default, for the fields left out when they hold it
+_defaults = None
+
+def defaults():
+    global _defaults
+    if _defaults is None:
+        _defaults = {key: value for key, value in settings.DEFAULT_TASK.items() if key not in ALWAYS_STORED}
+    return _defaults
+
+class Task(dict):
+    """
+    A task that may be missing the fields holding their default.
+    """
+
+    __slots__ = ()
+
+    def __missing__(self, key):
+        default = defaults()[key]
+        if isinstance(default, (list, dict)):
+            # Copied on first use, so changes made through it are kept
+            value = self[key] = copy.deepcopy(default)
+            return value
+        return default
+
+def field(task, key: str):
+    """
+    Returns a task's field, or its default if the task leaves it out.
+    Unlike task.get, an edit's "before" values taken this way undo to
+    the default rather than to None.
+    """
+    if key in task:
+        return task[key]
+    return copy.deepcopy(defaults().get(key))
+
+def new_task(fields=None):
+    """
+    Returns a new task holding the given fields, and defaults for the rest.
+    """
+    task = Task({key: settings.DEFAULT_TASK[key] for key in ALWAYS_STORED})
+    task.update(copy.deepcopy(fields or {}))
+    return task
+
+def expand(task):
+    """
+    Returns a plain dict copy of a task with every default field filled in.
+    """
+    return {**copy.deepcopy(settings.DEFAULT_TASK), **copy.deepcopy(dict(task))}
+
+def strip(task):
+    """
+    Returns the fields of a task that do not hold their default.
+    """
+    # A plain dict, as the codecs write them (see codec.py)
+    stripped = dict(task)
+    for key, default in defaults().items():
+        try:
+            if stripped[key] == default:
+                del stripped[key]
+        except KeyError:
+            pass
+    return stripped
+
+def for_disk(project):
+    """
+    Returns the project as it is written to settings.json: without
+    default task fields if its schema version stores tasks sparsely,
+    and with every field otherwise. Tasks are always plain dicts, which
+    every codec can write. The project itself is not changed.
+    """
+    if "tasks" not in project:
+        return project
+    if project.get("schemaVersion", 1) < SPARSE_VERSION:
+        # Not migrated yet, so older kb versions must still find every field
+        return {**project, "tasks": [{**settings.DEFAULT_TASK, **task} for task in project["tasks"]]}
+    return {**project, "tasks": [strip(task) for task in project["tasks"]]}
+
+def load(project):
+    """
+    Turns the tasks of a project read from disk into Task dicts, in place.
+    """
+    if "tasks" in project:
+        project["tasks"] = [Task(task) if isinstance(task, dict) else task for task in project["tasks"]]
+    return project
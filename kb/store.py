@@ -0,0 +1,425 @@
+"""
+kb - store.py
+author: narlock
+
+This file contains the thread-safe API for using kb's boards from
+other Python programs, such as a web dashboard serving requests on
+many threads:
+
+    import store
+
+    boards = store.Store()
+    view = boards.view()
+    for task in view.tasks("kb", "doing"):
+        print(task["id"], task["title"])
+
+    with boards.batch() as batch:
+        task_id = batch.create_task("kb", {"title": "Write docs"})
+        batch.move_task("kb", task_id, "todo")
+
+The functions in settings.py change one shared settings dict in place
+and save it after every change. A Store instead publishes the boards
+as a series of generations that are never changed once published:
+
+    view    a read view of the newest generation. Nothing a writer
+            does later changes what a view sees, so a request can
+            read several values from one view and get a consistent
+            answer. Views hold no lock and are never blocked.
+    batch   the single writer. It works on a copy of the newest
+            generation, copying a project the first time it changes
+            one, so untouched projects are shared with the views.
+            Leaving the `with` block saves settings.json once,
+            records the batch as one undo step, and publishes the
+            copy as the next generation. An exception inside the
+            block, or a failed save, reverts its changes instead and
+            publishes nothing.
+
+Only one batch runs at a time. The reader-writer lock guarding the
+newest generation is held for writing just long enough to replace it,
+so readers proceed while a batch runs and only wait for that swap.
+
+Failures raise StoreError. Every method returns copies, which the
+caller is free to change.
+
+If settings.json is saved by another process (such as the TUI), the
+next view or batch reloads it. A view taken while a batch runs keeps
+the newest published generation rather than wait for the batch. While a kb daemon runs it owns
+settings.json, so batches are refused; use its socket instead (see
+server.py).
+"""
+
+import contextlib
+import copy
+import os
+import threading
+import blobs
+import history
+import hooks
+import lanes
+import manifest
+import ranks
+import schema
+import server
+import settings
+import sparse
+import timeline
+
+class StoreError(ValueError):
+    """
+    Raised when a store operation cannot be carried out.
+    """
+
+class RWLock:
+    """
+    A lock held by any number of readers or by one writer. A waiting
+    writer goes before readers that arrive after it, so a steady
+    stream of readers cannot keep it waiting forever.
+    """
+
+    def __init__(self):
+        self.condition = threading.Condition()
+        self.readers = 0
+        self.writing = False
+        self.waiting_writers = 0
+
+    @contextlib.contextmanager
+    def read(self):
+        with self.condition:
+            self.condition.wait_for(lambda: not self.writing and self.waiting_writers == 0)
+            self.readers += 1
+        try:
+            yield
+        finally:
+            with self.condition:
+                self.readers -= 1
+                if self.readers == 0:
+                    self.condition.notify_all()
+
+    @contextlib.contextmanager
+    def write(self):
+        with self.condition:
+            self.waiting_writers += 1
+            try:
+                self.condition.wait_for(lambda: not self.writing and self.readers == 0)
+            finally:
+                self.waiting_writers -= 1
+            self.writing = True
+        try:
+            yield
+        finally:
+            with self.condition:
+                self.writing = False
+                self.condition.notify_all()
+
+def _check(result):
+    # Settings functions report failures by returning a message
+    if isinstance(result, str):
+        raise StoreError(result)
+    return result
+
+def _summary(project):
+    return {
+        "id": project["id"],
+        "title": project["title"],
+        "tasks": len(project["tasks"]),
+        "revision": project.get("revision", 0),
+    }
+
+class View:
+    """
+    Read access to one generation of the boards.
+    """
+
+    def __init__(self, user_settings):
+        self.user_settings = user_settings
+        # project id -> (revision, {status: tasks in rank order})
+        self._columns = {}
+
+    def _project(self, title: str):
+        project = next((p for p in self.user_settings["projects"] if p["title"] == title), None)
+        if project is None:
+            raise StoreError("Project not found.")
+        return project
+
+    def _task(self, project, task_id: int):
+        task = next((t for t in project["tasks"] if t["id"] == task_id), None)
+        if task is None:
+            raise StoreError(f"Task with id {task_id} not found.")
+        return task
+
+    def _column(self, project, status: str):
+        # The rank index is shared with the TUI and follows the newest
+        # generation, so a view sorts its own columns
+        revision = project.get("revision", 0)
+        cached = self._columns.get(project["id"])
+        if cached is None or cached[0] != revision:
+            columns = {}
+            for task in project["tasks"]:
+                columns.setdefault(task.get("status"), []).append(task)
+            for tasks in columns.values():
+                tasks.sort(key=lambda task: (ranks.rank_of(task), task["id"]))
+            cached = (revision, columns)
+            self._columns[project["id"]] = cached
+        return cached[1].get(status, [])
+
+    def setting(self, key: str, default=None):
+        """
+        Returns a top level setting, such as "recentProjectTitle".
+        """
+        return copy.deepcopy(self.user_settings.get(key, default))
+
+    def projects(self) -> list:
+        """
+        Returns {"id", "title", "tasks", "revision"} for every project,
+        where "tasks" is the number of tasks on the board.
+        """
+        return [_summary(project) for project in self.user_settings["projects"]]
+
+    def revision(self, project: str) -> int:
+        """
+        Returns the project's revision, which grows with every change.
+        """
+        return self._project(project).get("revision", 0)
+
+    def tasks(self, project: str, status: str = None) -> list:
+        """
+        Returns the project's tasks, or the tasks of one column in
+        rank order. Long text fields are left as blob references (see
+        blobs.py); use `task` to read a whole task.
+        """
+        board = self._project(project)
+        tasks = board["tasks"] if status is None else self._column(board, status)
+        return copy.deepcopy(tasks)
+
+    def task(self, project: str, task_id: int) -> dict:
+        """
+        Returns a task with its long text fields read.
+        """
+        return blobs.materialize(copy.deepcopy(self._task(self._project(project), task_id)))
+
+    def search(self, project: str, text: str) -> list:
+        """
+        Returns the tasks whose title or description contain the text.
+        """
+        needle = text.lower()
+        return copy.deepcopy([
+            task for task in self._project(project)["tasks"]
+            if needle in task.get("title", "").lower() or needle in blobs.text(task.get("description")).lower()
+        ])
+
+class Batch(View):
+    """
+    Changes to the boards, applied one by one to a private copy and
+    committed together (see Store.batch). Reads through a batch see
+    its own changes.
+    """
+
+    def __init__(self, user_settings):
+        # Projects are shared with published generations until changed
+        super().__init__({**user_settings, "projects": list(user_settings["projects"])})
+        self.ops = []
+        self._copied = set()
+
+    def _own(self, title: str):
+        """
+        Returns the batch's own copy of a project, copying it on first use.
+        """
+        project = self._project(title)
+        if project["id"] not in self._copied:
+            index = next(i for i, p in enumerate(self.user_settings["projects"]) if p is project)
+            project = copy.deepcopy(project)
+            self.user_settings["projects"][index] = project
+            self._copied.add(project["id"])
+            # The shared indexes hold the published project's tasks
+            ranks.invalidate(project["id"])
+            lanes.invalidate(project["id"])
+            timeline.invalidate(project["id"])
+        return project
+
+    def _apply(self, op):
+        _check(history.apply(self.user_settings, op))
+        self.ops.append(op)
+
+    def create_task(self, project: str, fields: dict) -> int:
+        """
+        Adds a task with the given fields to the project, returning its id.
+        """
+        board = self._own(project)
+        task = sparse.new_task(fields)
+        task["id"] = board.get("nextTaskId", 0)
+        board["nextTaskId"] = task["id"] + 1
+        self._apply({"op": "insert", "project": board["id"], "index": len(board["tasks"]), "task": task})
+        return task["id"]
+
+    def move_task(self, project: str, task_id: int, column: str = None):
+        """
+        Moves a task to the column, or to the next one if column is None.
+        """
+        board = self._own(project)
+        self._apply(_check(settings.move_op(board, task_id, column)))
+
+    def edit_task(self, project: str, task_id: int, fields: dict):
+        """
+        Changes the given fields of a task.
+        """
+        board = self._own(project)
+        task = self._task(board, task_id)
+        changed = [key for key, value in fields.items() if key != "id" and sparse.field(task, key) != value]
+        if changed:
+            self._apply({
+                "op": "update",
+                "project": board["id"],
+                "task": task_id,
+                "before": {key: copy.deepcopy(sparse.field(task, key)) for key in changed},
+                "after": {key: copy.deepcopy(fields[key]) for key in changed},
+            })
+
+    def delete_task(self, project: str, task_id: int):
+        board = self._own(project)
+        task = self._task(board, task_id)
+        self._apply({"op": "remove", "project": board["id"], "index": board["tasks"].index(task), "task": task})
+
+    def archive_done(self, project: str) -> int:
+        """
+        Moves the project's done column into its archive, returning
+        the number of archived tasks.
+        """
+        board = self._own(project)
+        archived = [[index, task] for index, task in enumerate(board["tasks"]) if task["status"] in ("done", "archived")]
+        if archived:
+            self._apply({"op": "archive", "project": board["id"], "tasks": archived})
+        return len(archived)
+
+    def rollback(self):
+        """
+        Reverts the changes made so far. Archive segments and sync logs
+        are append only, so they record the reverse changes.
+        """
+        if self.ops:
+            history.apply(self.user_settings, history.invert({"op": "batch", "ops": self.ops}))
+            self.ops = []
+
+class Store:
+    """
+    The boards in settings.json, safe to use from many threads.
+    """
+
+    def __init__(self):
+        self.lock = RWLock()
+        # Held by the batch being run, so there is one writer at a time
+        self.writer = threading.Lock()
+        self.current = None
+        self.stamp = None
+        with self.writer:
+            self._load()
+
+    def _file_stamp(self):
+        try:
+            return manifest.file_stamp(os.stat(settings.SETTINGS_PATH))
+        except OSError:
+            return None
+
+    def _load(self):
+        user_settings = settings.load_settings()
+        # Every board the daemon serves is open, so upgrade them all up
+        # front rather than in place under the readers' feet (see schema.py)
+        for project in user_settings["projects"]:
+            schema.upgrade(project)
+        for project in user_settings["projects"]:
+            ranks.invalidate(project["id"])
+            lanes.invalidate(project["id"])
+            timeline.invalidate(project["id"])
+        self._publish(user_settings)
+
+    def _publish(self, user_settings):
+        stamp = self._file_stamp()
+        with self.lock.write():
+            self.current = user_settings
+            self.stamp = stamp
+
+    def _reload_if_stale(self):
+        # Called with self.writer held
+        with self.lock.read():
+            stale = self._file_stamp() != self.stamp
+        if stale:
+            self._load()
+
+    def refresh(self):
+        """
+        Reloads settings.json if another process saved it. Never waits
+        for the writer: while a batch runs, on this thread or another,
+        the newest published generation is kept. A batch's own save is
+        published with its stamp, and other saves are picked up by the
+        next refresh after it.
+        """
+        with self.lock.read():
+            stamp = self.stamp
+        if self._file_stamp() == stamp:
+            return
+        if not self.writer.acquire(blocking=False):
+            return
+        try:
+            self._reload_if_stale()
+        finally:
+            self.writer.release()
+
+    def view(self) -> View:
+        """
+        Returns a read view of the newest generation of the boards.
+        """
+        self.refresh()
+        with self.lock.read():
+            return View(self.current)
+
+    @contextlib.contextmanager
+    def batch(self):
+        """
+        Runs the changes made in the `with` block as one batch, saved
+        and published together when the block is left.
+        """
+        if server.daemon_running():
+            raise StoreError("A kb daemon owns settings.json, connect to its socket instead.")
+        with self.writer:
+            self._reload_if_stale()
+            with self.lock.read():
+                batch = Batch(self.current)
+            try:
+                yield batch
+            except BaseException:
+                batch.rollback()
+                # Nothing was saved, so the hooks hear of none of it
+                hooks.discard(batch.user_settings)
+                raise
+            if not batch.ops:
+                return
+            try:
+                settings.save_settings(batch.user_settings)
+            except Exception as e:
+                # Not on disk, so neither published nor undoable
+                batch.rollback()
+                hooks.discard(batch.user_settings)
+                raise StoreError(f"Could not save settings.json: {e}") from e
+            history.record(batch.user_settings, batch.ops[0] if len(batch.ops) == 1 else {"op": "batch", "ops": batch.ops})
+            self._publish(batch.user_settings)
+
+    # Single changes, each in a batch of its own
+
+    def create_task(self, project: str, fields: dict) -> int:
+        with self.batch() as batch:
+            return batch.create_task(project, fields)
+
+    def move_task(self, project: str, task_id: int, column: str = None):
+        with self.batch() as batch:
+            batch.move_task(project, task_id, column)
+
+    def edit_task(self, project: str, task_id: int, fields: dict):
+        with self.batch() as batch:
+            batch.edit_task(project, task_id, fields)
+
+    def delete_task(self, project: str, task_id: int):
+        with self.batch() as batch:
+            batch.delete_task(project, task_id)
+
+    def archive_done(self, project: str) -> int:
+        with self.batch() as batch:
+            return batch.archive_done(project)
@@ -0,0 +1,514 @@
+"""
+kb - sync.py
+author: narlock
+
+This file keeps boards in step between machines through a shared
+directory (the "syncDir" setting, enabled with `kb sync <directory>`).
+
+Every replica appends the changes it makes to its own log in that
+directory, one JSON operation per line, and never writes anyone
+else's, so a file syncing tool never has conflicting copies:
+
+    <syncDir>/<replica id>.log
+
+    {"r": "3fa2c1d0", "n": 7, "c": 42, "p": "kb", "u": "3fa2c1d0.5", "k": "set",
+     "f": {"status": "doing"}}
+
+Operations form a CRDT, so replicas that have seen the same
+operations show the same boards, whatever order they saw them in:
+
+    create / delete   the task exists or not, a last writer wins register
+    set               last writer wins registers, one per task field
+    add / rem         observed-remove sets for tags and checklist items
+                      (a remove only cancels the adds it has seen)
+
+Writes are ordered by Lamport clock ("c"), ties broken by replica id.
+Card order needs no special handling, since ranks (see ranks.py) are
+fractional keys kept in a last writer wins field.
+
+Each replica remembers how far it has read every other log, so a
+merge reads and applies only the operations it has not seen yet.
+Merged operations are applied through history.apply like any other
+change, but are not added to the undo log. When the TUI is attached
+to the kb daemon, the daemon does the merging. The merge state is kept
+next to settings.json in sync.json, which is specific to one machine.
+
+A Replica holds that state and the path it is kept at. Settings use
+the replica of this machine unless one is attached to them, which is
+how several replicas can share one process:
+
+    replica = sync.Replica(directory / "sync.json")
+    sync.attach(user_settings, replica)
+
+Projects are matched by title. Tasks that existed before syncing was
+enabled are identified by "<project title>#<id>", so copies of the
+same board recognize each other's tasks; new tasks get a "uid".
+"""
+
+import archive
+import blobs
+import client
+import copy
+import json
+import os
+import secrets
+from pathlib import Path
+import history
+import ranks
+import schema
+import settings
+import sparse
+
+SET_FIELDS = ("tags", "checklistItems")
+LOCAL_FIELDS = ("id", "uid")
+NO_STAMP = [0, ""]
+
+class Replica:
+    """
+    One replica's merge state, loaded lazily from `state_path`.
+    """
+
+    def __init__(self, state_path):
+        self.state_path = Path(state_path)
+        # Set while merged operations are applied, so they are not logged again
+        self.merging = False
+        self._state = None
+
+    @property
+    def state(self):
+        if self._state is None:
+            try:
+                with open(self.state_path, 'r', encoding='utf-8') as f:
+                    self._state = json.load(f)
+            except (OSError, ValueError):
+                self._state = {"replica": secrets.token_hex(4), "seq": 0, "clock": 0, "logs": {}, "tasks": {}}
+        return self._state
+
+    @property
+    def name(self):
+        return self.state["replica"]
+
+    def save(self):
+        temp_path = self.state_path.with_suffix(".tmp")
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.state, f, separators=(",", ":"))
+        os.replace(temp_path, self.state_path)
+
+# id(user_settings) -> (user_settings, replica), see attach
+_replicas = {}
+
+# This machine's replica, created the first time it is needed
+_local = None
+
+def state_path():
+    """
+    The merge state of this machine lives next to settings.json.
+    """
+    return settings.SETTINGS_PATH.parent / "sync.json"
+
+def attach(user_settings, replica: Replica):
+    """
+    Makes changes to `user_settings` log to, and merge into, `replica`
+    rather than this machine's replica.
+    """
+    _replicas[id(user_settings)] = (user_settings, replica)
+
+def replica_for(user_settings):
+    """
+    Returns the replica attached to the settings, or this machine's.
+    """
+    global _local
+    _settings, replica = _replicas.get(id(user_settings), (None, None))
+    if replica is not None:
+        return replica
+    if _local is None:
+        _local = Replica(state_path())
+    return _local
+
+def sync_dir(user_settings):
+    return user_settings.get("syncDir")
+
+def log_path(user_settings, replica: str):
+    return os.path.join(sync_dir(user_settings), f"{replica}.log")
+
+# Task identity
+
+def task_uid(project, task):
+    return task.get("uid") or f"{project['title']}#{task['id']}"
+
+def _stamp(op):
+    return [op["c"], op["r"]]
+
+def _element_key(element):
+    return json.dumps(element, sort_keys=True)
+
+def _entry(replica, project, uid, task=None):
+    """
+    Returns the merge state of a task, starting it from the task's
+    current values if it has none yet.
+    """
+    tasks = replica.state["tasks"].setdefault(project["title"], {})
+    entry = tasks.get(uid)
+    if entry is None:
+        entry = {"id": task["id"] if task else None, "alive": NO_STAMP, "deleted": False, "stamps": {}, "sets": _initial_sets(task or {})}
+        tasks[uid] = entry
+    return entry
+
+def _initial_sets(task):
+    """
+    Tags the elements a task starts with by position and value, so
+    every copy of the same task tags them alike.
+    """
+    return {
+        name: {f"0:{i:06d}:{_element_key(e)}": e for i, e in enumerate(task.get(name) or [])}
+        for name in SET_FIELDS
+    }
+
+def _materialized_set(entry, name):
+    elements = []
+    seen = set()
+    for _tag, element in sorted(entry["sets"].get(name, {}).items(), key=lambda item: _sort_tag(item[0])):
+        key = _element_key(element)
+        if key not in seen:
+            seen.add(key)
+            elements.append(element)
+    return elements
+
+def _sort_tag(tag: str):
+    clock, _, rest = tag.partition(":")
+    return (int(clock) if clock.isdigit() else 0, rest)
+
+# Recording local changes
+
+def _append(user_settings, replica, ops):
+    if not ops:
+        return
+    with open(log_path(user_settings, replica.name), 'a', encoding='utf-8') as f:
+        for op in ops:
+            f.write(json.dumps(op, separators=(",", ":")) + "\n")
+        f.flush()
+        os.fsync(f.fileno())
+
+def _new_op(replica, project, uid, kind, **fields):
+    state = replica.state
+    state["seq"] += 1
+    state["clock"] += 1
+    return {"r": state["replica"], "n": state["seq"], "c": state["clock"], "p": project["title"], "u": uid, "k": kind, **fields}
+
+def _field_value(field, value):
+    # Blobs are local to each machine, so long text travels inline
+    return blobs.text(value) if field in blobs.BLOB_FIELDS else copy.deepcopy(value)
+
+def _create_op(replica, project, uid, task):
+    entry = _entry(replica, project, uid, task)
+    fields = {k: _field_value(k, v) for k, v in task.items() if k not in LOCAL_FIELDS + SET_FIELDS}
+    entry["sets"] = _initial_sets(task)
+    op = _new_op(replica, project, uid, "create", id=task["id"], f=fields,
+                 s={name: list(map(list, elements.items())) for name, elements in entry["sets"].items()})
+    entry["alive"] = _stamp(op)
+    entry["deleted"] = False
+    for field in fields:
+        entry["stamps"][field] = _stamp(op)
+    return op
+
+def _change_ops(replica, project, before, after):
+    """
+    Returns the operations describing one task change.
+    """
+    if before is None:
+        if "uid" not in after:
+            after["uid"] = f"{replica.name}.{replica.state['seq'] + 1}"
+        return [_create_op(replica, project, after["uid"], after)]
+
+    uid = task_uid(project, before)
+    entry = _entry(replica, project, uid, before)
+    if after is None:
+        op = _new_op(replica, project, uid, "delete")
+        entry["alive"] = _stamp(op)
+        entry["deleted"] = True
+        return [op]
+
+    ops = []
+    fields = {
+        k: _field_value(k, v) for k, v in after.items()
+        if k not in LOCAL_FIELDS + SET_FIELDS and before.get(k) != v
+    }
+    if fields:
+        op = _new_op(replica, project, uid, "set", f=fields)
+        for field in fields:
+            entry["stamps"][field] = _stamp(op)
+        ops.append(op)
+
+    for name in SET_FIELDS:
+        old = {_element_key(e): e for e in before.get(name) or []}
+        new = {_element_key(e): e for e in after.get(name) or []}
+        elements = entry["sets"].setdefault(name, {})
+        for key in old.keys() - new.keys():
+            observed = [tag for tag, e in elements.items() if _element_key(e) == key]
+            if observed:
+                ops.append(_new_op(replica, project, uid, "rem", s=name, t=observed))
+                for tag in observed:
+                    del elements[tag]
+        for key in new.keys() - old.keys():
+            op = _new_op(replica, project, uid, "add", s=name, e=new[key])
+            op["t"] = f"{op['c']}:{op['r']}"
+            elements[op["t"]] = new[key]
+            ops.append(op)
+    return ops
+
+def record_changes(user_settings, project, changes):
+    """
+    Appends the operations for the (before, after) task changes of a
+    local operation to the settings' replica's log. Called by history.apply.
+    """
+    replica = replica_for(user_settings)
+    if replica.merging or not sync_dir(user_settings):
+        return
+    ops = []
+    for before, after in changes:
+        ops.extend(_change_ops(replica, project, before, after))
+    _append(user_settings, replica, ops)
+    replica.save()
+
+def publish_all(user_settings, replica: Replica = None):
+    """
+    Logs a create operation for every task on every board, so
+    replicas that have never seen them (or their archived copies)
+    can build the boards from the logs alone.
+    """
+    replica = replica or replica_for(user_settings)
+    ops = []
+    for project in user_settings.get("projects", []):
+        tasks = list(project.get("tasks", []))
+        if archive.has_archive(project["id"]):
+            reader = archive.ArchiveReader(project["id"])
+            reader.load_all()
+            tasks.extend(reader.tasks)
+        for task in tasks:
+            ops.append(_create_op(replica, project, task_uid(project, task), task))
+    _append(user_settings, replica, ops)
+    replica.save()
+
+# Merging other replicas
+
+def _read_new_ops(user_settings, replica):
+    """
+    Reads the operations appended to other replicas' logs since the
+    last merge, ordered so causes come before their effects.
+    """
+    state = replica.state
+    directory = sync_dir(user_settings)
+    ops = []
+    for name in os.listdir(directory):
+        other = name[:-len(".log")]
+        if not name.endswith(".log") or other == state["replica"]:
+            continue
+        position = state["logs"].setdefault(other, {"offset": 0, "seq": 0})
+        path = os.path.join(directory, name)
+        if os.path.getsize(path) <= position["offset"]:
+            continue
+        with open(path, 'rb') as f:
+            f.seek(position["offset"])
+            data = f.read()
+        # Only complete lines, the replica may still be writing the last one
+        complete = data[:data.rfind(b"\n") + 1]
+        position["offset"] += len(complete)
+        for line in complete.splitlines():
+            try:
+                op = json.loads(line)
+            except ValueError:
+                continue
+            if op["n"] > position["seq"]:
+                position["seq"] = op["n"]
+                ops.append(op)
+    ops.sort(key=lambda op: (op["c"], op["r"], op["n"]))
+    return ops
+
+def _find_project(user_settings, title):
+    project = settings.get_project_by_title(user_settings, title)
+    if project is not None:
+        # Merge into the current schema; a project that fails to upgrade is merged as it is
+        settings.upgrade_project(user_settings, title)
+    else:
+        project = {"id": user_settings["nextProjectId"], "title": title, "nextTaskId": 0, "schemaVersion": schema.SCHEMA_VERSION, "tasks": []}
+        user_settings["nextProjectId"] += 1
+        user_settings["projects"].append(project)
+    return project
+
+def _board_task(project, entry):
+    return ranks.column_index(project).tasks.get(entry["id"]) if entry["id"] is not None else None
+
+def _archived_task(project, entry):
+    if entry["id"] is None or not archive.has_archive(project["id"]):
+        return None
+    return archive.ArchiveReader(project["id"]).get(entry["id"])
+
+def _insert(user_settings, project, entry, uid, values):
+    board = ranks.column_index(project).tasks
+    task_id = values.get("id")
+    if task_id is None or task_id in board or task_id < project["nextTaskId"]:
+        task_id = project["nextTaskId"]
+    project["nextTaskId"] = max(project["nextTaskId"], task_id + 1)
+    entry["id"] = task_id
+
+    task = sparse.new_task({**values, "id": task_id})
+    if uid != task_uid(project, task):
+        task["uid"] = uid
+    for name in SET_FIELDS:
+        task[name] = _materialized_set(entry, name)
+    history.apply(user_settings, {"op": "insert", "project": project["id"], "index": len(project["tasks"]), "task": task})
+    if task["status"] == "archived":
+        history.apply(user_settings, {"op": "archive", "project": project["id"], "tasks": [[len(project["tasks"]) - 1, task]]})
+
+def _merge_op(user_settings, replica, op):
+    """
+    Applies one remote operation. Returns True if the board changed.
+    """
+    project = _find_project(user_settings, op["p"])
+    uid = op["u"]
+    # Tasks from before syncing was enabled have the same id on every copy of a board
+    local = None
+    if uid not in replica.state["tasks"].get(project["title"], {}) and uid.startswith(f"{project['title']}#"):
+        local = ranks.column_index(project).tasks.get(int(uid.rpartition("#")[2]))
+        if local is not None and "uid" in local:
+            local = None
+    entry = _entry(replica, project, uid, local)
+    stamp = _stamp(op)
+    kind = op["k"]
+
+    if kind in ("create", "delete"):
+        if stamp <= entry["alive"]:
+            return False
+        alive = kind == "create"
+        entry["alive"] = stamp
+        entry["deleted"] = not alive
+        task = _board_task(project, entry)
+        if not alive:
+            if task is None:
+                return False
+            index = project["tasks"].index(task)
+            history.apply(user_settings, {"op": "remove", "project": project["id"], "index": index, "task": task})
+            return True
+
+        values = {}
+        for field, value in op["f"].items():
+            if stamp > entry["stamps"].get(field, NO_STAMP):
+                entry["stamps"][field] = stamp
+                values[field] = value
+        for name, tagged in op.get("s", {}).items():
+            entry["sets"].setdefault(name, {}).update({tag: e for tag, e in tagged})
+        if task is None and _archived_task(project, entry) is None:
+            values.setdefault("status", "backlog")
+            _insert(user_settings, project, entry, uid, {**values, "id": op.get("id")})
+            return True
+        return _update(user_settings, project, entry, values)
+
+    if kind == "set":
+        values = {}
+        for field, value in op["f"].items():
+            if stamp > entry["stamps"].get(field, NO_STAMP):
+                entry["stamps"][field] = stamp
+                values[field] = value
+        return _update(user_settings, project, entry, values)
+
+    elements = entry["sets"].setdefault(op["s"], {})
+    if kind == "add":
+        elements[op["t"]] = op["e"]
+    elif kind == "rem":
+        for tag in op["t"]:
+            elements.pop(tag, None)
+    return _update(user_settings, project, entry, {})
+
+def _update(user_settings, project, entry, values):
+    """
+    Brings a task in line with its merge state, archiving or restoring
+    it when its status moves in or out of "archived".
+    """
+    if entry["deleted"]:
+        return False
+    task = _board_task(project, entry)
+    if task is None:
+        archived = _archived_task(project, entry)
+        if archived is None or values.get("status", "archived") == "archived":
+            return False
+        history.apply(user_settings, {"op": "unarchive", "project": project["id"], "tasks": [[len(project["tasks"]), archived]]})
+        task = _board_task(project, entry)
+        if task is None:
+            return False
+
+    after = {field: value for field, value in values.items() if task.get(field) != value}
+    for name in SET_FIELDS:
+        elements = _materialized_set(entry, name)
+        if elements != (task.get(name) or []):
+            after[name] = elements
+    if not after:
+        return False
+
+    status = after.pop("status", None) if after.get("status") == "archived" else None
+    if after:
+        history.apply(user_settings, {
+            "op": "update",
+            "project": project["id"],
+            "task": task["id"],
+            "before": {field: copy.deepcopy(sparse.field(task, field)) for field in after},
+            "after": after
+        })
+    if status == "archived":
+        history.apply(user_settings, {"op": "archive", "project": project["id"], "tasks": [[project["tasks"].index(task), task]]})
+    return True
+
+@client.remote
+def pull(user_settings, replica: Replica = None):
+    """
+    Merges the operations other replicas logged since the last pull
+    into the settings, as `replica` (the settings' replica by default).
+
+    Returns:
+        int: the number of merged operations that changed a board
+    """
+    if not sync_dir(user_settings) or not os.path.isdir(sync_dir(user_settings)):
+        return 0
+
+    replica = replica or replica_for(user_settings)
+    ops = _read_new_ops(user_settings, replica)
+    if not ops:
+        return 0
+    # The operations may name any board, not only the ones opened
+    settings.load_projects(user_settings)
+
+    changed = 0
+    replica.merging = True
+    try:
+        for op in ops:
+            replica.state["clock"] = max(replica.state["clock"], op["c"])
+            if _merge_op(user_settings, replica, op):
+                changed += 1
+    finally:
+        replica.merging = False
+        replica.save()
+    if changed:
+        settings.update_settings(user_settings)
+    return changed
+
+def enable(user_settings, directory: str, replica: Replica = None):
+    """
+    Starts syncing through a directory, publishing the current boards
+    as `replica` (the settings' replica by default).
+
+    Returns:
+        str: error message if the directory cannot be used
+        None: on success
+    """
+    directory = os.path.abspath(os.path.expanduser(directory))
+    try:
+        os.makedirs(directory, exist_ok=True)
+    except OSError as e:
+        return f"Cannot use {directory}: {e}"
+
+    first_time = sync_dir(user_settings) != directory
+    user_settings["syncDir"] = directory
+    if first_time:
+        publish_all(user_settings, replica)
+    pull(user_settings, replica)
+    settings.update_settings(user_settings)
+    return None
@@ -3,15 +3,305 @@ task_interface.py
 author: narlock
 
 This file controls the interface related to tasks.
+
+The task view shows a task's title and metadata as soon as it opens.
+Long text fields, linked tasks, and checklist items are produced a
+row at a time as pages reach them. A description is read whole from
+the blob store once a page reaches its section (blobs are compressed
+and checked as a whole), but it is only wrapped as far as it is shown,
+and the sections after it are not read until they are shown.
+
+Both the view and the edit interface draw the whole screen once and
+then only rewrite the rows a key changes.
 """
 
 import ansi
 import os
+import archive
+import blobs
 import kbutils
+import layout
 import settings
+import sparse
 import re
 import copy
 
+# Rows above the first field of the edit interface: the title and a blank row
+FORM_TOP = 3
+
+# (label, key) of the fields shown above the task view's sections
+DETAIL_FIELDS = [
+    ("Type", "type"), ("Priority", "priority"), ("Status", "status"),
+    ("Effort", "effort"), ("Start Date", "startDate"), ("Complete Date", "completeDate"),
+    ("Fix Version", "fixVersion"), ("Tags", "tags"),
+]
+DETAIL_SECTIONS = [
+    ("Description", "description"), ("Acceptance Criteria", "acceptanceCriteria"),
+    ("Linked Tasks", "linkedTasks"), ("Checklist", "checklistItems"),
+]
+SECTION_STYLE = ansi.ORANGE + ansi.BOLD
+LABEL_STYLE = ansi.GREEN
+MUTED_STYLE = ansi.GREY
+
+def format_value(value):
+    """
+    Returns a field's value as a single line of text.
+    """
+    if value is None:
+        return ""
+    if isinstance(value, list):
+        return ", ".join(str(item) for item in value)
+    return " ".join(str(value).split("\n"))
+
+def fit_tail(text: str, width: int):
+    """
+    Returns the end of the text that fits the width, which is the
+    part being typed into.
+    """
+    if len(text) <= width:
+        return text
+    return "…" + text[len(text) - width + 1:]
+
+def wrap_lazily(text: str, width: int):
+    """
+    Yields the lines of the text wrapped to the width, breaking at
+    spaces where possible. Lines are only found as they are asked for,
+    so the rest of a long text is never scanned.
+    """
+    width = max(1, width)
+    start = 0
+    while True:
+        end = text.find("\n", start)
+        if end < 0:
+            end = len(text)
+        if start == end:
+            yield ""
+        position = start
+        while position < end:
+            if end - position <= width:
+                yield text[position:end]
+                break
+            cut = text.rfind(" ", position, position + width + 1)
+            if cut <= position:
+                yield text[position:position + width]
+                position += width
+            else:
+                yield text[position:cut]
+                position = cut + 1
+        if end == len(text):
+            return
+        start = end + 1
+
+class LazyRows:
+    """
+    The rows of a generator, pulled only as far as they are shown.
+    """
+
+    def __init__(self, rows):
+        self.rows = iter(rows)
+        self.pulled = []
+        self.exhausted = False
+
+    def has(self, index: int):
+        """
+        Returns True if there is a row at the index.
+        """
+        while not self.exhausted and len(self.pulled) <= index:
+            row = next(self.rows, None)
+            if row is None:
+                self.exhausted = True
+            else:
+                self.pulled.append(row)
+        return index < len(self.pulled)
+
+    def page(self, start: int, count: int):
+        self.has(start + count - 1)
+        return self.pulled[start:start + count]
+
+def detail_header(task, width: int):
+    """
+    Returns the task view's title and metadata rows, which never need
+    the blob store.
+    """
+    rows = [[(ansi.ORANGE + ansi.BOLD, f"[{task['id']}] {format_value(task.get('title'))}"[:width])]]
+    for label, key in DETAIL_FIELDS:
+        value = format_value(task.get(key, settings.DEFAULT_TASK[key]))
+        rows.append([(LABEL_STYLE, f"{label}: "), (layout.DEFAULT_STYLE, value[:max(0, width - len(label) - 2)])])
+    rows.append([])
+    return rows
+
+def _link_rows(project, links, width: int):
+    board = None
+    reader = None
+    for link in links:
+        if not isinstance(link, dict):
+            continue
+        # Looked up once the first link is shown
+        if board is None:
+            board = {task["id"]: task for task in project["tasks"]}
+        linked = board.get(link.get("id"))
+        if linked is None:
+            reader = reader or archive.ArchiveReader(project["id"])
+            linked = reader.get(link.get("id"))
+        title = linked["title"] if linked else "(deleted)"
+        status = f" ({linked.get('status')})" if linked else ""
+        yield [(MUTED_STYLE, f"{link.get('reason', 'linked to')} "), (layout.DEFAULT_STYLE, f"[{link.get('id')}] {title}{status}"[:width])]
+
+def detail_body(project, task, width: int):
+    """
+    Yields the task view's section rows, reading each long field whole
+    from the blob store once the rows before it were shown, and
+    wrapping it only as far as its rows are pulled.
+    """
+    for index, (label, key) in enumerate(DETAIL_SECTIONS):
+        if index:
+            yield []
+        yield [(SECTION_STYLE, label)]
+        value = task.get(key, settings.DEFAULT_TASK[key])
+        if key in blobs.BLOB_FIELDS:
+            text = blobs.text(value)
+            if not text:
+                yield [(MUTED_STYLE, "None")]
+            for line in wrap_lazily(text, width):
+                yield [(layout.DEFAULT_STYLE, line)]
+        elif key == "linkedTasks":
+            if not value:
+                yield [(MUTED_STYLE, "None")]
+            yield from _link_rows(project, value, width)
+        else:
+            if not value:
+                yield [(MUTED_STYLE, "None")]
+            for item in value:
+                mark = "[x]" if item.get("completed") else "[ ]"
+                yield [(LABEL_STYLE, f"{mark} "), (layout.DEFAULT_STYLE, format_value(item.get("name"))[:max(0, width - 4)])]
+
+def display_task_view(user_settings, project_title, task_id: int):
+    """
+    Displays a task, read only, with its long fields one page at a time.
+
+    UP and DOWN scroll a row, LEFT and RIGHT scroll a page.
+    Supported commands:
+        "edit" opens the edit interface for the task.
+        "move [column]" moves the task to the next or given column.
+
+    Returns:
+        str: error message if the task cannot be shown
+        None: when the user leaves the view
+    """
+    project = settings.get_project_by_title(user_settings, project_title)
+    if not project:
+        return "Project not found."
+
+    mode = "CMD"
+    input_text = ""
+    displayable_error = ""
+    top = 0
+    state = {}
+
+    def find_task():
+        return next((t for t in project["tasks"] if t["id"] == task_id), None)
+
+    def page_size():
+        _columns, rows = layout.LAYOUT.size()
+        # The body sits between the header and the input row
+        return max(1, rows - len(state["header"]) - 1)
+
+    def paint_input():
+        kbutils.print_bottom_input_with_mode_and_error(input_text, mode, displayable_error)
+
+    def paint_body():
+        nonlocal top
+        size = page_size()
+        body = state["body"]
+        if not body.has(top):
+            # The rows were wrapped again, to a wider terminal
+            top = max(0, len(body.pulled) - 1)
+        page = body.page(top, size)
+        first_row = len(state["header"]) + 1
+        for offset in range(size):
+            text = layout.render_frame([page[offset]]) if offset < len(page) else ""
+            kbutils.print_at(first_row + offset, text)
+        paint_input()
+
+    def paint():
+        # Rows are wrapped to the width, so a resize starts over
+        task = find_task()
+        columns, _rows = layout.LAYOUT.size()
+        state["header"] = detail_header(task, columns)
+        state["body"] = LazyRows(detail_body(project, task, columns))
+        # Cleared with an escape sequence, which is faster than running `clear`,
+        # and the header drawn before any long field is read
+        print("\033[H\033[2J", end="")
+        print(layout.render_frame(state["header"], line_end="\n"), end="", flush=True)
+        paint_body()
+
+    if find_task() is None:
+        return f"Task with id {task_id} not found."
+    paint()
+
+    while True:
+        with layout.repaint_on_resize(paint):
+            key = kbutils.get_keypress()
+
+        if key == kbutils.EXIT_CMD:
+            return None
+        elif key in (kbutils.KEY_UP, kbutils.KEY_DOWN, kbutils.KEY_LEFT, kbutils.KEY_RIGHT):
+            step = 1 if key in (kbutils.KEY_UP, kbutils.KEY_DOWN) else page_size()
+            if key in (kbutils.KEY_UP, kbutils.KEY_LEFT):
+                top = max(0, top - step)
+            elif state["body"].has(top + page_size()):
+                top += step
+            else:
+                continue
+            paint_body()
+        elif key in kbutils.KEY_ENTER:
+            command_parts = input_text.strip().split()
+            input_text = ""
+            displayable_error = ""
+            if not command_parts:
+                paint_input()
+                continue
+
+            cmd = command_parts[0]
+            args = command_parts[1:]
+
+            if cmd == "edit":
+                task = settings.get_kanban_task_by_id(user_settings, project_title, task_id)
+                if isinstance(task, str):
+                    displayable_error = task
+                else:
+                    display_task_change_interface(user_settings, project_title, task)
+            elif cmd == "move" or cmd == "mv":
+                displayable_error = settings.move_kanban_item_by_id(user_settings, project_title, task_id, args[0] if args else None) or ""
+            else:
+                displayable_error = f"Invalid command: {cmd}!"
+                paint_input()
+                continue
+
+            if find_task() is None:
+                return displayable_error or None
+            paint()
+        elif key in kbutils.KEY_BACKSPACE:
+            displayable_error = ""
+            input_text = input_text[:-1]
+            paint_input()
+        elif re.fullmatch(kbutils.STR_REGEX, key):
+            displayable_error = ""
+            input_text += key
+            paint_input()
+
+def _form_row(task, index: int, selected_index: int):
+    """
+    Returns the edit interface's row for the field at the index, cut
+    to the terminal width.
+    """
+    columns, _rows = layout.LAYOUT.size()
+    label = settings.TASK_OPTIONS[index]
+    value = format_value(task.get(list(settings.DEFAULT_TASK)[index]))
+    if index == selected_index:
+        return f"{ansi.BRIGHT_GREEN}{ansi.BOLD}→ {label}: {ansi.RESET}{fit_tail(value, max(1, columns - len(label) - 4))}"
+    return f"{ansi.GREY}{label}: {fit_tail(value, max(1, columns - len(label) - 2))}{ansi.RESET}"
+
 def display_task_change_interface(user_settings, project_title, task = None):
     """
     Displays the task interface. If a task is passed to this, the
@@ -20,56 +310,66 @@ def display_task_change_interface(user_settings, project_title, task = None):
     """
     mode = "EDIT"
     task_id = -1
+    original = None
 
     if task is None:
         mode = "CREATE"
-        task = copy.deepcopy(settings.DEFAULT_TASK) # Ensure we are not referencing a single task!
+        task = sparse.new_task() # Ensure we are not referencing a single task!
         task_id = settings.get_next_task_id(user_settings, project_title)
         task['id'] = task_id
+    else:
+        # Keep a copy of the task so that edits can be rolled back
+        original = copy.deepcopy(task)
 
-    while True:
-        os.system('clear')
-        selected_index = 1
-        printable_error = ""
+    selected_index = 1
+    printable_error = ""
 
-        print(f"{ansi.ORANGE}{ansi.BOLD}{mode} Task\n")
+    def paint_input():
+        columns, _rows = layout.LAYOUT.size()
+        input_option = settings.TASK_OPTION_TYPES[selected_index]
+        text = f"({input_option}) {format_value(task.get(settings.TASK_OPTION_KEYS[selected_index]))}"
+        room = max(1, columns - len(printable_error) - 5)
+        kbutils.print_bottom_input_with_error(fit_tail(text, room), printable_error)
+
+    def paint_field(index: int):
+        kbutils.print_at(FORM_TOP + index - 1, _form_row(task, index, selected_index))
+
+    def paint():
+        os.system('clear')
+        print(f"{ansi.ORANGE}{ansi.BOLD}{mode} Task{ansi.RESET}\n")
 
         # TODO display different things for special types:
         # linkedTasks: only display the ID of the task
         # checklistItems: only display the name of the item.
-        for index, option in enumerate(task):
-            if index == 0:
-                # Don't display the ID as the user cannot change it
-                continue
-            if index == 1:
-                print(f"{ansi.BRIGHT_GREEN}{ansi.BOLD}→ {settings.TASK_OPTIONS[index]}: {ansi.RESET}{task[option]}")
-            else:
-                # TODO uncomment this when everything is implemented
-                print(f"{ansi.GREY}{settings.TASK_OPTIONS[index]}: {task[option]}{ansi.RESET}")
-            # if index == selected_index:
-            #     print(f"{ansi.BRIGHT_GREEN}{ansi.BOLD}→ {settings.TASK_OPTIONS[index]}: {ansi.RESET}{task[option]}")
-            # else:
-            #     print(f"{ansi.GREEN}{settings.TASK_OPTIONS[index]}: {ansi.RESET}{task[option]}")
-        
+        # Only the editable fields, in their usual order (tasks may carry others, such as a rank)
+        # Don't display the ID as the user cannot change it
+        for index in range(1, len(settings.DEFAULT_TASK)):
+            print(_form_row(task, index, selected_index))
+        paint_input()
+
+    paint()
+
+    while True:
         input_option = settings.TASK_OPTION_TYPES[selected_index]
-        kbutils.print_bottom_input_with_error(f"({input_option}) {task[settings.TASK_OPTION_KEYS[selected_index]]}", printable_error)
-        key = kbutils.get_keypress()
+        with layout.repaint_on_resize(paint):
+            key = kbutils.get_keypress()
         # TODO Make it so when the arrow keys are pressed, the selected index changes
         if key == kbutils.EXIT_CMD:
-            # Return if we decide to exit
+            # The task is a copy (see settings.get_kanban_task_by_id), so leaving discards the changes
             return
         elif key in kbutils.KEY_ENTER:
             # Validate then save the kanban item
             # TODO update this when we have more options than title
             if task['title'].strip() == '':
                 printable_error = "Title must not be blank!"
+                paint_input()
             else:
                 if mode == 'CREATE':
                     # Save the kanban item and go back to the board view
                     settings.add_kanban_task(user_settings, project_title, task)
                 else:
                     # Update existing task (should reference an already created task)
-                    settings.update_settings(user_settings)
+                    settings.update_kanban_task(user_settings, project_title, task, original)
                 # Go back to board view
                 return
         elif input_option == 'str':
@@ -83,9 +383,12 @@ def display_task_change_interface(user_settings, project_title, task = None):
                 # Add character from string
                 option_string += key
                 task[settings.TASK_OPTION_KEYS[selected_index]] = option_string
+            # Only the edited field and the input row change
+            paint_field(selected_index)
+            paint_input()
 
 
         # TODO For lists, we want to highlight the selected item in the list,
         # so that we can freely choose to remove or add wherever in the list
         # For the first version, we won't worry about this since we are only concerned
-        # about the id and the title. 
\ No newline at end of file
+        # about the id and the title.
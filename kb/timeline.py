@@ -0,0 +1,343 @@
+"""
+kb - timeline.py
+author: narlock
+
+This file controls the timeline of a project: when each task on the
+board was worked on, from its startDate to its completeDate, shown by
+the "timeline" command on the board and queried with
+
+    kb timeline <board> [--from <day>] [--to <day>]
+
+where a day is a date (2025-08-04) or an ISO week (2025-W32), which
+starts on its Monday when used with --from and ends on its Sunday
+when used with --to.
+
+A task's span starts on its startDate, or on its completeDate if it
+was never started, and ends on its completeDate. Tasks that are not
+complete are still running, so their span has no end. Tasks without
+either date are not on the timeline.
+
+The spans are kept in an interval tree: a treap ordered by start day
+where every node also holds the latest end in its subtree. Finding
+the tasks that overlap a range only descends into subtrees whose
+latest end reaches the range and stops at the first start after it,
+so "what was in progress during week 32" costs O(log n + k) for the k
+tasks it finds on typical boards, instead of a scan of the board.
+Like the column index (see ranks.py), the tree is updated by every
+operation applied through history.apply, in O(log n) per task.
+
+Archived tasks stay on the timeline. Their spans are kept next to the
+archive segments (see archive.py) in spans.json, which records the
+segments it covers, so building a tree only reads the segments
+archived since:
+
+    {"segments": ["segment-...z"], "tasks": {"4": [739102, 739110, {"id": 4, "title": "...", "status": "archived"}]}}
+"""
+
+import json
+import os
+import random
+import zlib
+from datetime import date
+import ansi
+import archive
+import layout
+
+# The end of a span that is still running
+OPEN_END = date.max.toordinal()
+STATUS_STYLES = {
+    "backlog": ansi.GREY,
+    "todo": ansi.BRIGHT_BLUE,
+    "doing": ansi.ORANGE,
+    "done": ansi.GREEN,
+    "archived": ansi.GREY,
+}
+LABEL_WIDTH = 28
+BAR = "█"
+SPANS_FILE = "spans.json"
+# The fields of an archived task the timeline shows
+SPAN_FIELDS = ("id", "title", "status")
+
+# project id -> TimelineIndex
+_indexes = {}
+
+def parse_day(text: str, end: bool = False):
+    """
+    Returns the ordinal of a date (2025-08-04) or ISO week (2025-W32),
+    using the week's Sunday if `end` is set and its Monday otherwise.
+    Raises ValueError if the text is neither.
+    """
+    text = text.strip()
+    if "-W" in text.upper():
+        year, week = text.upper().split("-W")
+        return date.fromisocalendar(int(year), int(week), 7 if end else 1).toordinal()
+    return date.fromisoformat(text).toordinal()
+
+def format_day(day: int):
+    return "…" if day == OPEN_END else date.fromordinal(day).isoformat()
+
+def span_of(task):
+    """
+    Returns the (start, end) day ordinals of a task, or None if it has
+    no usable dates.
+    """
+    try:
+        complete = date.fromisoformat(task["completeDate"]).toordinal() if task.get("completeDate") else None
+        start = date.fromisoformat(task["startDate"]).toordinal() if task.get("startDate") else complete
+    except (TypeError, ValueError):
+        return None
+    if start is None:
+        return None
+    end = OPEN_END if complete is None else complete
+    return start, max(start, end)
+
+def archived_spans(project_id: int):
+    """
+    Returns task id -> ((start, end), task) for the archived tasks of
+    a project that are on the timeline, reading only the segments
+    spans.json does not cover yet.
+    """
+    segments = archive.list_segments(project_id)
+    if not segments:
+        return {}
+    path = archive.archive_dir(project_id) / SPANS_FILE
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            cache = json.load(f)
+    except (OSError, ValueError):
+        cache = {"segments": [], "tasks": {}}
+    names = [segment.name for segment in segments]
+    if names[:len(cache["segments"])] != cache["segments"]:
+        # The segments were replaced (see snapshots.restore), start over
+        cache = {"segments": [], "tasks": {}}
+
+    fresh = segments[len(cache["segments"]):]
+    for segment in fresh:
+        try:
+            records = archive.read_segment(segment)
+        except (OSError, ValueError, zlib.error):
+            # Damaged, see `kb fsck`
+            records = []
+        # Oldest first, so the newest record of a task wins
+        for record in records:
+            task = record.get("task")
+            task_id = str(task["id"] if task else record.get("restored"))
+            span = span_of(task) if task else None
+            if span is None:
+                cache["tasks"].pop(task_id, None)
+            else:
+                cache["tasks"][task_id] = [span[0], span[1], {key: task.get(key) for key in SPAN_FIELDS}]
+        cache["segments"].append(segment.name)
+    if fresh:
+        temp_path = path.with_suffix(".tmp")
+        try:
+            with open(temp_path, 'w', encoding='utf-8') as f:
+                json.dump(cache, f, separators=(",", ":"))
+            os.replace(temp_path, path)
+        except OSError:
+            # Only a cache, the segments are read again next time
+            pass
+    return {int(task_id): ((start, end), task) for task_id, (start, end, task) in cache["tasks"].items()}
+
+class _Node:
+    __slots__ = ("key", "end", "max_end", "priority", "left", "right")
+
+    def __init__(self, key, end: int):
+        # key: (start day, task id), unique within a project
+        self.key = key
+        self.end = end
+        self.max_end = end
+        self.priority = random.random()
+        self.left = None
+        self.right = None
+
+def _update(node):
+    node.max_end = node.end
+    if node.left is not None and node.left.max_end > node.max_end:
+        node.max_end = node.left.max_end
+    if node.right is not None and node.right.max_end > node.max_end:
+        node.max_end = node.right.max_end
+    return node
+
+def _split(node, key):
+    """
+    Splits a tree into the nodes ordered before key and the rest.
+    """
+    if node is None:
+        return None, None
+    if node.key < key:
+        node.right, rest = _split(node.right, key)
+        return _update(node), rest
+    before, node.left = _split(node.left, key)
+    return before, _update(node)
+
+def _merge(left, right):
+    """
+    Joins two trees where every key of `left` is ordered before `right`.
+    """
+    if left is None:
+        return right
+    if right is None:
+        return left
+    if left.priority > right.priority:
+        left.right = _merge(left.right, right)
+        return _update(left)
+    right.left = _merge(left, right.left)
+    return _update(right)
+
+def _overlapping(node, first: int, last: int, out):
+    # No span below this node reaches the range
+    if node is None or node.max_end < first:
+        return
+    _overlapping(node.left, first, last, out)
+    if node.key[0] <= last:
+        if node.end >= first:
+            out.append(node.key[1])
+        _overlapping(node.right, first, last, out)
+
+class TimelineIndex:
+    """
+    The spans of one project's tasks in an interval tree.
+    """
+
+    def __init__(self, project):
+        self.revision = project.get("revision", 0)
+        self.root = None
+        # task id -> (start, end) and task, for the tasks in the tree
+        self.spans = {}
+        self.tasks = {}
+        for task in project.get("tasks", []):
+            self._add(task)
+        board = {task["id"] for task in project.get("tasks", [])}
+        for task_id, (span, task) in archived_spans(project["id"]).items():
+            if task_id not in board:
+                self._add(task, span)
+
+    def _add(self, task, span=None):
+        span = span or span_of(task)
+        if span is None:
+            return
+        start, end = span
+        left, right = _split(self.root, (start, task["id"]))
+        self.root = _merge(_merge(left, _Node((start, task["id"]), end)), right)
+        self.spans[task["id"]] = span
+        self.tasks[task["id"]] = task
+
+    def _remove(self, task_id: int):
+        span = self.spans.pop(task_id, None)
+        if span is None:
+            return
+        self.tasks.pop(task_id)
+        left, rest = _split(self.root, (span[0], task_id))
+        _removed, right = _split(rest, (span[0], task_id + 1))
+        self.root = _merge(left, right)
+
+    def task_changed(self, before, after):
+        if before is not None:
+            self._remove(before["id"])
+        if after is not None:
+            self._remove(after["id"])
+            self._add(after)
+
+    def overlapping(self, first: int, last: int):
+        """
+        Returns the tasks whose span overlaps the days first to last,
+        both included, ordered by their start.
+        """
+        ids = []
+        _overlapping(self.root, first, last, ids)
+        return [self.tasks[task_id] for task_id in ids]
+
+def timeline_index(project):
+    """
+    Returns the project's timeline index, rebuilding it if the project
+    was changed without going through history.apply.
+    """
+    index = _indexes.get(project["id"])
+    if index is None or index.revision != project.get("revision", 0):
+        index = TimelineIndex(project)
+        _indexes[project["id"]] = index
+    return index
+
+def invalidate(project_id: int):
+    """
+    Drops the project's timeline index, such as after reloading it from disk.
+    """
+    _indexes.pop(project_id, None)
+
+def changes_applied(project, changes):
+    """
+    Updates the project's timeline index for the (before, after) task
+    changes of one operation. Must be called after the project's
+    revision has been bumped.
+    """
+    index = _indexes.get(project["id"])
+    if index is None:
+        return
+    if index.revision != project.get("revision", 0) - 1:
+        del _indexes[project["id"]]
+        return
+    for before, after in changes:
+        index.task_changed(before, after)
+    index.revision = project["revision"]
+
+# Rendering
+
+def _label(task, width: int):
+    text = f"[{task['id']}] {task.get('title', '')}"
+    return text[:width - 1].ljust(width)
+
+def header_rows(first: int, days: int):
+    """
+    Returns the rows with the date and week of each Monday, and today
+    marked, above the bars of the days first to first + days - 1.
+    """
+    dates = [" "] * days
+    marks = [" "] * days
+    today = date.today().toordinal()
+    for offset in range(days):
+        day = date.fromordinal(first + offset)
+        if day.weekday() == 0:
+            for row, text in ((dates, day.strftime("%m-%d")), (marks, f"W{day.isocalendar()[1]:02d}")):
+                for position, char in enumerate(text[:days - offset]):
+                    row[offset + position] = char
+    for offset in range(days):
+        if first + offset == today:
+            marks[offset] = "▼"
+    padding = " " * LABEL_WIDTH
+    return [
+        [(layout.DEFAULT_STYLE, padding), (ansi.BOLD, "".join(dates))],
+        [(layout.DEFAULT_STYLE, padding), (ansi.GREY, "".join(marks))],
+    ]
+
+def bar_row(task, span, first: int, days: int):
+    """
+    Returns a task's row: its label, then its span drawn over the days
+    first to first + days - 1. Running spans are drawn up to today.
+    """
+    start, end = span
+    end = min(end, max(start, date.today().toordinal()))
+    left = max(0, start - first)
+    right = min(days, end - first + 1)
+    style = STATUS_STYLES.get(task.get("status"), layout.DEFAULT_STYLE)
+    row = [(layout.DEFAULT_STYLE, _label(task, LABEL_WIDTH))]
+    if right <= left:
+        # Entirely outside the window, such as a span running past its right edge
+        return row + [(layout.DEFAULT_STYLE, " " * days)]
+    return row + [
+        (ansi.GREY, "·" * left),
+        (style, BAR * (right - left)),
+        (ansi.GREY, "·" * (days - right)),
+    ]
+
+def viewport_rows(index: TimelineIndex, first: int, days: int, top: int, height: int):
+    """
+    Returns the header and the bar rows of the tasks overlapping the
+    window of days, skipping the first `top` of them. Only the tasks
+    in the window are looked up, and only `height` of them drawn.
+    """
+    tasks = index.overlapping(first, first + days - 1)
+    rows = header_rows(first, days)
+    for task in tasks[top:top + height]:
+        rows.append(bar_row(task, index.spans[task["id"]], first, days))
+    return rows, len(tasks)
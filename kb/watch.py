@@ -0,0 +1,240 @@
+"""
+kb - watch.py
+author: narlock
+
+This file controls `kb watch <board>`, a read-only view of a board
+that redraws itself whenever settings.json or history.json change on
+disk, such as a board on a shared monitor updated by scripts.
+
+Changes are detected with inotify on Linux, so the watcher sleeps in
+select() and uses no CPU while nothing happens. Elsewhere, or if
+inotify is unavailable, the files' modification times are polled
+once a second. A burst of events (a save followed by a history
+write, say) is coalesced into a single refresh.
+
+When settings.json uses the binary codec, only the frames whose
+checksum changed are parsed again; the JSON codecs are reparsed whole.
+"""
+
+import ctypes
+import ctypes.util
+import os
+import select
+import struct
+import sys
+import termios
+import time
+import tty
+import ansi
+import codec
+import kanban
+import lanes
+import layout
+import ranks
+import settings
+import sparse
+
+WATCHED_FILES = ("settings.json", "history.json")
+COALESCE_SECONDS = 0.05
+POLL_SECONDS = 1.0
+QUIT_KEYS = ("q", "Q", "\x03")
+
+# inotify(7) constants
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+EVENT_HEADER = struct.Struct("iIII")
+
+class InotifyWatcher:
+    """
+    Reports changed files of a directory using inotify.
+    """
+
+    def __init__(self, directory):
+        libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        if not hasattr(libc, "inotify_init1"):
+            raise OSError("inotify is not available")
+        self.fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        # Files are complete once closed after writing, or renamed into place
+        mask = IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE | IN_DELETE
+        if libc.inotify_add_watch(self.fd, os.fsencode(str(directory)), mask) < 0:
+            os.close(self.fd)
+            raise OSError(ctypes.get_errno(), f"Cannot watch {directory}")
+
+    def fileno(self):
+        return self.fd
+
+    timeout = None
+
+    def changes(self):
+        """
+        Returns the names of the watched files among pending events.
+        """
+        names = set()
+        while True:
+            try:
+                data = os.read(self.fd, 65536)
+            except BlockingIOError:
+                return names
+            offset = 0
+            while offset < len(data):
+                _wd, _mask, _cookie, length = EVENT_HEADER.unpack_from(data, offset)
+                offset += EVENT_HEADER.size
+                name = data[offset:offset + length].rstrip(b"\0").decode("utf-8", errors="replace")
+                offset += length
+                if name in WATCHED_FILES:
+                    names.add(name)
+
+    def close(self):
+        os.close(self.fd)
+
+class PollingWatcher:
+    """
+    Reports changed files by comparing modification times and sizes.
+    """
+
+    timeout = POLL_SECONDS
+
+    def __init__(self, directory):
+        self.paths = [directory / name for name in WATCHED_FILES]
+        self.stats = {path: self._stat(path) for path in self.paths}
+
+    def _stat(self, path):
+        try:
+            stat = os.stat(path)
+            return stat.st_mtime_ns, stat.st_size
+        except OSError:
+            return None
+
+    def fileno(self):
+        return None
+
+    def changes(self):
+        names = set()
+        for path in self.paths:
+            stat = self._stat(path)
+            if stat != self.stats[path]:
+                self.stats[path] = stat
+                names.add(path.name)
+        return names
+
+    def close(self):
+        pass
+
+def create_watcher(directory):
+    try:
+        return InotifyWatcher(directory)
+    except (OSError, AttributeError):
+        return PollingWatcher(directory)
+
+class BoardLoader:
+    """
+    Loads one project from settings.json, reusing the projects of
+    unchanged binary frames from the previous load.
+    """
+
+    def __init__(self, project_title: str):
+        self.project_title = project_title
+        self.frames = {}
+
+    def _load_binary(self, data):
+        frames = {}
+        found = None
+        for index, (_offset, checksum, payload) in enumerate(codec.iter_frames(data)):
+            if index == 0:
+                continue  # Top level settings
+            project = self.frames.get(checksum)
+            if project is None:
+                project = sparse.load(codec.decode_payload(data[3], payload))
+            frames[checksum] = project
+            if project.get("title") == self.project_title:
+                found = project
+        self.frames = frames
+        return found
+
+    def load(self):
+        """
+        Returns the watched project, None if it does not exist.
+        Raises an exception if settings.json cannot be read.
+        """
+        with open(settings.SETTINGS_PATH, 'rb') as f:
+            data = f.read()
+        if codec.detect(data) == codec.BINARY:
+            return self._load_binary(data)
+        user_settings = codec.decode(data)
+        return next((p for p in user_settings.get("projects", []) if p.get("title") == self.project_title), None)
+
+def print_status(message: str):
+    _columns, height = layout.LAYOUT.size()
+    print(f"\033[{height};1H{ansi.GREY}{message}{ansi.RESET}", end="", flush=True)
+
+def watch(project_title: str):
+    """
+    Shows a board read-only until q or Ctrl+C is pressed, redrawing
+    it whenever it changes on disk.
+    """
+    loader = BoardLoader(project_title)
+    state = {"project": None, "status": ""}
+
+    def reload():
+        try:
+            project = loader.load()
+        except Exception as e:
+            # Possibly caught mid write by the polling watcher, keep the last board
+            state["status"] = f"Could not read settings.json ({e}), showing the last version"
+            return
+        if project is not state["project"]:
+            # A new project object: its cached indexes may describe the old one
+            if project is not None:
+                ranks.invalidate(project["id"])
+                lanes.invalidate(project["id"])
+            state["project"] = project
+        state["status"] = time.strftime("updated %H:%M:%S")
+
+    def repaint():
+        project = state["project"]
+        if project is None:
+            kanban.print_kanban_columns([], [], [], project_title)
+            print_status(f"Project '{project_title}' not found · {state['status']} · q to quit")
+        else:
+            kanban.display_kanban({"projects": [project]}, project_title)
+            print_status(f"Watching (read-only) · {state['status']} · q to quit")
+
+    watcher = create_watcher(settings.SETTINGS_PATH.parent)
+    stdin_fd = sys.stdin.fileno() if sys.stdin.isatty() else None
+    old_settings = termios.tcgetattr(stdin_fd) if stdin_fd is not None else None
+
+    try:
+        if stdin_fd is not None:
+            tty.setcbreak(stdin_fd)
+        reload()
+        with layout.repaint_on_resize(repaint):
+            repaint()
+            readers = [fd for fd in (watcher.fileno(), stdin_fd) if fd is not None]
+            while True:
+                ready, _, _ = select.select(readers, [], [], watcher.timeout)
+                if stdin_fd in ready:
+                    keys = os.read(stdin_fd, 32).decode("utf-8", errors="ignore")
+                    if any(key in QUIT_KEYS for key in keys):
+                        break
+
+                changed = watcher.changes()
+                if not changed:
+                    continue
+                # Coalesce the rest of a burst of writes into this refresh
+                while watcher.fileno() is not None and select.select([watcher], [], [], COALESCE_SECONDS)[0]:
+                    watcher.changes()
+                reload()
+                repaint()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        watcher.close()
+        if old_settings is not None:
+            termios.tcsetattr(stdin_fd, termios.TCSADRAIN, old_settings)
+        os.system('clear')
@@ -0,0 +1,88 @@
+"""
+kb - tests/test_analytics.py
+author: narlock
+
+Checks the flow metrics computed from a known event log, and that
+only work done on the board, not undo and redo, is logged.
+
+Usage: python3 -m pytest tests
+"""
+
+import contextlib
+import io
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "kb"))
+
+import analytics
+import flow
+import history
+import settings
+import sparse
+
+DAY = analytics.SECONDS_PER_DAY
+
+@unittest.skipIf(analytics.np is None, analytics.NUMPY_REQUIRED)
+class FlowTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.settings_path = settings.SETTINGS_PATH
+        settings.SETTINGS_PATH = Path(self.directory.name) / "settings.json"
+        history._history = None
+
+    def tearDown(self):
+        settings.SETTINGS_PATH = self.settings_path
+        history._history = None
+        self.directory.cleanup()
+
+    def events(self, rows):
+        np = analytics.np
+        return {
+            "task": np.array([task for task, _old, _new, _time in rows], dtype="i"),
+            "from": np.array([flow.status_code(old) for _task, old, _new, _time in rows], dtype="b"),
+            "to": np.array([flow.status_code(new) for _task, _old, new, _time in rows], dtype="b"),
+            "time": np.array([when for _task, _old, _new, when in rows], dtype="d"),
+        }
+
+    def test_cycle_time_throughput_and_cumulative_flow(self):
+        now = 1760000000.0
+        start = now - 10 * DAY
+        events = self.events([
+            (0, flow.NONE, "todo", start),
+            (1, flow.NONE, "todo", start),
+            (0, "todo", "doing", start + 1 * DAY),
+            (1, "todo", "doing", start + 2 * DAY),
+            (0, "doing", "done", start + 3 * DAY),
+            (1, "doing", "done", start + 6 * DAY),
+        ])
+        metrics = analytics.compute_flow(events, days=14, now=now)
+
+        self.assertEqual(metrics["events"], 6)
+        self.assertEqual(metrics["cycle_time"]["count"], 2)
+        self.assertAlmostEqual(metrics["cycle_time"]["mean"], 3.0)
+        self.assertAlmostEqual(metrics["lead_time"]["mean"], 4.5)
+        self.assertEqual(int(metrics["throughput"].sum()), 2)
+        # Both finished by today, nothing left in progress
+        self.assertEqual(int(metrics["cfd"]["done"][-1]), 2)
+        self.assertEqual(int(metrics["wip"][-1]), 0)
+        self.assertEqual(int(max(metrics["wip"])), 2)
+
+    def test_undo_and_redo_are_not_logged(self):
+        task = sparse.new_task({"id": 0, "title": "Task", "status": "todo"})
+        user_settings = {"undoDepth": 100, "projects": [{"id": 0, "title": "board", "nextTaskId": 1, "tasks": [task]}]}
+        history.perform(user_settings, {"op": "update", "project": 0, "task": 0,
+                                        "before": {"status": "todo"}, "after": {"status": "doing"}})
+        with contextlib.redirect_stdout(io.StringIO()):
+            history.undo(user_settings)
+            history.redo(user_settings)
+
+        events = analytics.load_events(0)
+        self.assertEqual(len(events["time"]), 1)
+        self.assertEqual(flow.STATUS_CODES[events["to"][0]], "doing")
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,85 @@
+"""
+kb - tests/test_archive.py
+author: narlock
+
+Checks that archived tasks leave settings.json for the project's
+archive, are read back newest first a page at a time, and return to
+the board when restored.
+
+Usage: python3 -m pytest tests
+"""
+
+import contextlib
+import io
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "kb"))
+
+import archive
+import history
+import settings
+import sparse
+
+class ArchiveTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.settings_path = settings.SETTINGS_PATH
+        settings.SETTINGS_PATH = Path(self.directory.name) / "settings.json"
+        history._history = None
+        tasks = [sparse.new_task({"id": task_id, "title": f"Task {task_id}", "status": "todo"}) for task_id in range(4)]
+        self.user_settings = {"recentProjectTitle": "board", "nextProjectId": 1,
+                              "projects": [{"id": 0, "title": "board", "nextTaskId": 4, "tasks": tasks}]}
+
+    def tearDown(self):
+        settings.SETTINGS_PATH = self.settings_path
+        history._history = None
+        self.directory.cleanup()
+
+    def complete(self, *task_ids):
+        with contextlib.redirect_stdout(io.StringIO()):
+            for task_id in task_ids:
+                settings.move_kanban_item_by_id(self.user_settings, "board", task_id, "done")
+            settings.archive_completed_kanban_tasks(self.user_settings, "board")
+
+    def board_ids(self):
+        with contextlib.redirect_stdout(io.StringIO()):
+            return sorted(task["id"] for task in settings.load_settings()["projects"][0]["tasks"])
+
+    def test_archive_and_restore_round_trip(self):
+        self.complete(0, 1)
+        self.complete(2)
+        self.assertEqual(self.board_ids(), [3])
+        self.assertEqual(len(archive.list_segments(0)), 2)
+
+        # Newest first, one segment at a time
+        reader = archive.ArchiveReader(0)
+        self.assertEqual([task["id"] for task in reader.page(0, 1)], [2])
+        self.assertFalse(reader.exhausted())
+        self.assertEqual([task["id"] for task in reader.page(1, 1)], [1])
+        self.assertEqual([task["id"] for task in reader.page(2, 1)], [0])
+        self.assertEqual(reader.page(3, 1), [])
+        self.assertEqual({task["status"] for task in reader.tasks}, {"archived"})
+
+        with contextlib.redirect_stdout(io.StringIO()):
+            settings.restore_archived_task(self.user_settings, "board", reader.get(1))
+        self.assertEqual(self.board_ids(), [1, 3])
+        restored = settings.get_project_by_title(self.user_settings, "board")["tasks"][-1]
+        self.assertEqual((restored["id"], restored["status"]), (1, "done"))
+        reader = archive.ArchiveReader(0)
+        reader.load_all()
+        self.assertEqual([task["id"] for task in reader.tasks], [2, 0])
+
+        # Archived again, the newest copy is the one shown
+        with contextlib.redirect_stdout(io.StringIO()):
+            settings.update_kanban_task(self.user_settings, "board", {**restored, "title": "Again"}, restored)
+        self.complete()
+        reader = archive.ArchiveReader(0)
+        self.assertEqual(reader.get(1)["title"], "Again")
+        self.assertEqual(len(reader.search("task")), 2)
+
+if __name__ == '__main__':
+    unittest.main()
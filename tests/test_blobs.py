@@ -0,0 +1,88 @@
+"""
+kb - tests/test_blobs.py
+author: narlock
+
+Checks that saving only moves changed text into the blob store, and
+that blobs nothing refers to are collected.
+
+Usage: python3 -m pytest tests
+"""
+
+import contextlib
+import io
+import sys
+import tempfile
+import time
+import unittest
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "kb"))
+
+import blobs
+import history
+import settings
+import sparse
+
+class BlobTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.settings_path = settings.SETTINGS_PATH
+        settings.SETTINGS_PATH = Path(self.directory.name) / "settings.json"
+        history._history = None
+        blobs.externalize()
+
+    def tearDown(self):
+        settings.SETTINGS_PATH = self.settings_path
+        history._history = None
+        self.directory.cleanup()
+
+    def test_only_changed_tasks_are_externalized(self):
+        changed = sparse.new_task({"id": 0, "description": "a" * 1000})
+        untouched = sparse.new_task({"id": 1, "description": "b" * 1000})
+        blobs.changes_applied({"id": 0}, [(None, changed)])
+        blobs.externalize()
+        self.assertTrue(blobs.is_ref(changed["description"]))
+        self.assertEqual(blobs.text(changed["description"]), "a" * 1000)
+        self.assertEqual(untouched["description"], "b" * 1000)
+
+    def test_tracked_tasks_with_long_text_are_externalized(self):
+        task = sparse.new_task({"id": 0, "acceptanceCriteria": "c" * 1000})
+        blobs.track([{"id": 0, "tasks": [task]}])
+        blobs.externalize()
+        self.assertTrue(blobs.is_ref(task["acceptanceCriteria"]))
+
+    def test_opened_tasks_keep_their_references(self):
+        tasks = [sparse.new_task({"id": 0, "title": "Long", "description": "d" * 5000}),
+                 sparse.new_task({"id": 1, "title": "Short", "status": "todo"})]
+        user_settings = {"projects": [{"id": 0, "title": "board", "nextTaskId": 2, "tasks": tasks}]}
+        blobs.track(user_settings["projects"])
+        settings.save_settings(user_settings)
+
+        task = settings.get_kanban_task_by_id(user_settings, "board", 0)
+        self.assertEqual(task["description"], "d" * 5000)
+        with contextlib.redirect_stdout(io.StringIO()):
+            settings.move_kanban_item_by_id(user_settings, "board", 1, "doing")
+        saved = settings.SETTINGS_PATH.read_text()
+        self.assertNotIn("d" * 5000, saved)
+        self.assertIn('"blob"', saved)
+
+        # Editing another field of the opened task leaves the text where it is
+        with contextlib.redirect_stdout(io.StringIO()):
+            settings.update_kanban_task(user_settings, "board", {**task, "title": "Renamed"}, task)
+        saved = settings.SETTINGS_PATH.read_text()
+        self.assertNotIn("d" * 5000, saved)
+        self.assertIn("Renamed", saved)
+
+    def test_unreferenced_blobs_are_collected(self):
+        kept = blobs.put("kept " * 100)
+        dropped = blobs.put("dropped " * 100)
+        settings.SETTINGS_PATH.write_text(f'{{"projects":[{{"tasks":[{{"description":{{"blob":"{kept["blob"]}"}}}}]}}]}}')
+        # Blobs this recent may belong to a save in progress
+        self.assertEqual(blobs.collect_garbage(), 0)
+        self.assertEqual(blobs.collect_garbage(time.time() + blobs.GC_GRACE + 1), 1)
+        self.assertTrue(blobs.blob_path(kept["blob"]).exists())
+        self.assertFalse(blobs.blob_path(dropped["blob"]).exists())
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,127 @@
+"""
+kb - tests/test_codec.py
+author: narlock
+
+Checks that settings round-trip through every codec, for projects
+written before and after sparse tasks (schema version 4).
+
+Usage: python3 -m pytest tests
+"""
+
+import copy
+import marshal
+import struct
+import sys
+import zlib
+import unittest
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "kb"))
+
+import codec
+import settings
+import sparse
+
+def make_settings(schema_version: int):
+    tasks = [
+        {**copy.deepcopy(settings.DEFAULT_TASK), "id": 0, "title": "Plain", "status": "todo"},
+        {**copy.deepcopy(settings.DEFAULT_TASK), "id": 1, "title": "Busy", "status": "doing",
+         "effort": 5, "tags": ["api"], "checklistItems": [{"name": "Write", "completed": True}]},
+    ]
+    return {
+        "recentProjectTitle": "board", "nextProjectId": 2, "undoDepth": 100,
+        "projects": [
+            {"id": 0, "title": "board", "nextTaskId": 2, "schemaVersion": schema_version, "tasks": tasks},
+            {"id": 1, "title": "other", "nextTaskId": 2, "schemaVersion": schema_version, "tasks": copy.deepcopy(tasks)},
+        ],
+    }
+
+def expanded(user_settings):
+    return [
+        [sparse.expand(task) for task in project["tasks"]]
+        for project in user_settings["projects"]
+    ]
+
+class RoundTripTest(unittest.TestCase):
+
+    def test_every_codec_and_schema_version(self):
+        for name in codec.CODEC_NAMES:
+            for version in (3, sparse.SPARSE_VERSION):
+                with self.subTest(codec=name, schemaVersion=version):
+                    original = make_settings(version)
+                    loaded = codec.decode(codec.encode(original, name))
+                    self.assertEqual(expanded(loaded), expanded(original))
+                    self.assertTrue(all(isinstance(task, sparse.Task) for project in loaded["projects"] for task in project["tasks"]))
+
+    def test_loaded_settings_save_again(self):
+        # Loaded tasks are Task dicts, which must be written as plain dicts
+        for name in codec.CODEC_NAMES:
+            for version in (3, sparse.SPARSE_VERSION):
+                with self.subTest(codec=name, schemaVersion=version):
+                    loaded = codec.decode(codec.encode(make_settings(version), name))
+                    loaded["projects"][0]["tasks"][0]["status"] = "doing"
+                    reloaded = codec.decode(codec.encode(loaded, name))
+                    self.assertEqual(reloaded["projects"][0]["tasks"][0]["status"], "doing")
+                    self.assertEqual(expanded(reloaded), expanded(loaded))
+
+    def test_unmigrated_projects_keep_every_field(self):
+        loaded = codec.decode(codec.encode(make_settings(3), codec.COMPACT_JSON))
+        written = sparse.for_disk(loaded["projects"][0])
+        self.assertEqual(set(written["tasks"][0]), set(settings.DEFAULT_TASK))
+
+    def test_sparse_projects_leave_defaults_out(self):
+        written = sparse.for_disk(make_settings(sparse.SPARSE_VERSION)["projects"][0])
+        self.assertEqual(set(written["tasks"][0]), set(sparse.ALWAYS_STORED))
+        self.assertIn("effort", written["tasks"][1])
+
+class DecodeProjectTest(unittest.TestCase):
+
+    def test_binary_and_compact_json_decode_one_project(self):
+        original = make_settings(sparse.SPARSE_VERSION)
+        for name in (codec.COMPACT_JSON, codec.BINARY):
+            with self.subTest(codec=name):
+                data = codec.encode(original, name)
+                for index, project in enumerate(original["projects"]):
+                    loaded = codec.decode_project(data, index)
+                    self.assertEqual(loaded["id"], project["id"])
+                    self.assertEqual([sparse.expand(task) for task in loaded["tasks"]], expanded(original)[index])
+                self.assertIsNone(codec.decode_project(data, len(original["projects"])))
+
+    def test_pretty_json_is_decoded_whole(self):
+        data = codec.encode(make_settings(sparse.SPARSE_VERSION), codec.PRETTY_JSON)
+        self.assertIsNone(codec.decode_project(data, 0))
+
+    def test_damaged_project_is_not_decoded(self):
+        data = bytearray(codec.encode(make_settings(sparse.SPARSE_VERSION), codec.BINARY))
+        data[-2] ^= 0xFF
+        self.assertIsNone(codec.decode_project(bytes(data), 1))
+        self.assertIsNotNone(codec.decode_project(bytes(data), 0))
+
+class BinaryFormatTest(unittest.TestCase):
+
+    def test_frames_hold_compact_json(self):
+        data = codec.encode(make_settings(sparse.SPARSE_VERSION), codec.BINARY)
+        self.assertEqual(data[:5], b"KBB\x02\x00")
+        payloads = [bytes(payload) for _offset, _checksum, payload in codec.iter_frames(data)]
+        self.assertEqual(len(payloads), 3)
+        self.assertTrue(all(payload.startswith(b"{") for payload in payloads))
+
+    def test_reads_marshal_frames_of_version_1(self):
+        original = make_settings(3)
+        top_level = {key: value for key, value in original.items() if key != "projects"}
+        frames = b""
+        for value in [top_level] + original["projects"]:
+            payload = marshal.dumps(value, 4)
+            frames += struct.pack("<II", len(payload), zlib.crc32(payload)) + payload
+        loaded = codec.decode(b"KBB\x01\x04" + frames)
+        self.assertEqual(expanded(loaded), expanded(original))
+
+    def test_damaged_payload_raises_codec_error(self):
+        data = bytearray(codec.encode(make_settings(3), codec.BINARY))
+        payload = b"not json"
+        frame = struct.pack("<II", len(payload), zlib.crc32(payload)) + payload
+        with self.assertRaises(codec.CodecError):
+            codec.decode(bytes(data[:5]) + frame)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,85 @@
+"""
+kb - tests/test_dashboard.py
+author: narlock
+
+Checks that cached project summaries are reused until the project's
+revision changes, without loading the boards, and recomputed after.
+
+Usage: python3 -m pytest tests
+"""
+
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "kb"))
+
+import dashboard
+import history
+import settings
+import sparse
+
+class SummaryCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.settings_path = settings.SETTINGS_PATH
+        settings.SETTINGS_PATH = Path(self.directory.name) / "settings.json"
+        history._history = None
+        projects = [
+            {"id": project_id, "title": f"board {project_id}", "nextTaskId": 2,
+             "tasks": [sparse.new_task({"id": task_id, "title": f"Task {task_id}", "status": "todo"}) for task_id in range(2)]}
+            for project_id in range(3)
+        ]
+        settings.save_settings({"recentProjectTitle": "board 0", "nextProjectId": 3, "projects": projects})
+
+    def tearDown(self):
+        settings.SETTINGS_PATH = self.settings_path
+        history._history = None
+        self.directory.cleanup()
+
+    def summaries(self, loaded):
+        """
+        The dashboard's summaries from the manifest, noting the boards it had to load.
+        """
+        user_settings = settings.load_summary()
+        load_projects = settings.load_projects
+        settings.load_projects = lambda user_settings, project_ids=None: (
+            loaded.extend(project_ids), load_projects(user_settings, project_ids))
+        try:
+            return dashboard.get_project_summaries(user_settings)
+        finally:
+            settings.load_projects = load_projects
+
+    def test_only_changed_projects_are_recomputed(self):
+        loaded = []
+        first = self.summaries(loaded)
+        self.assertEqual(sorted(loaded), [0, 1, 2])
+        self.assertEqual([summary["statusCounts"] for summary in first], [{"todo": 2}] * 3)
+
+        loaded.clear()
+        self.assertEqual(self.summaries(loaded), first)
+        self.assertEqual(loaded, [])
+
+        # A change to board 1 bumps its revision
+        user_settings = settings.load_settings()
+        history.perform(user_settings, {"op": "update", "project": 1, "task": 0,
+                                        "before": {"status": "todo"}, "after": {"status": "doing"}})
+        settings.save_settings(user_settings)
+        summaries = self.summaries(loaded)
+        self.assertEqual(loaded, [1])
+        self.assertEqual(summaries[1]["statusCounts"], {"todo": 1, "doing": 1})
+        self.assertEqual(summaries[1]["wip"], 1)
+        self.assertEqual(summaries[0], first[0])
+
+    def test_deleted_projects_are_forgotten(self):
+        self.summaries([])
+        user_settings = settings.load_settings()
+        del user_settings["projects"][2]
+        settings.save_settings(user_settings)
+        self.assertEqual(len(self.summaries([])), 2)
+        self.assertEqual(sorted(dashboard.load_summaries()), ["0", "1"])
+
+if __name__ == '__main__':
+    unittest.main()
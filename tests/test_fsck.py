@@ -0,0 +1,152 @@
+"""
+kb - tests/test_fsck.py
+author: narlock
+
+Checks that `kb fsck --repair` reports success once everything it
+found was repaired, clears the undo log, and logs its repairs for
+other replicas; that settings with damaged projects are not saved
+over until it has run; and that pretty JSON is read one project at a
+time.
+
+Usage: python3 -m pytest tests
+"""
+
+import contextlib
+import io
+import json
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "kb"))
+
+import codec
+import fsck
+import history
+import settings
+import sparse
+import sync
+
+class RepairTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        root = Path(self.directory.name)
+        self.settings_path = settings.SETTINGS_PATH
+        settings.SETTINGS_PATH = root / "settings.json"
+        history._history = None
+        # Task 1 appears twice, and task 0 has a status kb does not know
+        tasks = [
+            sparse.new_task({"id": 0, "title": "Odd", "status": "someday"}),
+            sparse.new_task({"id": 1, "title": "First", "status": "todo"}),
+            sparse.new_task({"id": 1, "title": "Second", "status": "todo"}),
+        ]
+        self.shared = root / "shared"
+        self.shared.mkdir()
+        user_settings = {"recentProjectTitle": "board", "nextProjectId": 1, "syncDir": str(self.shared),
+                         "projects": [{"id": 0, "title": "board", "nextTaskId": 2, "tasks": tasks}]}
+        self.replica = sync.Replica(root / "sync.json")
+        sync._local = self.replica
+        settings.save_settings(user_settings)
+        history.record(user_settings, {"op": "update", "project": 0, "task": 1, "before": {}, "after": {}})
+
+    def tearDown(self):
+        settings.SETTINGS_PATH = self.settings_path
+        history._history = None
+        sync._local = None
+        self.directory.cleanup()
+
+    def run_fsck(self, repair: bool):
+        with contextlib.redirect_stdout(io.StringIO()):
+            return fsck.fsck(repair=repair)
+
+    def test_repaired_store_exits_cleanly(self):
+        self.assertEqual(self.run_fsck(False), 2)
+        self.assertEqual(self.run_fsck(True), 0)
+        self.assertEqual(self.run_fsck(False), 0)
+
+        with contextlib.redirect_stdout(io.StringIO()):
+            tasks = settings.load_settings()["projects"][0]["tasks"]
+        self.assertEqual(sorted(task["id"] for task in tasks), [0, 1, 2])
+        self.assertEqual(history.load_history()["undo"], [])
+
+    def test_repairs_are_logged_for_other_replicas(self):
+        self.run_fsck(True)
+        with open(self.shared / f"{self.replica.name}.log", 'r', encoding='utf-8') as f:
+            ops = [json.loads(line) for line in f]
+        self.assertEqual([op["k"] for op in ops], ["set", "create"])
+        self.assertEqual(ops[0]["f"], {"status": "backlog"})
+        self.assertEqual(ops[1]["f"]["title"], "Second")
+
+class DamagedProjectTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.settings_path = settings.SETTINGS_PATH
+        settings.SETTINGS_PATH = Path(self.directory.name) / "settings.json"
+        history._history = None
+        projects = [{"id": project_id, "title": f"board {project_id}", "nextTaskId": 1,
+                     "tasks": [sparse.new_task({"id": 0, "title": "Task", "status": "todo"})]}
+                    for project_id in range(2)]
+        user_settings = {"recentProjectTitle": "board 0", "nextProjectId": 2, "codec": codec.COMPACT_JSON, "projects": projects}
+        settings.save_settings(user_settings)
+        # One byte of the second project changed
+        data = settings.SETTINGS_PATH.read_bytes()
+        settings.SETTINGS_PATH.write_bytes(data.replace(b'"board 1"', b'"board X"'))
+
+    def tearDown(self):
+        settings.SETTINGS_PATH = self.settings_path
+        settings._damaged_stamp = None
+        history._history = None
+        self.directory.cleanup()
+
+    def load(self):
+        with contextlib.redirect_stdout(io.StringIO()):
+            return settings.load_settings()
+
+    def test_damaged_projects_are_not_saved_over(self):
+        user_settings = self.load()
+        self.assertEqual([project["title"] for project in user_settings["projects"]], ["board 0"])
+        data = settings.SETTINGS_PATH.read_bytes()
+        with self.assertRaises(RuntimeError):
+            settings.save_settings(user_settings)
+        self.assertEqual(settings.SETTINGS_PATH.read_bytes(), data)
+
+        # Once fsck has quarantined the project, saving is allowed again
+        with contextlib.redirect_stdout(io.StringIO()):
+            self.assertEqual(fsck.fsck(repair=True), 0)
+        user_settings = self.load()
+        settings.save_settings(user_settings)
+        self.assertEqual(len(list(settings.SETTINGS_PATH.parent.glob("quarantine/*.damaged"))), 1)
+
+class StreamTest(unittest.TestCase):
+
+    def stream(self, data):
+        read_size = fsck.READ_SIZE
+        fsck.READ_SIZE = 16
+        try:
+            return list(fsck.stream_settings(io.BytesIO(data)))
+        finally:
+            fsck.READ_SIZE = read_size
+
+    def test_pretty_json_is_read_project_by_project(self):
+        projects = [{"id": project_id, "title": "é" * 100, "tasks": []} for project_id in range(3)]
+        data = codec.encode({"recentProjectTitle": "é", "projects": projects}, codec.PRETTY_JSON)
+        self.assertEqual(self.stream(data), [("settings", {"recentProjectTitle": "é"}, None)] +
+                         [(f"project {index}", project, None) for index, project in enumerate(projects)])
+
+        edited = self.stream(data.replace(b'"id": 1', b'"id": 7'))
+        self.assertEqual([error is None for _where, _value, error in edited], [True, True, False, True])
+        where, value, error = self.stream(data[:-20])[-1]
+        self.assertEqual((where, value), ("project 2", None))
+        self.assertIn("cannot be parsed", error)
+
+    def test_entries_that_are_not_projects_are_damaged(self):
+        damaged = []
+        user_settings = codec.decode(b'{\n"projects": [3, {"id": 0, "title": "board", "tasks": []}]}', damaged)
+        self.assertEqual([project["id"] for project in user_settings["projects"]], [0])
+        self.assertEqual(len(damaged), 1)
+
+if __name__ == '__main__':
+    unittest.main()
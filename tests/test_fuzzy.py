@@ -0,0 +1,60 @@
+"""
+kb - tests/test_fuzzy.py
+author: narlock
+
+Checks that narrowing the project picker a keypress at a time, with
+backspaces, gives the same results as matching the whole query again.
+
+Usage: python3 -m pytest tests
+"""
+
+import random
+import sys
+import unittest
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "kb"))
+
+import fuzzy
+
+def is_subsequence(query: str, title: str):
+    remaining = iter(title.lower())
+    return all(char in remaining for char in query.lower())
+
+class IncrementalMatchTest(unittest.TestCase):
+
+    def setUp(self):
+        self.random = random.Random(31)
+        words = ["kb", "board", "release", "Sprint", "api", "docs", "bug", "triage", "q4"]
+        self.titles = [" ".join(self.random.choice(words) for _ in range(self.random.randrange(1, 4))) for _ in range(300)]
+
+    def test_incremental_results_match_a_full_rescan(self):
+        matcher = fuzzy.FuzzyMatcher(self.titles)
+        for _ in range(500):
+            if matcher.query and self.random.random() < 0.3:
+                matcher.pop()
+            else:
+                matcher.push(self.random.choice("abdegiknoprstBK 4"))
+
+            fresh = fuzzy.FuzzyMatcher(self.titles)
+            fresh.set_query(matcher.query)
+            self.assertEqual(matcher.results, fresh.results)
+            self.assertEqual(sorted(matcher.indices()),
+                             [index for index, title in enumerate(self.titles) if is_subsequence(matcher.query, title)])
+
+    def test_set_query_reuses_the_common_prefix(self):
+        matcher = fuzzy.FuzzyMatcher(self.titles)
+        matcher.set_query("rel")
+        kept = matcher._stack[:3]
+        matcher.set_query("REa")
+        self.assertEqual(matcher.query, "rea")
+        self.assertIs(matcher._stack[1], kept[1])
+        self.assertIs(matcher._stack[2], kept[2])
+
+        # Tighter, earlier matches come first
+        matcher = fuzzy.FuzzyMatcher(["a-x-b", "xab", "ab"])
+        matcher.set_query("ab")
+        self.assertEqual(matcher.indices(), [2, 1, 0])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,119 @@
+"""
+kb - tests/test_history.py
+author: narlock
+
+Checks that undo and redo step back and forth through every kind of
+operation, and that operations which fail are neither kept nor
+recorded.
+
+Usage: python3 -m pytest tests
+"""
+
+import contextlib
+import io
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "kb"))
+
+import archive
+import history
+import settings
+import sparse
+
+def board(user_settings):
+    """
+    The board's tasks in order, by the fields the operations change.
+    """
+    return [(task["id"], task["title"], task["status"]) for task in user_settings["projects"][0]["tasks"]]
+
+class UndoRedoTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.settings_path = settings.SETTINGS_PATH
+        settings.SETTINGS_PATH = Path(self.directory.name) / "settings.json"
+        history._history = None
+        tasks = [sparse.new_task({"id": task_id, "title": f"Task {task_id}", "status": status})
+                 for task_id, status in enumerate(["todo", "doing", "done"])]
+        self.user_settings = {"recentProjectTitle": "board", "nextProjectId": 1, "undoDepth": 100,
+                              "projects": [{"id": 0, "title": "board", "nextTaskId": 3, "tasks": tasks}]}
+
+    def tearDown(self):
+        settings.SETTINGS_PATH = self.settings_path
+        history._history = None
+        self.directory.cleanup()
+
+    def task(self, task_id: int):
+        tasks = self.user_settings["projects"][0]["tasks"]
+        return next((index, task) for index, task in enumerate(tasks) if task["id"] == task_id)
+
+    def step(self, step):
+        with contextlib.redirect_stdout(io.StringIO()):
+            return step(self.user_settings)
+
+    def check_round_trip(self, op):
+        before = board(self.user_settings)
+        self.assertIsNone(history.perform(self.user_settings, op))
+        after = board(self.user_settings)
+        self.assertNotEqual(before, after)
+
+        self.assertIsNone(self.step(history.undo))
+        self.assertEqual(board(self.user_settings), before)
+        self.assertIsNone(self.step(history.redo))
+        self.assertEqual(board(self.user_settings), after)
+        self.assertEqual(self.step(history.redo), "Nothing to redo!")
+        return after
+
+    def test_update(self):
+        self.check_round_trip({"op": "update", "project": 0, "task": 0,
+                               "before": {"status": "todo", "title": "Task 0"}, "after": {"status": "doing", "title": "Renamed"}})
+
+    def test_insert(self):
+        task = sparse.new_task({"id": 3, "title": "New", "status": "todo"})
+        self.check_round_trip({"op": "insert", "project": 0, "index": 1, "task": task})
+
+    def test_remove(self):
+        index, task = self.task(1)
+        self.check_round_trip({"op": "remove", "project": 0, "index": index, "task": task})
+
+    def test_archive_and_unarchive(self):
+        index, task = self.task(2)
+        self.check_round_trip({"op": "archive", "project": 0, "tasks": [[index, task]]})
+        reader = archive.ArchiveReader(0)
+        reader.load_all()
+        self.assertEqual([task["id"] for task in reader.tasks], [2])
+
+        restored = archive.ArchiveReader(0).get(2)
+        self.check_round_trip({"op": "unarchive", "project": 0, "tasks": [[index, restored]]})
+        reader = archive.ArchiveReader(0)
+        reader.load_all()
+        self.assertEqual(reader.tasks, [])
+
+    def test_batch(self):
+        index, task = self.task(1)
+        self.check_round_trip({"op": "batch", "ops": [
+            {"op": "update", "project": 0, "task": 0, "before": {"status": "todo"}, "after": {"status": "done"}},
+            {"op": "remove", "project": 0, "index": index, "task": task},
+            {"op": "insert", "project": 0, "index": 0, "task": sparse.new_task({"id": 3, "title": "New", "status": "todo"})},
+        ]})
+
+    def test_failed_operations_are_not_recorded(self):
+        before = board(self.user_settings)
+        missing = {"op": "update", "project": 0, "task": 9, "before": {"status": "todo"}, "after": {"status": "done"}}
+        self.assertIsNotNone(history.perform(self.user_settings, missing))
+
+        # The batch's first operation is rolled back when the second fails
+        batch = {"op": "batch", "ops": [
+            {"op": "update", "project": 0, "task": 0, "before": {"status": "todo"}, "after": {"status": "done"}},
+            missing,
+        ]}
+        self.assertIsNotNone(history.perform(self.user_settings, batch))
+        self.assertEqual(board(self.user_settings), before)
+        self.assertEqual(history.load_history()["undo"], [])
+        self.assertEqual(self.step(history.undo), "Nothing to undo!")
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,127 @@
+"""
+kb - tests/test_hooks.py
+author: narlock
+
+Checks that failed hook runs are retried in order and then dropped,
+that a hook that cannot keep up sheds its oldest events, and that
+changes whose save failed never reach a hook.
+
+Usage: python3 -m pytest tests
+"""
+
+import contextlib
+import io
+import os
+import sys
+import tempfile
+import threading
+import unittest
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "kb"))
+
+import history
+import hooks
+import settings
+import sparse
+
+class PipelineTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.settings_path = settings.SETTINGS_PATH
+        settings.SETTINGS_PATH = Path(self.directory.name) / "settings.json"
+        history._history = None
+        self.pipeline = hooks._pipeline
+        hooks._pipeline = hooks.Pipeline()
+        self.limits = (hooks.RETRY_DELAY, hooks.MAX_QUEUED_EVENTS)
+        hooks.RETRY_DELAY = 0
+        self.received = []
+        self.failures = 0
+        self.gate = threading.Event()
+        self.gate.set()
+        self.running = threading.Event()
+        hooks.hook_type("test")(self.hook)
+
+        tasks = [sparse.new_task({"id": 0, "title": "Task", "status": "todo"})]
+        self.user_settings = {"undoDepth": 100, "nextProjectId": 1, "projects": [
+            {"id": 0, "title": "board", "nextTaskId": 1, "tasks": tasks, "hooks": [{"name": "test", "type": "test"}]}]}
+
+    def tearDown(self):
+        self.gate.set()
+        hooks._pipeline.wait(5)
+        hooks._pipeline = self.pipeline
+        hooks.RETRY_DELAY, hooks.MAX_QUEUED_EVENTS = self.limits
+        del hooks.HOOK_TYPES["test"]
+        settings.SETTINGS_PATH = self.settings_path
+        history._history = None
+        self.directory.cleanup()
+
+    def hook(self, config, project_id, events):
+        self.running.set()
+        self.gate.wait(5)
+        if self.failures:
+            self.failures -= 1
+            raise OSError("unreachable")
+        self.received.extend(event["revision"] for event in events)
+
+    def change(self, status):
+        history.perform(self.user_settings, {"op": "update", "project": 0, "task": 0,
+                                             "before": {"status": sparse.field(self.user_settings["projects"][0]["tasks"][0], "status")},
+                                             "after": {"status": status}})
+
+    def metrics(self):
+        return hooks._pipeline.metrics["0/test"]
+
+    def test_failed_runs_are_retried_in_order(self):
+        self.failures = 2
+        self.change("doing")
+        settings.save_settings(self.user_settings)
+        self.change("done")
+        settings.save_settings(self.user_settings)
+        hooks.wait(5)
+        self.assertEqual(self.received, [1, 2])
+        self.assertEqual((self.metrics()["failures"], self.metrics()["retries"], self.metrics()["dropped"]), (2, 2, 0))
+
+        # Given up on after RETRIES retries
+        self.failures = hooks.RETRIES + 1
+        self.change("todo")
+        settings.save_settings(self.user_settings)
+        hooks.wait(5)
+        self.assertEqual(self.received, [1, 2])
+        self.assertEqual(self.metrics()["dropped"], 1)
+        self.assertIsNotNone(self.metrics()["lastError"])
+
+    def test_a_slow_hook_sheds_its_oldest_events(self):
+        hooks.MAX_QUEUED_EVENTS = 5
+        self.gate.clear()
+        self.change("doing")
+        settings.save_settings(self.user_settings)
+        self.assertTrue(self.running.wait(5))
+
+        # While the hook is busy, every save adds to its one waiting job
+        for number in range(12):
+            self.change(settings.TASK_STATUS_TYPE_OPTIONS[number % 4])
+            settings.save_settings(self.user_settings)
+        with hooks._pipeline.condition:
+            self.assertEqual(len(hooks._pipeline.jobs), 1)
+            self.assertEqual(len(hooks._pipeline.jobs[(0, "test")].events), 5)
+        self.gate.set()
+        hooks.wait(5)
+        self.assertEqual(self.received, [1, 9, 10, 11, 12, 13])
+        self.assertEqual(self.metrics()["dropped"], 7)
+
+    def test_changes_that_were_not_saved_are_never_sent(self):
+        os.mkdir(settings.SETTINGS_PATH)
+        self.change("doing")
+        with contextlib.redirect_stdout(io.StringIO()):
+            settings.update_settings(self.user_settings)
+        os.rmdir(settings.SETTINGS_PATH)
+
+        self.change("done")
+        settings.save_settings(self.user_settings)
+        hooks.wait(5)
+        self.assertEqual(self.received, [2])
+
+if __name__ == '__main__':
+    unittest.main()
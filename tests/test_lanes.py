@@ -0,0 +1,107 @@
+"""
+kb - tests/test_lanes.py
+author: narlock
+
+Checks that the swimlane indexes kept up to date through history.apply
+match indexes built again from the board after every operation.
+
+Usage: python3 -m pytest tests
+"""
+
+import contextlib
+import copy
+import io
+import random
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "kb"))
+
+import history
+import lanes
+import settings
+import sparse
+
+def ids(index):
+    return {key: {status: sorted(tasks) for status, tasks in lane.items()} for key, lane in index.lanes.items()}
+
+class LaneIndexTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.settings_path = settings.SETTINGS_PATH
+        settings.SETTINGS_PATH = Path(self.directory.name) / "settings.json"
+        history._history = None
+        lanes.invalidate(0)
+        self.random = random.Random(37)
+        self.project = {"id": 0, "title": "board", "nextTaskId": 0, "tasks": []}
+        self.user_settings = {"undoDepth": 100, "projects": [self.project]}
+        for _ in range(15):
+            self.insert()
+
+    def tearDown(self):
+        lanes.invalidate(0)
+        settings.SETTINGS_PATH = self.settings_path
+        history._history = None
+        self.directory.cleanup()
+
+    def fields(self):
+        return {
+            "status": self.random.choice(settings.TASK_STATUS_TYPE_OPTIONS),
+            "priority": self.random.choice(settings.TASK_PRIORITY_TYPE_OPTIONS),
+            "type": self.random.choice(settings.TASK_TYPE_OPTIONS),
+            "tags": self.random.sample(["api", "ui", "docs"], self.random.randrange(3)),
+            "fixVersion": self.random.choice(["", "v1", "v2"]),
+        }
+
+    def insert(self):
+        task = sparse.new_task({"id": self.project["nextTaskId"], "title": "Task", **self.fields()})
+        self.project["nextTaskId"] += 1
+        history.perform(self.user_settings, {"op": "insert", "project": 0, "index": len(self.project["tasks"]), "task": task})
+
+    def test_indexes_follow_every_operation(self):
+        indexes = {field: lanes.lane_index(self.project, field) for field in lanes.LANE_FIELDS}
+        for _ in range(300):
+            choice = self.random.random()
+            if choice < 0.5:
+                task = self.random.choice(self.project["tasks"])
+                after = {key: value for key, value in self.fields().items() if self.random.random() < 0.5}
+                before = {key: copy.deepcopy(sparse.field(task, key)) for key in after}
+                history.perform(self.user_settings, {"op": "update", "project": 0, "task": task["id"], "before": before, "after": after})
+            elif choice < 0.65:
+                self.insert()
+            elif choice < 0.8 and len(self.project["tasks"]) > 3:
+                index = self.random.randrange(len(self.project["tasks"]))
+                history.perform(self.user_settings, {"op": "remove", "project": 0, "index": index, "task": copy.deepcopy(self.project["tasks"][index])})
+            elif choice < 0.85:
+                done = [[index, task] for index, task in enumerate(self.project["tasks"]) if task["status"] == "done"]
+                if done:
+                    history.perform(self.user_settings, {"op": "archive", "project": 0, "tasks": done})
+            else:
+                with contextlib.redirect_stdout(io.StringIO()):
+                    history.undo(self.user_settings)
+
+            for field, index in indexes.items():
+                # Kept up to date in place, never rebuilt
+                self.assertIs(lanes.lane_index(self.project, field), index)
+                self.assertEqual(ids(index), ids(lanes.LaneIndex(self.project, field)), field)
+
+        index = indexes["tag"]
+        for key in index.keys():
+            self.assertEqual(index.counts(key), [len(tasks) for tasks in ids(index)[key].values()])
+
+    def test_changes_made_elsewhere_rebuild_the_index(self):
+        index = lanes.lane_index(self.project, "priority")
+        task = self.project["tasks"][0]
+        # Changed without history.apply, such as by another kb daemon client
+        task["priority"] = "critical"
+        task["status"] = "todo"
+        self.project["revision"] += 1
+        rebuilt = lanes.lane_index(self.project, "priority")
+        self.assertIsNot(rebuilt, index)
+        self.assertIn(task["id"], rebuilt.lanes["critical"]["todo"])
+
+if __name__ == '__main__':
+    unittest.main()
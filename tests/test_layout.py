@@ -0,0 +1,136 @@
+"""
+kb - tests/test_layout.py
+author: narlock
+
+Checks that the terminal layout is measured once and reused until a
+resize, which repaints the waiting view, and that frames only switch
+style where it changes yet show every run in its own style.
+
+Usage: python3 -m pytest tests
+"""
+
+import os
+import random
+import re
+import sys
+import unittest
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "kb"))
+
+import ansi
+import layout
+
+SGR = re.compile("\033\\[([0-9;]*)m")
+
+def displayed(frame: str):
+    """
+    Returns (character, foreground, other SGR parameters) for every
+    character of a frame, as a terminal would show it.
+    """
+    characters = []
+    foreground, other = None, frozenset()
+    position = 0
+    for match in SGR.finditer(frame):
+        characters += [(char, foreground, other) for char in frame[position:match.start()]]
+        position = match.end()
+        for param in layout._sgr_params(match.group(0)):
+            if param == "0":
+                foreground, other = None, frozenset()
+            elif param[:1] in ("3", "9"):
+                foreground = param
+            else:
+                other = other | {param}
+    characters += [(char, foreground, other) for char in frame[position:]]
+    return characters
+
+def styled(style: str):
+    foreground = [param for param in layout._sgr_params(style) if param[:1] in ("3", "9")]
+    return (foreground[-1] if foreground else None, frozenset(param for param in layout._sgr_params(style) if param[:1] not in ("3", "9")))
+
+class LayoutCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.sizes = [os.terminal_size((120, 40))]
+        self.measured = 0
+        self.get_terminal_size = layout.shutil.get_terminal_size
+
+        def get_terminal_size(fallback=(80, 24)):
+            self.measured += 1
+            return self.sizes[-1]
+        layout.shutil.get_terminal_size = get_terminal_size
+        self.layout = layout.LAYOUT
+        self.layout.invalidate()
+
+    def tearDown(self):
+        layout.shutil.get_terminal_size = self.get_terminal_size
+        self.layout.invalidate()
+
+    def test_layout_is_reused_until_a_resize(self):
+        board = self.layout.board()
+        self.assertIs(self.layout.board(), board)
+        self.assertEqual(self.layout.size(), (120, 40))
+        self.assertEqual(self.measured, 1)
+        self.assertEqual(board.board_width, 120)
+        self.assertEqual(sum(len(text) for _style, text in board.top_border), 120)
+
+        self.sizes.append(os.terminal_size((60, 20)))
+        layout.handle_resize(None, None)
+        self.assertIsNot(self.layout.board(), board)
+        self.assertEqual(self.layout.board().board_width, 60)
+        self.assertEqual(self.measured, 2)
+
+    def test_resize_repaints_the_waiting_view(self):
+        painted = []
+        with layout.repaint_on_resize(lambda: painted.append(self.layout.size())):
+            self.sizes.append(os.terminal_size((90, 30)))
+            layout.handle_resize(None, None)
+        layout.handle_resize(None, None)
+        self.assertEqual(painted, [(90, 30)])
+        self.assertIsNone(self.layout.repaint)
+
+class RenderFrameTest(unittest.TestCase):
+
+    def test_styles_are_only_switched_where_they_change(self):
+        frame = layout.render_frame([
+            [(ansi.RED, "a"), (ansi.RED, "b"), (layout.DEFAULT_STYLE, " "), (ansi.RED, "c")],
+            [(ansi.RED, "d"), (ansi.GREEN, "e"), (layout.DEFAULT_STYLE, "f")],
+        ])
+        self.assertEqual(frame, f"{ansi.RED}ab c\r\nd{ansi.GREEN}e{ansi.RESET}f")
+        self.assertEqual(layout.render_frame([[(layout.DEFAULT_STYLE, "plain")]]), "plain")
+        self.assertTrue(layout.render_frame([[(ansi.BOLD, "x")]]).endswith(ansi.RESET))
+
+        # Spaces with a background are not blank
+        frame = layout.render_frame([[(ansi.RED, "a"), (ansi.BG_RED, "  "), (ansi.RED, "b")]])
+        self.assertEqual([(foreground, other) for _char, foreground, other in displayed(frame)],
+                         [styled(ansi.RED), styled(ansi.BG_RED), styled(ansi.BG_RED), styled(ansi.RED)])
+
+    def test_every_run_shows_in_its_style(self):
+        generator = random.Random(36)
+        styles = [layout.DEFAULT_STYLE, ansi.RED, ansi.GREEN, ansi.ORANGE, ansi.GREY, ansi.BOLD,
+                  ansi.RED + ansi.BOLD, ansi.ORANGE + ansi.BOLD, ansi.BG_BLUE, ansi.UNDERLINE]
+        for _ in range(200):
+            rows = [[(generator.choice(styles), generator.choice(["", " ", "  ", "ab", "c d", "│"]))
+                     for _ in range(generator.randrange(6))] for _ in range(3)]
+            frame = layout.render_frame(rows, line_end="\n")
+            expected = []
+            for index, row in enumerate(rows):
+                if index:
+                    expected.append(("\n", None))
+                expected += [(char, style) for style, text in row for char in text]
+            shown = displayed(frame)
+            self.assertEqual("".join(char for char, _foreground, _other in shown), "".join(char for char, _style in expected))
+            for (char, foreground, other), (_char, style) in zip(shown, expected):
+                if char == "\n":
+                    continue
+                if char == " ":
+                    # Only what changes how a space looks has to match
+                    other, want = other - {"1"}, styled(style)[1] - {"1"}
+                    self.assertEqual(other, want, repr(frame))
+                else:
+                    self.assertEqual((foreground, other), styled(style), repr(frame))
+            # Whatever is written after the frame is in the default style
+            self.assertEqual(displayed(frame + "x")[-1], ("x", None, frozenset()))
+
+if __name__ == '__main__':
+    unittest.main()
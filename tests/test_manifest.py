@@ -0,0 +1,129 @@
+"""
+kb - tests/test_manifest.py
+author: narlock
+
+Checks that the manifest is only trusted while it describes
+settings.json, that boards are loaded one at a time from the
+summaries, and that saving summarized settings copies the unopened
+boards without parsing them.
+
+Usage: python3 -m pytest tests
+"""
+
+import contextlib
+import io
+import os
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "kb"))
+
+import codec
+import history
+import manifest
+import settings
+import sparse
+
+def make_settings(codec_name: str):
+    projects = [
+        {"id": project_id, "title": f"board {project_id}", "nextTaskId": 2, "revision": 1,
+         "tasks": [sparse.new_task({"id": task_id, "title": f"Task {task_id}", "status": "todo"}) for task_id in range(2)]}
+        for project_id in range(3)
+    ]
+    return {"recentProjectTitle": "board 0", "nextProjectId": 3, "codec": codec_name, "projects": projects}
+
+class ManifestTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.settings_path = settings.SETTINGS_PATH
+        settings.SETTINGS_PATH = Path(self.directory.name) / "settings.json"
+        history._history = None
+
+    def tearDown(self):
+        settings.SETTINGS_PATH = self.settings_path
+        history._history = None
+        self.directory.cleanup()
+
+    def save(self, codec_name: str = codec.COMPACT_JSON):
+        settings.save_settings(make_settings(codec_name))
+
+    def test_manifest_is_stale_once_settings_change(self):
+        self.save()
+        self.assertIsNotNone(manifest.load())
+
+        # Same size, touched later
+        stat = os.stat(settings.SETTINGS_PATH)
+        os.utime(settings.SETTINGS_PATH, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1))
+        self.assertIsNone(manifest.load())
+
+        # Same modification time, another size
+        self.save()
+        stat = os.stat(settings.SETTINGS_PATH)
+        with open(settings.SETTINGS_PATH, 'ab') as f:
+            f.write(b"\n")
+        os.utime(settings.SETTINGS_PATH, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+        self.assertIsNone(manifest.load())
+
+        # A stale manifest is rebuilt from settings.json
+        with contextlib.redirect_stdout(io.StringIO()):
+            user_settings = settings.load_summary()
+        self.assertTrue(all("tasks" in project for project in user_settings["projects"]))
+        self.assertIsNotNone(manifest.load())
+
+    def test_boards_are_loaded_one_at_a_time(self):
+        self.save()
+        user_settings = settings.load_summary()
+        self.assertEqual([project["counts"] for project in user_settings["projects"]], [{"todo": 2}] * 3)
+        self.assertFalse(any("tasks" in project for project in user_settings["projects"]))
+
+        settings.load_projects(user_settings, [1])
+        self.assertEqual(["tasks" in project for project in user_settings["projects"]], [False, True, False])
+        self.assertEqual(len(user_settings["projects"][1]["tasks"]), 2)
+
+        settings.load_projects(user_settings)
+        self.assertTrue(all("tasks" in project for project in user_settings["projects"]))
+
+    def test_saving_summaries_copies_unopened_boards(self):
+        for codec_name in codec.CODEC_NAMES:
+            with self.subTest(codec=codec_name):
+                self.save(codec_name)
+                user_settings = settings.load_summary()
+                # Board 0 was opened and changed
+                user_settings["projects"][0] = make_settings(codec_name)["projects"][0]
+                user_settings["projects"][0]["tasks"][0]["title"] = "Changed"
+                user_settings["recentProjectTitle"] = "board 2"
+
+                load_settings = settings.load_settings
+                settings.load_settings = lambda: self.fail("the unopened boards were parsed")
+                try:
+                    settings.save_settings(user_settings)
+                finally:
+                    settings.load_settings = load_settings
+
+                saved = settings.SETTINGS_PATH.read_bytes()
+                expected = make_settings(codec_name)
+                expected["projects"][0]["tasks"][0]["title"] = "Changed"
+                expected["recentProjectTitle"] = "board 2"
+                self.assertEqual(codec.decode(saved), codec.decode(codec.encode(expected, codec_name)))
+                # The copied boards can be copied again
+                self.assertIsNotNone(settings._unloaded_pieces(settings.load_summary(), codec_name))
+
+    def test_changed_boards_are_read_again(self):
+        self.save()
+        user_settings = settings.load_summary()
+        # Another kb saves a change to board 1 in the meantime
+        other = make_settings(codec.COMPACT_JSON)
+        other["projects"][1]["tasks"].pop()
+        other["projects"][1]["revision"] = 2
+        settings.save_settings(other)
+
+        self.assertIsNone(settings._unloaded_pieces(user_settings, codec.COMPACT_JSON))
+        settings.save_settings(user_settings)
+        tasks = [len(project["tasks"]) for project in codec.decode(settings.SETTINGS_PATH.read_bytes())["projects"]]
+        self.assertEqual(tasks, [2, 1, 2])
+
+if __name__ == '__main__':
+    unittest.main()
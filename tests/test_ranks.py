@@ -0,0 +1,104 @@
+"""
+kb - tests/test_ranks.py
+author: narlock
+
+Checks that ranking cards keeps every column in the order the moves
+asked for, that keys squeezed into one gap are respaced without
+changing that order, and that respacing is not an undo step.
+
+Usage: python3 -m pytest tests
+"""
+
+import contextlib
+import io
+import random
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "kb"))
+
+import history
+import ranks
+import settings
+import sparse
+
+class RankTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.settings_path = settings.SETTINGS_PATH
+        settings.SETTINGS_PATH = Path(self.directory.name) / "settings.json"
+        history._history = None
+        ranks.invalidate(0)
+        ranks.pending_rebalances()
+        self.random = random.Random(38)
+        tasks = [sparse.new_task({"id": task_id, "title": f"Task {task_id}", "status": "todo"}) for task_id in range(12)]
+        self.project = {"id": 0, "title": "board", "nextTaskId": 12, "tasks": tasks}
+        self.user_settings = {"undoDepth": 1000, "projects": [self.project]}
+        # Unranked tasks keep their creation order
+        self.order = list(range(12))
+
+    def tearDown(self):
+        ranks.invalidate(0)
+        ranks.pending_rebalances()
+        settings.SETTINGS_PATH = self.settings_path
+        history._history = None
+        self.directory.cleanup()
+
+    def rank(self, task_id, position, other_id=None):
+        with contextlib.redirect_stdout(io.StringIO()):
+            self.assertIsNone(settings.rank_kanban_task(self.user_settings, "board", task_id, position, other_id))
+        self.order.remove(task_id)
+        if position == "top":
+            self.order.insert(0, task_id)
+        elif position == "bottom":
+            self.order.append(task_id)
+        else:
+            self.order.insert(self.order.index(other_id) + (position == "after"), task_id)
+
+    def assert_order(self):
+        self.assertEqual(ranks.column_index(self.project).ids("todo"), self.order)
+        self.assertEqual([task["id"] for task in sorted(self.project["tasks"], key=ranks.rank_of)], self.order)
+
+    def test_keys_between_sort_between(self):
+        for _ in range(2000):
+            # Generated keys never end in the zero digit
+            a, b = sorted("".join(self.random.choice(ranks.DIGITS[1:]) for _ in range(self.random.randrange(1, 5))) for _ in range(2))
+            if a == b:
+                continue
+            key = ranks.key_between(a, b)
+            self.assertTrue(a < key < b, (a, key, b))
+            self.assertNotEqual(key[-1], ranks.DIGITS[0])
+        self.assertLess(ranks.key_between(None, "1"), "1")
+        self.assertGreater(ranks.key_between("z", None), "z")
+
+    def test_random_moves_keep_the_asked_order(self):
+        for _ in range(300):
+            task_id = self.random.choice(self.order)
+            position = self.random.choice(settings.RANK_POSITIONS)
+            other_id = self.random.choice([other for other in self.order if other != task_id])
+            self.rank(task_id, position, other_id if position in ("before", "after") else None)
+            self.assert_order()
+
+    def test_a_crowded_gap_is_respaced_in_order(self):
+        # Every move lands between the top card and the last card moved
+        for _ in range(60):
+            self.rank(self.order[-1], "after", self.order[0])
+        self.assert_order()
+        longest = max(len(ranks.rank_of(task)) for task in self.project["tasks"])
+        self.assertGreater(longest, ranks.MAX_RANK_LENGTH)
+        self.assertTrue(ranks.rebalance_due())
+
+        undo = list(history.load_history()["undo"])
+        with contextlib.redirect_stdout(io.StringIO()):
+            for project_id, status in ranks.pending_rebalances():
+                self.assertIsNone(settings.rebalance_ranks(self.user_settings, project_id, status))
+        self.assert_order()
+        self.assertLessEqual(max(len(ranks.rank_of(task)) for task in self.project["tasks"]), 2)
+        self.assertFalse(ranks.rebalance_due())
+        self.assertEqual(history.load_history()["undo"], undo)
+
+if __name__ == '__main__':
+    unittest.main()
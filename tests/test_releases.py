@@ -0,0 +1,91 @@
+"""
+kb - tests/test_releases.py
+author: narlock
+
+Checks that the release rollups kept up to date task change by task
+change match a recount of the project after moves, edits, deletes,
+archiving, and undo.
+
+Usage: python3 -m pytest tests
+"""
+
+import contextlib
+import copy
+import io
+import random
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "kb"))
+
+import archive
+import history
+import releases
+import settings
+import sparse
+
+def without_burndown(rollups):
+    return {version: {k: v for k, v in release.items() if k != "burndown"} for version, release in rollups.items()}
+
+class RollupTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.settings_path = settings.SETTINGS_PATH
+        settings.SETTINGS_PATH = Path(self.directory.name) / "settings.json"
+        history._history = None
+        self.random = random.Random(29)
+        tasks = [
+            sparse.new_task({"id": task_id, "title": f"Task {task_id}", "status": "todo",
+                             "fixVersion": self.random.choice(["", "v1", "v2"]), "effort": task_id % 5,
+                             "checklistItems": [{"name": "item", "completed": task_id % 2 == 0}]})
+            for task_id in range(20)
+        ]
+        self.project = {"id": 0, "title": "board", "nextTaskId": 20, "tasks": tasks}
+        self.user_settings = {"undoDepth": 100, "projects": [self.project]}
+        releases.ensure(self.project)
+
+    def tearDown(self):
+        settings.SETTINGS_PATH = self.settings_path
+        history._history = None
+        self.directory.cleanup()
+
+    def recount(self):
+        reader = archive.ArchiveReader(0)
+        reader.load_all()
+        return without_burndown(releases.rebuild(copy.deepcopy(self.project), reader.tasks))
+
+    def update(self, task, **after):
+        before = {field: copy.deepcopy(sparse.field(task, field)) for field in after}
+        history.perform(self.user_settings, {"op": "update", "project": 0, "task": task["id"], "before": before, "after": after})
+
+    def test_rollups_match_a_recount(self):
+        for _ in range(200):
+            task = self.random.choice(self.project["tasks"])
+            choice = self.random.random()
+            if choice < 0.5:
+                self.update(task, status=self.random.choice(settings.TASK_STATUS_TYPE_OPTIONS))
+            elif choice < 0.7:
+                self.update(task, fixVersion=self.random.choice(["", "v1", "v2", "v3"]), effort=self.random.randrange(8))
+            elif choice < 0.8:
+                checklist = [{"name": "item", "completed": self.random.random() < 0.5} for _ in range(self.random.randrange(3))]
+                self.update(task, checklistItems=checklist)
+            elif choice < 0.9 and len(self.project["tasks"]) > 5:
+                index = self.project["tasks"].index(task)
+                history.perform(self.user_settings, {"op": "remove", "project": 0, "index": index, "task": copy.deepcopy(task)})
+            else:
+                with contextlib.redirect_stdout(io.StringIO()):
+                    history.undo(self.user_settings)
+        self.assertEqual(without_burndown(self.project["releases"]), self.recount())
+
+        with contextlib.redirect_stdout(io.StringIO()):
+            for task in self.project["tasks"][:3]:
+                self.update(task, status="done")
+            settings.archive_completed_kanban_tasks(self.user_settings, "board")
+        self.assertEqual(without_burndown(self.project["releases"]), self.recount())
+        self.assertIn("archived", {status for release in self.project["releases"].values() for status in release["statusCounts"]})
+
+if __name__ == '__main__':
+    unittest.main()
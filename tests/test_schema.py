@@ -0,0 +1,76 @@
+"""
+kb - tests/test_schema.py
+author: narlock
+
+Checks that looking a project up leaves it as it was loaded, and that
+opening a board upgrades it or reports why it could not.
+
+Usage: python3 -m pytest tests
+"""
+
+import contextlib
+import io
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "kb"))
+
+import archive
+import history
+import schema
+import settings
+
+class UpgradeTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.settings_path = settings.SETTINGS_PATH
+        settings.SETTINGS_PATH = Path(self.directory.name) / "settings.json"
+        history._history = None
+        schema._quarantined.clear()
+        # A project from before versioning, with an archived task still on the board
+        tasks = [{"id": 0, "title": "Open", "status": "todo"}, {"id": 1, "title": "Old", "status": "archived"}]
+        self.user_settings = {"projects": [{"id": 0, "title": "board", "tasks": tasks}]}
+
+    def tearDown(self):
+        settings.SETTINGS_PATH = self.settings_path
+        history._history = None
+        schema._quarantined.clear()
+        self.directory.cleanup()
+
+    def test_lookups_do_not_upgrade(self):
+        project = settings.get_project_by_title(self.user_settings, "board")
+        self.assertIs(settings.get_project_by_id(self.user_settings, 0), project)
+        self.assertEqual(schema.version_of(project), schema.UNVERSIONED)
+        self.assertEqual(len(project["tasks"]), 2)
+        self.assertFalse(archive.has_archive(0))
+
+    def test_opening_a_board_upgrades_it(self):
+        self.assertIsNone(settings.upgrade_project(self.user_settings, "board"))
+        project = settings.get_project_by_title(self.user_settings, "board")
+        self.assertEqual(schema.version_of(project), schema.SCHEMA_VERSION)
+        self.assertEqual([task["id"] for task in project["tasks"]], [0])
+        self.assertEqual(archive.ArchiveReader(0).get(1)["title"], "Old")
+
+    def test_a_fresh_install_starts_at_the_current_version(self):
+        with contextlib.redirect_stdout(io.StringIO()):
+            settings.write_initial_settings()
+        project = settings.load_settings()["projects"][0]
+        self.assertEqual(schema.version_of(project), schema.SCHEMA_VERSION)
+        self.assertFalse(schema.needs_upgrade(project))
+
+    def test_a_failed_upgrade_is_reported_each_time(self):
+        original = schema.MIGRATIONS[2]
+        schema.MIGRATIONS[2] = lambda project: 1 / 0
+        try:
+            error = settings.upgrade_project(self.user_settings, "board")
+        finally:
+            schema.MIGRATIONS[2] = original
+        self.assertIn("Could not upgrade project 'board'", error)
+        self.assertEqual(settings.upgrade_project(self.user_settings, "board"), error)
+        self.assertEqual(schema.version_of(self.user_settings["projects"][0]), schema.UNVERSIONED)
+
+if __name__ == '__main__':
+    unittest.main()
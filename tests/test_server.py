@@ -0,0 +1,97 @@
+"""
+kb - tests/test_server.py
+author: narlock
+
+Checks that settings functions called while attached are forwarded
+to a kb daemon over a real socket, that the daemon saves without
+printing, and that a failed save comes back to the client as an error.
+
+Usage: python3 -m pytest tests
+"""
+
+import copy
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import unittest
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "kb"))
+
+import client
+import history
+import server
+import settings
+import sparse
+
+# Runs the daemon in its own process, as `kb serve` would
+DAEMON = """
+import sys
+sys.path.insert(0, sys.argv[1])
+from pathlib import Path
+import server
+import settings
+settings.SETTINGS_PATH = Path(sys.argv[2])
+server.create_server(settings.load_settings(), sys.argv[3]).serve_forever()
+"""
+
+class RemoteForwardTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.settings_path = settings.SETTINGS_PATH
+        settings.SETTINGS_PATH = Path(self.directory.name) / "settings.json"
+        history._history = None
+        tasks = [sparse.new_task({"id": task_id, "title": f"Task {task_id}", "status": "todo"}) for task_id in range(3)]
+        daemon_settings = {"undoDepth": 100, "nextProjectId": 1,
+                           "projects": [{"id": 0, "title": "board", "nextTaskId": 3, "tasks": tasks}]}
+        settings.save_settings(daemon_settings)
+
+        self.socket_path = Path(self.directory.name) / "kb.sock"
+        self.daemon = subprocess.Popen(
+            [sys.executable, "-c", DAEMON, str(Path(server.__file__).parent), str(settings.SETTINGS_PATH), str(self.socket_path)],
+            stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+        deadline = time.monotonic() + 10
+        while not server.daemon_running(self.socket_path):
+            self.assertLess(time.monotonic(), deadline, "The daemon did not start")
+            time.sleep(0.02)
+        client.ATTACHED = client.Client(self.socket_path)
+        self.user_settings = client.ATTACHED.call("load")
+
+    def tearDown(self):
+        client.ATTACHED.close()
+        client.ATTACHED = None
+        self.daemon.terminate()
+        self.output, _errors = self.daemon.communicate()
+        settings.SETTINGS_PATH = self.settings_path
+        history._history = None
+        self.directory.cleanup()
+        # The daemon answers its clients and never prints on a write
+        self.assertEqual(self.output, "")
+
+    def test_calls_are_forwarded_and_merged(self):
+        self.assertIsNone(settings.move_kanban_item_by_id(self.user_settings, "board", 1, "doing"))
+
+        # The daemon made the change and saved it, and the local copy caught up
+        self.assertEqual(settings.get_kanban_task_by_id(self.user_settings, "board", 1)["status"], "doing")
+        self.assertEqual(client.ATTACHED.call("get", {"project": "board", "id": 1})["status"], "doing")
+        with open(settings.SETTINGS_PATH) as f:
+            saved = {task["id"]: task for task in json.load(f)["projects"][0]["tasks"]}
+        self.assertEqual(saved[1]["status"], "doing")
+
+    def test_failed_saves_are_reported_to_the_client(self):
+        before = copy.deepcopy(self.user_settings)
+        # settings.json can no longer be replaced
+        os.unlink(settings.SETTINGS_PATH)
+        os.mkdir(settings.SETTINGS_PATH)
+
+        with self.assertRaises(client.RemoteError) as raised:
+            settings.move_kanban_item_by_id(self.user_settings, "board", 1, "doing")
+        self.assertEqual(raised.exception.code, server.REQUEST_FAILED)
+        self.assertEqual(self.user_settings, before)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,81 @@
+"""
+kb - tests/test_snapshots.py
+author: narlock
+
+Checks that restoring a snapshot sets aside the archive segments
+written after it, and that restoring is refused while syncing.
+
+Usage: python3 -m pytest tests
+"""
+
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "kb"))
+
+import archive
+import history
+import settings
+import snapshots
+import sparse
+
+class RestoreTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.settings_path = settings.SETTINGS_PATH
+        settings.SETTINGS_PATH = Path(self.directory.name) / "settings.json"
+        history._history = None
+        tasks = [sparse.new_task({"id": task_id, "title": f"Task {task_id}", "status": "done"}) for task_id in range(3)]
+        self.user_settings = {"recentProjectTitle": "board", "nextProjectId": 1,
+                              "projects": [{"id": 0, "title": "board", "nextTaskId": 3, "tasks": tasks}]}
+
+    def tearDown(self):
+        settings.SETTINGS_PATH = self.settings_path
+        history._history = None
+        self.directory.cleanup()
+
+    def archive_and_snapshot(self, task_id: int):
+        project = self.user_settings["projects"][0]
+        index, task = next((i, t) for i, t in enumerate(project["tasks"]) if t["id"] == task_id)
+        history.apply(self.user_settings, {"op": "archive", "project": 0, "tasks": [[index, task]]})
+        settings.save_settings(self.user_settings)
+        return snapshots.take(settings.SETTINGS_PATH.read_bytes())["id"]
+
+    def boards(self):
+        board = [task["id"] for task in settings.load_settings()["projects"][0]["tasks"]]
+        reader = archive.ArchiveReader(0)
+        reader.load_all()
+        return sorted(board), sorted(task["id"] for task in reader.tasks)
+
+    def test_restore_sets_later_segments_aside(self):
+        first = self.archive_and_snapshot(1)
+        self.archive_and_snapshot(2)
+        self.assertEqual(self.boards(), ([0], [1, 2]))
+
+        self.assertIsNone(snapshots.restore(first))
+        self.assertEqual(self.boards(), ([0, 2], [1]))
+
+        # The restore snapshotted the boards it replaced, which bring the segment back
+        self.assertIsNone(snapshots.restore(snapshots.list_snapshots()[-1]["id"]))
+        self.assertEqual(self.boards(), ([0], [1, 2]))
+
+    def test_segment_numbers_are_not_reused_after_a_restore(self):
+        first = self.archive_and_snapshot(1)
+        self.archive_and_snapshot(2)
+        self.assertIsNone(snapshots.restore(first))
+        self.user_settings = settings.load_settings()
+        self.archive_and_snapshot(0)
+        self.assertEqual(self.user_settings["projects"][0]["archiveSegments"], [[1, 1], [3, 3]])
+        self.assertEqual(self.boards(), ([2], [0, 1]))
+
+    def test_restore_is_refused_while_syncing(self):
+        first = self.archive_and_snapshot(1)
+        self.user_settings["syncDir"] = self.directory.name
+        settings.save_settings(self.user_settings)
+        self.assertIn("syncDir", snapshots.restore(first))
+
+if __name__ == '__main__':
+    unittest.main()
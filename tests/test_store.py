@@ -0,0 +1,140 @@
+"""
+kb - tests/test_store.py
+author: narlock
+
+Checks that a failed batch publishes and saves nothing, that views
+are never changed by later batches and never wait for one, even on
+the batch's own thread, while readers and a writer run together.
+
+Usage: python3 -m pytest tests
+"""
+
+import sys
+import tempfile
+import threading
+import unittest
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "kb"))
+
+import history
+import settings
+import sparse
+import store
+
+class StoreTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.settings_path = settings.SETTINGS_PATH
+        settings.SETTINGS_PATH = Path(self.directory.name) / "settings.json"
+        history._history = None
+        tasks = [sparse.new_task({"id": task_id, "title": "0", "status": "todo"}) for task_id in range(2)]
+        settings.save_settings({"undoDepth": 100, "nextProjectId": 1,
+                                "projects": [{"id": 0, "title": "board", "nextTaskId": 2, "tasks": tasks}]})
+        self.store = store.Store()
+
+    def tearDown(self):
+        settings.SETTINGS_PATH = self.settings_path
+        history._history = None
+        self.directory.cleanup()
+
+    def saved(self):
+        return settings.SETTINGS_PATH.read_bytes()
+
+    def test_a_failed_batch_publishes_nothing(self):
+        saved = self.saved()
+        with self.assertRaises(RuntimeError):
+            with self.store.batch() as batch:
+                batch.move_task("board", 0, "doing")
+                batch.create_task("board", {"title": "new"})
+                self.assertEqual(batch.task("board", 0)["status"], "doing")
+                raise RuntimeError("stop")
+        view = self.store.view()
+        self.assertEqual([task["status"] for task in view.tasks("board")], ["todo", "todo"])
+        self.assertEqual(self.saved(), saved)
+        self.assertIsNone(history._history)
+
+        save_settings = settings.save_settings
+
+        def failing_save(user_settings, drop_damaged=False):
+            raise OSError("disk full")
+        settings.save_settings = failing_save
+        try:
+            with self.assertRaises(store.StoreError):
+                self.store.move_task("board", 1, "doing")
+        finally:
+            settings.save_settings = save_settings
+        self.assertEqual(self.store.view().task("board", 1)["status"], "todo")
+        self.assertEqual(self.saved(), saved)
+
+    def test_views_are_consistent_under_concurrent_batches(self):
+        first = self.store.view()
+        errors = []
+        done = threading.Event()
+
+        def write():
+            try:
+                for count in range(1, 31):
+                    with self.store.batch() as batch:
+                        # Both titles change together or not at all
+                        batch.edit_task("board", 0, {"title": str(count)})
+                        batch.edit_task("board", 1, {"title": str(count)})
+            finally:
+                done.set()
+
+        def read():
+            while not done.is_set():
+                view = self.store.view()
+                titles = [task["title"] for task in view.tasks("board")]
+                again = [task["title"] for task in view.tasks("board")]
+                if titles[0] != titles[1] or titles != again:
+                    errors.append(titles)
+
+        threads = [threading.Thread(target=read) for _ in range(4)] + [threading.Thread(target=write)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+        self.assertEqual([task["title"] for task in first.tasks("board")], ["0", "0"])
+        self.assertEqual([task["title"] for task in self.store.view().tasks("board")], ["30", "30"])
+
+    def test_views_never_wait_for_a_batch(self):
+        # Another process saves settings.json while a batch runs on this thread
+        with self.store.batch() as batch:
+            batch.move_task("board", 0, "doing")
+            user_settings = settings.load_settings()
+            user_settings["recentProjectTitle"] = "board"
+            settings.save_settings(user_settings)
+            self.assertIsNone(self.store.view().setting("recentProjectTitle"))
+
+        # Nor while the batch is saving on another
+        saving = threading.Event()
+        release = threading.Event()
+        save_settings = settings.save_settings
+
+        def slow_save(user_settings, drop_damaged=False):
+            save_settings(user_settings, drop_damaged)
+            saving.set()
+            release.wait(5)
+        settings.save_settings = slow_save
+        try:
+            writer = threading.Thread(target=self.store.move_task, args=("board", 1, "doing"))
+            writer.start()
+            self.assertTrue(saving.wait(5))
+            views = []
+            reader = threading.Thread(target=lambda: views.append(self.store.view()))
+            reader.start()
+            reader.join(5)
+            self.assertEqual(len(views), 1)
+            self.assertEqual(views[0].task("board", 1)["status"], "todo")
+            release.set()
+            writer.join()
+        finally:
+            release.set()
+            settings.save_settings = save_settings
+        self.assertEqual(self.store.view().task("board", 1)["status"], "doing")
+
+if __name__ == '__main__':
+    unittest.main()
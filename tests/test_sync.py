@@ -0,0 +1,116 @@
+"""
+kb - tests/test_sync.py
+author: narlock
+
+Checks that two replicas syncing through one directory show the same
+board after concurrent edits, moves, and deletes.
+
+Usage: python3 -m pytest tests
+"""
+
+import copy
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "kb"))
+
+import history
+import settings
+import sparse
+import sync
+
+def make_settings(project_id: int, tasks):
+    return {
+        "recentProjectTitle": "board", "nextProjectId": project_id + 1, "undoDepth": 100,
+        "projects": [{"id": project_id, "title": "board", "nextTaskId": len(tasks), "tasks": tasks}],
+    }
+
+def board(user_settings):
+    """
+    The board's tasks by uid, without the fields local to one replica.
+    """
+    project = user_settings["projects"][0]
+    return {
+        sync.task_uid(project, task): {k: v for k, v in sparse.expand(task).items() if k not in sync.LOCAL_FIELDS}
+        for task in project["tasks"]
+    }
+
+class ConvergenceTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        root = Path(self.directory.name)
+        self.settings_path = settings.SETTINGS_PATH
+        settings.SETTINGS_PATH = root / "kb" / "settings.json"
+        settings.SETTINGS_PATH.parent.mkdir()
+        history._history = None
+
+        tasks = [
+            sparse.new_task({"id": task_id, "title": f"Task {task_id}", "status": "todo"})
+            for task_id in range(3)
+        ]
+        # Each replica's board gets its own project id, so their indexes never mix
+        self.a = make_settings(0, tasks)
+        self.b = make_settings(1, [])
+        sync.attach(self.a, sync.Replica(root / "a.json"))
+        sync.attach(self.b, sync.Replica(root / "b.json"))
+        shared = str(root / "shared")
+        self.assertIsNone(sync.enable(self.a, shared))
+        self.assertIsNone(sync.enable(self.b, shared))
+
+    def tearDown(self):
+        settings.SETTINGS_PATH = self.settings_path
+        history._history = None
+        self.directory.cleanup()
+
+    def update(self, user_settings, task_title: str, **after):
+        project = user_settings["projects"][0]
+        task = next(t for t in project["tasks"] if t["title"] == task_title)
+        before = {field: copy.deepcopy(sparse.field(task, field)) for field in after}
+        history.perform(user_settings, {"op": "update", "project": project["id"], "task": task["id"], "before": before, "after": after})
+
+    def delete(self, user_settings, title: str):
+        project = user_settings["projects"][0]
+        index, task = next((i, t) for i, t in enumerate(project["tasks"]) if t["title"] == title)
+        history.perform(user_settings, {"op": "remove", "project": project["id"], "index": index, "task": task})
+
+    def pull_both(self):
+        for _ in range(2):
+            sync.pull(self.a)
+            sync.pull(self.b)
+
+    def test_replicas_start_alike(self):
+        self.assertEqual(len(board(self.b)), 3)
+        self.assertEqual(board(self.a), board(self.b))
+
+    def test_concurrent_edit_move_and_delete_converge(self):
+        # Both edit one task, and each moves a task the other deletes
+        self.update(self.a, "Task 0", title="From a", tags=["a"])
+        self.update(self.b, "Task 0", title="From b", tags=["b"])
+        self.update(self.a, "Task 1", status="doing")
+        self.delete(self.b, "Task 1")
+        self.update(self.b, "Task 2", status="done")
+        self.delete(self.a, "Task 2")
+        self.pull_both()
+
+        self.assertEqual(board(self.a), board(self.b))
+        tasks = list(board(self.a).values())
+        self.assertEqual(len(tasks), 1)
+        self.assertIn(tasks[0]["title"], ("From a", "From b"))
+        self.assertEqual(sorted(tasks[0]["tags"]), ["a", "b"])
+
+    def test_concurrent_moves_converge(self):
+        self.update(self.a, "Task 0", status="doing")
+        self.update(self.b, "Task 0", status="done")
+        self.update(self.b, "Task 1", status="backlog")
+        self.pull_both()
+
+        self.assertEqual(board(self.a), board(self.b))
+        statuses = {task["title"]: task["status"] for task in board(self.a).values()}
+        self.assertIn(statuses["Task 0"], ("doing", "done"))
+        self.assertEqual(statuses["Task 1"], "backlog")
+
+if __name__ == '__main__':
+    unittest.main()
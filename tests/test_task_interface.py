@@ -0,0 +1,109 @@
+"""
+kb - tests/test_task_interface.py
+author: narlock
+
+Checks that the task view wraps text a line at a time, that its rows
+are only produced as far as they are shown, and that a long field is
+not read from the blob store before the rows above it were shown.
+
+Usage: python3 -m pytest tests
+"""
+
+import itertools
+import random
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "kb"))
+
+import blobs
+import history
+import settings
+import sparse
+import task_interface
+
+class WrapTest(unittest.TestCase):
+
+    def test_lines_fit_and_break_at_spaces(self):
+        generator = random.Random(47)
+        words = ["kb", "board", "release", "a", "description", "of", "the", "task"]
+        paragraphs = [" ".join(generator.choice(words) for _ in range(generator.randrange(0, 40))) for _ in range(20)]
+        text = "\n".join(paragraphs)
+        for width in (11, 20, 80):
+            lines = list(task_interface.wrap_lazily(text, width))
+            self.assertTrue(all(len(line) <= width for line in lines))
+            # Every word fits, so each paragraph's lines rejoin at the spaces they broke at
+            expected = []
+            for paragraph in paragraphs:
+                wrapped = list(task_interface.wrap_lazily(paragraph, width))
+                self.assertEqual(" ".join(wrapped), paragraph)
+                expected.extend(wrapped)
+            self.assertEqual(lines, expected)
+
+    def test_long_words_are_cut(self):
+        self.assertEqual(list(task_interface.wrap_lazily("abcdefghij xy", 4)), ["abcd", "efgh", "ij", "xy"])
+        self.assertEqual(list(task_interface.wrap_lazily("a\n\nb", 4)), ["a", "", "b"])
+
+    def test_only_the_lines_asked_for_are_found(self):
+        text = "word " * 1_000_000
+        lines = list(itertools.islice(task_interface.wrap_lazily(text, 20), 3))
+        self.assertEqual(lines, ["word word word word"] * 3)
+
+class LazyRowsTest(unittest.TestCase):
+
+    def test_rows_are_pulled_as_far_as_shown(self):
+        pulled = []
+
+        def rows():
+            for index in range(10):
+                pulled.append(index)
+                yield [("", str(index))]
+        lazy = task_interface.LazyRows(rows())
+        self.assertEqual(lazy.page(2, 3), [[("", "2")], [("", "3")], [("", "4")]])
+        self.assertEqual(pulled, [0, 1, 2, 3, 4])
+        self.assertTrue(lazy.has(4))
+        self.assertEqual(pulled, [0, 1, 2, 3, 4])
+
+        self.assertEqual(len(lazy.page(8, 5)), 2)
+        self.assertFalse(lazy.has(10))
+        self.assertTrue(lazy.exhausted)
+
+class DetailBodyTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.settings_path = settings.SETTINGS_PATH
+        settings.SETTINGS_PATH = Path(self.directory.name) / "settings.json"
+        history._history = None
+        self.get = blobs.get
+        self.read = []
+        blobs.get = lambda ref: (self.read.append(ref["blob"]), self.get(ref))[1]
+
+    def tearDown(self):
+        blobs.get = self.get
+        settings.SETTINGS_PATH = self.settings_path
+        history._history = None
+        self.directory.cleanup()
+
+    def test_long_fields_are_read_when_reached(self):
+        description = blobs.put("description " * 500)
+        criteria = blobs.put("criteria " * 500)
+        task = sparse.new_task({"id": 0, "title": "Task", "description": description, "acceptanceCriteria": criteria})
+        project = {"id": 0, "title": "board", "tasks": [task]}
+
+        rows = task_interface.LazyRows(task_interface.detail_body(project, task, 40))
+        self.assertTrue(rows.has(0))
+        self.assertEqual(self.read, [])
+        self.assertEqual(rows.page(1, 1), [[(task_interface.layout.DEFAULT_STYLE, "description description description")]])
+        self.assertEqual(self.read, [description["blob"]])
+
+        # Reaching the next section reads its blob
+        while rows.has(len(rows.pulled)) and self.read == [description["blob"]]:
+            pass
+        self.assertEqual(self.read, [description["blob"], criteria["blob"]])
+        self.assertEqual(rows.pulled[-1], [(task_interface.layout.DEFAULT_STYLE, "criteria criteria criteria criteria")])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,85 @@
+"""
+kb - tests/test_timeline.py
+author: narlock
+
+Checks that archived tasks stay on the timeline, whether the tree is
+kept up to date by history.apply or rebuilt from the archive.
+
+Usage: python3 -m pytest tests
+"""
+
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "kb"))
+
+import archive
+import history
+import settings
+import sparse
+import timeline
+
+class ArchivedSpansTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.settings_path = settings.SETTINGS_PATH
+        settings.SETTINGS_PATH = Path(self.directory.name) / "settings.json"
+        history._history = None
+        tasks = [
+            sparse.new_task({"id": task_id, "title": f"Task {task_id}", "status": "done",
+                             "startDate": f"2025-08-0{task_id + 1}", "completeDate": f"2025-08-1{task_id + 1}"})
+            for task_id in range(2)
+        ]
+        self.project = {"id": 0, "title": "board", "nextTaskId": 2, "tasks": tasks}
+        self.user_settings = {"projects": [self.project]}
+        timeline.invalidate(0)
+        self.august = (timeline.parse_day("2025-08-01"), timeline.parse_day("2025-08-31"))
+
+    def tearDown(self):
+        settings.SETTINGS_PATH = self.settings_path
+        history._history = None
+        timeline.invalidate(0)
+        self.directory.cleanup()
+
+    def statuses(self):
+        return {task["id"]: task["status"] for task in timeline.timeline_index(self.project).overlapping(*self.august)}
+
+    def archive(self, task_id: int):
+        index, task = next((i, t) for i, t in enumerate(self.project["tasks"]) if t["id"] == task_id)
+        history.apply(self.user_settings, {"op": "archive", "project": 0, "tasks": [[index, task]]})
+
+    def test_archived_tasks_stay_on_the_timeline(self):
+        self.assertEqual(self.statuses(), {0: "done", 1: "done"})
+        self.archive(0)
+        self.assertEqual(self.statuses(), {0: "archived", 1: "done"})
+        timeline.invalidate(0)
+        self.assertEqual(self.statuses(), {0: "archived", 1: "done"})
+
+    def test_only_new_segments_are_read(self):
+        self.archive(0)
+        timeline.invalidate(0)
+        self.statuses()
+        self.archive(1)
+        read = []
+        original = archive.read_segment
+        archive.read_segment = lambda path: read.append(path.name) or original(path)
+        try:
+            timeline.invalidate(0)
+            self.assertEqual(self.statuses(), {0: "archived", 1: "archived"})
+        finally:
+            archive.read_segment = original
+        self.assertEqual(read, [archive.list_segments(0)[-1].name])
+
+    def test_restored_tasks_leave_the_archived_spans(self):
+        self.archive(0)
+        task = archive.ArchiveReader(0).get(0)
+        history.apply(self.user_settings, {"op": "unarchive", "project": 0, "tasks": [[0, task]]})
+        self.assertEqual(timeline.archived_spans(0), {})
+        timeline.invalidate(0)
+        self.assertEqual(self.statuses(), {0: "done", 1: "done"})
+
+if __name__ == '__main__':
+    unittest.main()
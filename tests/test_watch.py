@@ -0,0 +1,88 @@
+"""
+kb - tests/test_watch.py
+author: narlock
+
+Checks that `kb watch` reuses the projects of unchanged binary frames
+when settings.json is saved again, and parses only the changed ones.
+
+Usage: python3 -m pytest tests
+"""
+
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "kb"))
+
+import codec
+import history
+import settings
+import sparse
+import watch
+
+class BoardLoaderTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.settings_path = settings.SETTINGS_PATH
+        settings.SETTINGS_PATH = Path(self.directory.name) / "settings.json"
+        history._history = None
+        projects = [
+            {"id": project_id, "title": f"board {project_id}", "nextTaskId": 1,
+             "tasks": [sparse.new_task({"id": 0, "title": "Task", "status": "todo"})]}
+            for project_id in range(3)
+        ]
+        self.user_settings = {"codec": codec.BINARY, "nextProjectId": 3, "projects": projects}
+        settings.save_settings(self.user_settings)
+        self.decode_payload = codec.decode_payload
+        self.parsed = 0
+
+        def decode_payload(version, payload):
+            self.parsed += 1
+            return self.decode_payload(version, payload)
+        codec.decode_payload = decode_payload
+
+    def tearDown(self):
+        codec.decode_payload = self.decode_payload
+        settings.SETTINGS_PATH = self.settings_path
+        history._history = None
+        self.directory.cleanup()
+
+    def test_unchanged_frames_are_reused(self):
+        loader = watch.BoardLoader("board 1")
+        first = loader.load()
+        self.assertEqual(first["tasks"][0]["status"], "todo")
+        self.assertEqual(self.parsed, 3)
+        others = [project for project in loader.frames.values() if project["id"] != 1]
+
+        # Saved again unchanged, nothing is parsed
+        settings.save_settings(self.user_settings)
+        self.assertIs(loader.load(), first)
+        self.assertEqual(self.parsed, 3)
+
+        # Only the changed board is parsed, the others are the same objects
+        self.user_settings["projects"][1]["tasks"][0]["status"] = "doing"
+        self.user_settings["projects"][1]["revision"] = 1
+        settings.save_settings(self.user_settings)
+        second = loader.load()
+        self.assertIsNot(second, first)
+        self.assertEqual(second["tasks"][0]["status"], "doing")
+        self.assertEqual(self.parsed, 4)
+        for project in others:
+            self.assertTrue(any(reused is project for reused in loader.frames.values()))
+
+        # Deleted boards are let go
+        del self.user_settings["projects"][2]
+        settings.save_settings(self.user_settings)
+        self.assertIs(loader.load(), second)
+        self.assertEqual(sorted(project["id"] for project in loader.frames.values()), [0, 1])
+
+    def test_missing_boards_and_json(self):
+        self.assertIsNone(watch.BoardLoader("missing").load())
+        self.user_settings["codec"] = codec.COMPACT_JSON
+        settings.save_settings(self.user_settings)
+        self.assertEqual(watch.BoardLoader("board 2").load()["id"], 2)
+
+if __name__ == '__main__':
+    unittest.main()